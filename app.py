@@ -1,204 +1,420 @@
-from flask import Flask, render_template, request, jsonify, Response
+from flask import Blueprint, Flask, current_app, render_template, request, jsonify, Response, stream_with_context, send_file
 import tempfile
+import hashlib
 import os
 import logging
+from typing import Optional
 from text_processor import TextProcessor
-from translation_manager import TranslationManager
+from translation_manager import TranslationCancelled
+from job_queue import JobQueue, FINISHED_STATES, COMPLETED, FAILED, CANCELLED
+from pipeline import ProcessingError, stream_chunks, result_version
+from metrics import METRICS, CONTENT_TYPE, span, tracing
+from config import AppConfig, load_config
+from worker import build_translation_manager
+from health import HealthMonitor, READY
 import json
+import uuid
+import queue
+import threading
 from werkzeug.utils import secure_filename
+from dataclasses import asdict
 from pathlib import Path
 
-# Configure logging
-logging.basicConfig(
-    level=logging.DEBUG,
-    format='%(levelname)s:%(name)s:%(message)s'
-)
 logger = logging.getLogger(__name__)
 
-# Initialize Flask app
-app = Flask(__name__)
+bp = Blueprint('translator', __name__)
 
-# Configure maximum file upload size (16MB)
-app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024
+class AppState:
+    """Services behind the routes, built lazily once per process
 
-# Ensure the uploads directory exists
-UPLOAD_FOLDER = Path('uploads')
-UPLOAD_FOLDER.mkdir(exist_ok=True)
-app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
+    Under a pre-forking server such as gunicorn --preload, anything built in
+    the parent (HTTP connection pools, the backend pool's health thread,
+    SQLite connections) must not be shared with the workers, so the
+    services are rebuilt the first time they are used in a new process.
+    Everything shared between workers lives in SQLite (WAL mode) or in
+    uniquely named files in the upload folder.
+    """
 
-# Initialize processors
-text_processor = TextProcessor(chunk_size=500)
-translation_manager = TranslationManager()
+    def __init__(self, config: AppConfig):
+        self.config = config
+        self._lock = threading.Lock()
+        self._pid = None
+
+    def ready(self) -> 'AppState':
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._build()
+                    self._pid = os.getpid()
+        return self
+
+    def _build(self):
+        config = self.config
+        self.translation_manager = build_translation_manager(config, config.stream_concurrency)
+        self.text_processor = TextProcessor(model=self.translation_manager.model, chunk_tokens=config.chunk_tokens,
+                                            skip_non_chinese_pages=config.skip_non_chinese_pages)
+        self.job_queue = JobQueue(config.jobs_db)
+        # Leaves request threads free for /status and job polling while documents stream
+        self.stream_slots = threading.BoundedSemaphore(config.stream_concurrency)
+        self.health = HealthMonitor(self.translation_manager.backend, interval=config.health_interval,
+                                    timeout=config.health_timeout, deep_interval=config.deep_health_interval,
+                                    deep_timeout=config.deep_health_timeout, queue_depth=self.queue_depth).start()
+        logger.info(f"Translation services ready in process {os.getpid()}")
+
+    def queue_depth(self) -> dict:
+        """Queued and running jobs, and chunks waiting on the model in this process"""
+        depth = self.job_queue.pending_counts()
+        depth['chunks_in_flight'] = int(sum(METRICS.values('chunk_queue_depth').values()))
+        return depth
+
+    def metric_samples(self):
+        if self._pid != os.getpid():
+            return []
+        return self.translation_manager.metric_samples()
+
+def services() -> AppState:
+    """The current app's services"""
+    return current_app.extensions['translator'].ready()
+
+def create_app(config: Optional[AppConfig] = None) -> Flask:
+    """Build the web app; settings come from load_config() unless config is given"""
+    config = config or load_config()
+    # No-op when the server (or the embedding application) already configured logging
+    logging.basicConfig(level=config.log_level.upper(), format='%(levelname)s:%(name)s:%(message)s')
+
+    app = Flask(__name__)
+    app.config['MAX_CONTENT_LENGTH'] = int(config.max_upload_mb * 1024 * 1024)
+    app.config['UPLOAD_FOLDER'] = Path(config.upload_folder)
+    app.config['UPLOAD_FOLDER'].mkdir(parents=True, exist_ok=True)
+
+    translator = AppState(config)
+    app.extensions['translator'] = translator
+    # Replaces the collector of any earlier app in this process, so series are not reported twice
+    METRICS.register_collector(translator.metric_samples, name='translator_app')
+    app.register_blueprint(bp)
+    return app
 
 def allowed_file(filename):
     """Check if the file extension is allowed"""
     return '.' in filename and filename.rsplit('.', 1)[1].lower() == 'pdf'
 
-@app.route('/')
+@bp.route('/')
 def index():
     """Render the main page"""
     return render_template('index.html')
 
-@app.route('/upload', methods=['POST'])
-def upload_file():
-    """Handle file upload and translation"""
-    logger.debug("Upload endpoint hit")
-    
+def query_flag(name):
+    """Whether a boolean query parameter such as ?trace=1 is set"""
+    return request.args.get(name, '').lower() in ('1', 'true', 'yes')
+
+def validate_upload():
+    """Return the uploaded file or raise ProcessingError if the request is invalid"""
     # Validate file presence
     if 'file' not in request.files:
         logger.error("No file part in request")
-        return jsonify({'error': 'No file provided'}), 400
+        raise ProcessingError('No file provided')
     
     file = request.files['file']
     
     # Validate filename
     if file.filename == '':
         logger.error("No file selected")
-        return jsonify({'error': 'No file selected'}), 400
+        raise ProcessingError('No file selected')
     
     # Validate file type
     if not allowed_file(file.filename):
         logger.error("Invalid file type")
-        return jsonify({'error': 'Please upload a PDF file'}), 400
+        raise ProcessingError('Please upload a PDF file')
+    
+    return file
+
+def save_upload(file):
+    """Save the uploaded file to a temporary PDF and return its path"""
+    filename = secure_filename(file.filename)
+    logger.debug(f"Processing file: {filename}")
+    
+    with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as temp_file, span('upload_save'):
+        logger.debug(f"Created temp file: {temp_file.name}")
+        file.save(temp_file)
+    return temp_file.name
+
+def save_hashed(file, path):
+    """Save an uploaded file to path and return its SHA-256, computed as the blocks are written"""
+    digest = hashlib.sha256()
+    with open(path, 'wb') as out:
+        for block in iter(lambda: file.stream.read(1 << 20), b''):
+            digest.update(block)
+            out.write(block)
+    return digest.hexdigest()
+
+def remove_temp_file(path):
+    """Delete a temporary upload, logging rather than raising on failure"""
+    try:
+        logger.debug(f"Cleaning up temp file: {path}")
+        os.unlink(path)
+    except Exception as e:
+        logger.error(f"Failed to clean up temporary file: {str(e)}")
+
+@bp.route('/upload', methods=['POST'])
+def upload_file():
+    """Accept a PDF upload and queue it for translation by a worker"""
+    logger.debug("Upload endpoint hit")
+    
+    try:
+        file = validate_upload()
+    except ProcessingError as e:
+        return jsonify(e.to_dict()), e.status
     
     try:
-        # Save uploaded file
+        job_queue = services().job_queue
         filename = secure_filename(file.filename)
-        logger.debug(f"Processing file: {filename}")
-        
-        # Create temporary file
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as temp_file:
-            logger.debug(f"Created temp file: {temp_file.name}")
-            file.save(temp_file.name)
-            
-            # Extract text from PDF
-            try:
-                logger.debug("Extracting text from PDF")
-                extracted_text = text_processor.extract_from_pdf(temp_file.name)
-                logger.debug(f"Extracted text length: {len(extracted_text)}")
-                
-                if not extracted_text.strip():
-                    raise ValueError("No text could be extracted from the PDF")
-                
-            except Exception as e:
-                logger.error(f"Text extraction failed: {str(e)}")
-                return jsonify({'error': f'Failed to extract text from PDF: {str(e)}'}), 400
-            
-            # Clean and validate text
-            try:
-                cleaned_text = text_processor.clean_text(extracted_text)
-                logger.debug(f"Cleaned text length: {len(cleaned_text)}")
-                
-                if not cleaned_text.strip():
-                    raise ValueError("Text was empty after cleaning")
-                
-                # Verify it's Chinese
-                if not text_processor.is_chinese(cleaned_text):
-                    logger.error("Text is not Chinese")
-                    return jsonify({
-                        'error': 'The uploaded file does not appear to contain Chinese text',
-                        'details': 'Please ensure the PDF contains Chinese text'
-                    }), 400
-                
-            except Exception as e:
-                logger.error(f"Text cleaning/validation failed: {str(e)}")
-                return jsonify({'error': f'Failed to process text: {str(e)}'}), 400
-            
-            # Create text chunks
-            try:
-                logger.debug("Creating text chunks")
-                chunks = text_processor.create_chunks(cleaned_text)
-                
-                if not chunks:
-                    logger.error("No chunks created from text")
-                    return jsonify({
-                        'error': 'Could not process the text into chunks',
-                        'details': 'The text might be too short or empty'
-                    }), 400
-                
-                logger.debug(f"Created {len(chunks)} chunks")
-                
-            except Exception as e:
-                logger.error(f"Chunking failed: {str(e)}")
-                return jsonify({'error': f'Failed to process text into chunks: {str(e)}'}), 500
-            
-            # Translate chunks
-            try:
-                logger.debug("Starting translation")
-                translated_chunks = translation_manager.translate_chunks(chunks)
-                
-                if not translated_chunks:
-                    raise ValueError("No translations were produced")
-                
-                logger.debug("Translation completed")
-                
-            except Exception as e:
-                logger.error(f"Translation failed: {str(e)}")
-                return jsonify({'error': f'Translation failed: {str(e)}'}), 500
-            
-            # Reassemble document
-            try:
-                logger.debug("Reassembling document")
-                result = translation_manager.reassemble_document(translated_chunks)
-                
-                if not result or not result.get('translated'):
-                    raise ValueError("Failed to reassemble translated document")
-                
-                logger.debug("Processing completed successfully")
-                return jsonify(result)
-                
-            except Exception as e:
-                logger.error(f"Document reassembly failed: {str(e)}")
-                return jsonify({'error': f'Failed to reassemble translated document: {str(e)}'}), 500
-            
+        job_id = uuid.uuid4().hex
+        file_path = upload_path(job_id)
+        with span('upload_save'):
+            file_hash = save_hashed(file, str(file_path))
+
+        # Traced uploads want fresh timings, and ?force=1 asks for a new translation
+        if query_flag('trace') or query_flag('force'):
+            job_queue.enqueue(str(file_path), filename, job_id=job_id, trace=query_flag('trace'),
+                              file_hash=file_hash)
+            logger.debug(f"Queued {filename} as job {job_id}")
+            return jsonify(job_response(job_queue.get(job_id))), 202
+
+        # Completed jobs are only reused if translated with the settings this app would queue under
+        version = result_version(services().text_processor, services().translation_manager)
+        existing_id, created = job_queue.enqueue_deduplicated(str(file_path), filename, file_hash, job_id=job_id,
+                                                              result_version=version)
+        if created:
+            logger.debug(f"Queued {filename} as job {job_id}")
+            return jsonify(job_response(job_queue.get(job_id))), 202
+
+        file_path.unlink(missing_ok=True)
+        job = job_response(job_queue.get(existing_id))
+        logger.info(f"Upload of {filename} matches {job['status']} job {existing_id}")
+        job['deduplicated'] = True
+        if job['status'] != COMPLETED:
+            return jsonify(job), 202
+        # The translation already exists: send the client straight to it
+        response = jsonify(job)
+        response.status_code = 303
+        response.headers['Location'] = job['result_url']
+        return response
     except Exception as e:
-        logger.error(f"Error processing file: {str(e)}", exc_info=True)
+        logger.error(f"Error queueing file: {str(e)}", exc_info=True)
         return jsonify({'error': f'Unexpected error: {str(e)}'}), 500
-        
-    finally:
-        # Clean up temporary file
-        if 'temp_file' in locals():
-            try:
-                logger.debug(f"Cleaning up temp file: {temp_file.name}")
-                os.unlink(temp_file.name)
-            except Exception as e:
-                logger.error(f"Failed to clean up temporary file: {str(e)}")
-
-@app.route('/status')
-def system_status():
-    """Check system readiness"""
-    try:
-        # Check if translation service is available
-        import ollama
-        response = ollama.list()
-        logger.debug("System status check: OK")
+
+def upload_path(job_id):
+    """Location of the uploaded PDF for a queued job"""
+    return current_app.config['UPLOAD_FOLDER'] / f"{job_id}.pdf"
+
+def job_response(job):
+    """Build the public JSON description of a job"""
+    job['status_url'] = f"/jobs/{job['job_id']}"
+    job['result_url'] = f"/jobs/{job['job_id']}/result"
+    return job
+
+@bp.route('/jobs/<job_id>')
+def job_status(job_id):
+    """Report a job's status and percent progress"""
+    job = services().job_queue.get(job_id)
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job_response(job))
+
+@bp.route('/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_job(job_id):
+    """Cancel a queued job or ask a running job to stop"""
+    job_queue = services().job_queue
+    status = job_queue.cancel(job_id)
+    if status is None:
+        return jsonify({'error': 'Job not found'}), 404
+    if status in (COMPLETED, FAILED):
+        return jsonify({'error': f'Job already {status}'}), 409
+    if status == CANCELLED:
+        # Cancelled before a worker picked it up, so nothing else will remove the upload
+        upload_path(job_id).unlink(missing_ok=True)
+    return jsonify(job_response(job_queue.get(job_id)))
+
+@bp.route('/jobs/<job_id>/result')
+def job_result(job_id):
+    """Return the translation of a completed job"""
+    job_queue = services().job_queue
+    job = job_queue.get(job_id)
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+    if job['status'] != COMPLETED:
+        payload = {'error': f"Job is {job['status']}", 'status': job['status']}
+        if job['error']:
+            payload['details'] = job['error']
+        return jsonify(payload), 409 if job['status'] in FINISHED_STATES else 202
+    # Workers in low-memory mode write results to disk; stream those instead of loading them
+    result_path = job_queue.get_result_path(job_id)
+    if result_path:
+        if not os.path.exists(result_path):
+            return jsonify({'error': 'Job result is no longer available'}), 410
+        return send_file(result_path, mimetype='application/json')
+    return jsonify(job_queue.get_result(job_id))
+
+def ndjson_event(event_type, **payload):
+    """Serialize one streaming event as a newline-delimited JSON line"""
+    payload['type'] = event_type
+    return json.dumps(payload, ensure_ascii=False) + '\n'
+
+@bp.route('/upload/stream', methods=['POST'])
+def upload_file_stream():
+    """Handle file upload and stream translated chunks as NDJSON as they finish
+
+    Pages are parsed, cleaned and chunked as a stream, so translation of the
+    first chunks starts while later pages are still being extracted. Emits
+    'page' events as pages are parsed, one 'chunk' event per translated
+    TextChunk, a 'chunked' stage once the chunk count is known, then a final
+    'complete' event with the document metadata. With ?tokens=1, 'token'
+    events carry the model's output for each chunk as it is generated; the
+    'chunk' event then replaces that partial text with the final,
+    post-processed translation. With ?trace=1, the 'complete' event carries
+    a per-stage timing trace of the request. Failures after streaming starts
+    arrive as an 'error' event, since the HTTP status has already been sent.
+    """
+    logger.debug("Streaming upload endpoint hit")
+    stream_tokens = query_flag('tokens')
+    translator = services()
+    text_processor = translator.text_processor
+    translation_manager = translator.translation_manager
+    
+    if not translator.stream_slots.acquire(blocking=False):
+        logger.warning("All streaming slots are busy, rejecting upload")
         return jsonify({
-            'status': 'ready',
-            'details': {
-                'translation_service': 'online',
-                'models_available': True
-            }
-        })
+            'error': 'Too many translations in progress',
+            'details': 'Please retry shortly, or use /upload to queue the document'
+        }), 503, {'Retry-After': '10'}
+    
+    try:
+        with tracing(query_flag('trace')) as trace:
+            file = validate_upload()
+            temp_path = save_upload(file)
+    except ProcessingError as e:
+        translator.stream_slots.release()
+        return jsonify(e.to_dict()), e.status
     except Exception as e:
-        logger.error(f"System status check failed: {str(e)}")
-        return jsonify({
-            'status': 'error',
-            'error': str(e),
-            'details': {
-                'translation_service': 'offline'
-            }
-        }), 503
-
-@app.errorhandler(413)
+        translator.stream_slots.release()
+        logger.error(f"Error saving file: {str(e)}", exc_info=True)
+        return jsonify({'error': f'Unexpected error: {str(e)}'}), 500
+    
+    # Translation runs on a producer thread so token events from the
+    # translation threads can be sent while chunks are still in flight
+    events = queue.Queue()
+    disconnected = threading.Event()
+    state = {'pages_done': 0, 'total_pages': 0, 'produced': 0, 'chunking_done': False}
+    
+    def on_page(number, total):
+        state['pages_done'], state['total_pages'] = number, total
+        events.put(ndjson_event('page', page=number, total_pages=total))
+    
+    def on_token(chunk, piece, restart):
+        payload = {'content': chunk.content} if restart else {}
+        events.put(ndjson_event('token', sequence_number=chunk.sequence_number,
+                                text=piece, restart=restart, **payload))
+    
+    def chunk_source():
+        for chunk in stream_chunks(text_processor, temp_path, on_page=on_page):
+            state['produced'] += 1
+            yield chunk
+        state['chunking_done'] = True
+        events.put(ndjson_event('stage', stage='chunked', total_chunks=state['produced']))
+    
+    def estimated_progress(completed):
+        # Until every page is chunked, scale by the share of pages parsed so far
+        progress = completed / state['produced'] * 100 if state['produced'] else 0
+        if not state['chunking_done'] and state['total_pages']:
+            progress *= state['pages_done'] / state['total_pages']
+        return progress
+    
+    def produce():
+        with tracing(trace is not None, trace):
+            translate_stream()
+    
+    def translate_stream():
+        try:
+            events.put(ndjson_event('stage', stage='extracting'))
+            completed = 0
+            successful = 0
+            for chunk in translation_manager.iter_translate_chunks(
+                    chunk_source(),
+                    cancel_check=disconnected.is_set,
+                    on_token=on_token if stream_tokens else None):
+                completed += 1
+                successful += chunk.is_translated
+                events.put(ndjson_event('chunk', chunk=asdict(chunk), progress=estimated_progress(completed)))
+            
+            logger.debug("Streaming translation completed")
+            payload = {'trace': trace.to_dict()} if trace else {}
+            events.put(ndjson_event('complete', metadata={
+                'total_chunks': state['produced'],
+                'successful_translations': successful
+            }, **payload))
+        except TranslationCancelled:
+            logger.info("Client disconnected, streaming translation stopped")
+        except ProcessingError as e:
+            events.put(ndjson_event('error', status=e.status, **e.to_dict()))
+        except Exception as e:
+            logger.error(f"Streaming translation failed: {str(e)}", exc_info=True)
+            events.put(ndjson_event('error', status=500, error=f'Unexpected error: {str(e)}'))
+        finally:
+            remove_temp_file(temp_path)
+            translator.stream_slots.release()
+            events.put(None)
+    
+    def generate():
+        while True:
+            event = events.get()
+            if event is None:
+                break
+            yield event
+    
+    # Started here rather than in generate(), which never runs if the client
+    # leaves before the first read, so the slot and temp file are always freed
+    threading.Thread(target=produce, name='stream-translation', daemon=True).start()
+    response = Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+    # Stops the producer at the next chunk boundary if the client went away
+    response.call_on_close(disconnected.set)
+    return response
+
+@bp.route('/metrics')
+def metrics():
+    """Stage timings, cache, queue and model throughput metrics in Prometheus text format"""
+    return Response(METRICS.render(), content_type=CONTENT_TYPE)
+
+@bp.route('/status')
+def system_status():
+    """Report readiness from the last background health check, without contacting the model server
+
+    With ?deep=1 the last deep check, which confirms the configured model
+    answers, must also have passed.
+    """
+    snapshot = services().health.snapshot(deep=query_flag('deep'))
+    ready = snapshot['status'] == READY
+    payload = {
+        'status': snapshot['status'],
+        'details': dict(
+            snapshot,
+            translation_service='online' if snapshot['online'] else 'offline',
+            models_available=snapshot['model_available'],
+        ),
+    }
+    if not ready:
+        payload['error'] = snapshot.get('error', 'Health checks have not completed yet')
+    return jsonify(payload), 200 if ready else 503
+
+@bp.app_errorhandler(413)
 def request_entity_too_large(error):
     """Handle file too large error"""
     logger.error("File too large error")
     return jsonify({
         'error': 'File too large',
-        'details': 'Maximum file size is 16MB'
+        'details': f"Maximum file size is {current_app.config['MAX_CONTENT_LENGTH'] // (1024 * 1024)}MB"
     }), 413
 
-@app.errorhandler(500)
+@bp.app_errorhandler(500)
 def internal_server_error(error):
     """Handle internal server errors"""
     logger.error(f"Internal server error: {str(error)}")
@@ -207,7 +423,7 @@ def internal_server_error(error):
         'details': 'An unexpected error occurred'
     }), 500
 
-@app.errorhandler(404)
+@bp.app_errorhandler(404)
 def not_found_error(error):
     """Handle 404 errors"""
     logger.error(f"Not found error: {str(error)}")
@@ -217,5 +433,6 @@ def not_found_error(error):
     }), 404
 
 if __name__ == '__main__':
+    # Development server; see wsgi.py for production
     logger.info("Starting application...")
-    app.run(debug=True, port=5000)
\ No newline at end of file
+    create_app().run(debug=True, port=5000)
\ No newline at end of file
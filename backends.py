@@ -0,0 +1,404 @@
+# backends.py
+from typing import List, Optional, Dict, Iterator
+import logging
+import os
+import random
+import threading
+import time
+import httpx
+import ollama
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL = 'qwen2.5:7b'
+
+# Response statuses worth retrying: overload and server-side failures
+RETRYABLE_STATUS = (408, 429, 500, 502, 503, 504)
+
+class BackendError(Exception):
+    """Raised when a backend request fails after all retries"""
+
+class TranslationBackend:
+    """Interface between TranslationManager and a model server"""
+
+    model = DEFAULT_MODEL
+    host = None
+
+    def chat(self, system_prompt: str, user_prompt: str) -> str:
+        """Send one system/user exchange and return the reply text"""
+        raise NotImplementedError
+
+    def stream_chat(self, system_prompt: str, user_prompt: str) -> Iterator[str]:
+        """Like chat(), but yield the reply in pieces as the model produces them
+
+        Backends without a token stream yield the whole reply at once.
+        """
+        yield self.chat(system_prompt, user_prompt)
+
+    def list_models(self, timeout: Optional[float] = None) -> List[str]:
+        """Names of the models the server has available; also serves as a health probe
+
+        With a timeout, a single attempt bounded by it is made, for health checks.
+        """
+        raise NotImplementedError
+
+    def loaded_models(self, timeout: float = 5.0) -> List[str]:
+        """Names of the models currently loaded in memory, i.e. warm"""
+        raise NotImplementedError
+
+    def warm_up(self, timeout: float = 60.0) -> float:
+        """Ask the model for a one-token reply, loading it if needed, and return the seconds taken"""
+        raise NotImplementedError
+
+    def close(self):
+        """Release connections held by the backend"""
+
+class OllamaBackend(TranslationBackend):
+    """Ollama chat backend on a pooled keep-alive HTTP client
+
+    One httpx connection pool is shared by every thread using the backend.
+    Connection errors, timeouts and retryable HTTP statuses are retried up
+    to `retries` times with exponential backoff and full jitter.
+    """
+
+    def __init__(self, host: Optional[str] = None, model: str = DEFAULT_MODEL,
+                 timeout: float = 300.0, connect_timeout: float = 5.0,
+                 retries: int = 2, backoff: float = 0.5, max_backoff: float = 10.0,
+                 max_connections: int = 16, options: Optional[Dict] = None):
+        self.model = model
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.options = options
+        self.host = (host or os.getenv('OLLAMA_HOST', 'http://127.0.0.1:11434')).rstrip('/')
+        self.client = ollama.Client(
+            self.host,
+            timeout=httpx.Timeout(timeout, connect=connect_timeout),
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+        )
+
+    def _is_retryable(self, error: Exception) -> bool:
+        if isinstance(error, httpx.TransportError):
+            return True
+        return isinstance(error, ollama.ResponseError) and error.status_code in RETRYABLE_STATUS
+
+    def _delay(self, attempt: int) -> float:
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+    def _call(self, description: str, request):
+        for attempt in range(self.retries + 1):
+            try:
+                return request()
+            except Exception as e:
+                if not self._is_retryable(e):
+                    raise BackendError(f"{description} failed on {self.host}: {str(e)}") from e
+                if attempt == self.retries:
+                    raise BackendError(
+                        f"{description} failed on {self.host} after {attempt + 1} attempts: {str(e)}"
+                    ) from e
+                delay = self._delay(attempt)
+                logger.warning(f"{description} on {self.host} failed ({str(e)}), retrying in {delay:.2f}s")
+                time.sleep(delay)
+
+    def _messages(self, system_prompt: str, user_prompt: str) -> List[Dict]:
+        return [
+            {'role': 'system', 'content': system_prompt},
+            {'role': 'user', 'content': user_prompt},
+        ]
+
+    def chat(self, system_prompt: str, user_prompt: str) -> str:
+        response = self._call('Chat request', lambda: self.client.chat(
+            model=self.model,
+            messages=self._messages(system_prompt, user_prompt),
+            options=self.options,
+        ))
+        return response['message']['content'].strip()
+
+    def stream_chat(self, system_prompt: str, user_prompt: str) -> Iterator[str]:
+        """Yield reply pieces as they arrive; retries only happen before the first piece"""
+        for attempt in range(self.retries + 1):
+            started = False
+            try:
+                for part in self.client.chat(model=self.model, messages=self._messages(system_prompt, user_prompt),
+                                             options=self.options, stream=True):
+                    piece = part['message']['content']
+                    if piece:
+                        started = True
+                        yield piece
+                return
+            except Exception as e:
+                if started or not self._is_retryable(e) or attempt == self.retries:
+                    raise BackendError(f"Streaming chat request failed on {self.host}: {str(e)}") from e
+                delay = self._delay(attempt)
+                logger.warning(f"Streaming chat request on {self.host} failed ({str(e)}), retrying in {delay:.2f}s")
+                time.sleep(delay)
+
+    def _probe(self, description: str, method: str, path: str, timeout: float, **kwargs) -> Dict:
+        """One request bounded by timeout, without retries, for health checks"""
+        try:
+            response = self.client._client.request(method, path, timeout=timeout, **kwargs)
+            response.raise_for_status()
+            return response.json()
+        except Exception as e:
+            raise BackendError(f"{description} failed on {self.host}: {str(e)}") from e
+
+    def list_models(self, timeout: Optional[float] = None) -> List[str]:
+        if timeout is not None:
+            response = self._probe('Model list request', 'GET', '/api/tags', timeout)
+        else:
+            response = self._call('Model list request', self.client.list)
+        return [model['name'] for model in response.get('models', [])]
+
+    def loaded_models(self, timeout: float = 5.0) -> List[str]:
+        response = self._probe('Running model request', 'GET', '/api/ps', timeout)
+        return [model['name'] for model in response.get('models', [])]
+
+    def warm_up(self, timeout: float = 60.0) -> float:
+        start = time.perf_counter()
+        self._probe('Warm-up request', 'POST', '/api/chat', timeout, json={
+            'model': self.model,
+            'messages': [{'role': 'user', 'content': 'ping'}],
+            'stream': False,
+            'options': {'num_predict': 1},
+        })
+        return time.perf_counter() - start
+
+    def close(self):
+        # ollama.Client has no close() of its own in 0.1.x
+        self.client._client.close()
+
+LEAST_OUTSTANDING = 'least_outstanding'
+LATENCY_WEIGHTED = 'latency'
+ROUTING_POLICIES = (LEAST_OUTSTANDING, LATENCY_WEIGHTED)
+
+class _HostState:
+    """Routing and health bookkeeping for one backend in a pool"""
+
+    def __init__(self, backend: TranslationBackend):
+        self.backend = backend
+        self.outstanding = 0
+        self.latency = None
+        self.consecutive_failures = 0
+        self.ejected_until = 0.0
+        self.requests = 0
+        self.failures = 0
+
+    def available(self, now: float) -> bool:
+        return self.ejected_until <= now
+
+class BackendPool(TranslationBackend):
+    """Spread requests over several backends serving the same model
+
+    Each request goes to the available host with the fewest requests in
+    flight ('least_outstanding') or the lowest in-flight count weighted by
+    its average reply time ('latency'). A host that fails failure_threshold
+    requests in a row, or fails a health check, is ejected for
+    eject_seconds. A failed request is retried on the other hosts before
+    the pool gives up. Health checks call list_models() on every host each
+    health_interval seconds from a background thread, each bounded by
+    health_timeout so one hung host cannot stall the checks of the others.
+    """
+
+    def __init__(self, backends: List[TranslationBackend], routing: str = LEAST_OUTSTANDING,
+                 failure_threshold: int = 3, eject_seconds: float = 30.0,
+                 health_interval: Optional[float] = 15.0, health_timeout: float = 5.0,
+                 latency_decay: float = 0.2):
+        if not backends:
+            raise ValueError("BackendPool needs at least one backend")
+        if routing not in ROUTING_POLICIES:
+            raise ValueError(f"Unknown routing policy {routing!r}, expected one of {ROUTING_POLICIES}")
+        models = {backend.model for backend in backends}
+        if len(models) > 1:
+            raise ValueError(f"All backends in a pool must serve the same model, got {sorted(models)}")
+
+        self.model = backends[0].model
+        self.host = ','.join(str(backend.host) for backend in backends)
+        self.routing = routing
+        self.failure_threshold = failure_threshold
+        self.eject_seconds = eject_seconds
+        self.health_timeout = health_timeout
+        self.latency_decay = latency_decay
+        self._hosts = [_HostState(backend) for backend in backends]
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._health_thread = None
+        if health_interval:
+            self._health_thread = threading.Thread(
+                target=self._health_loop, args=(health_interval,), name='backend-health', daemon=True
+            )
+            self._health_thread.start()
+
+    @classmethod
+    def from_hosts(cls, hosts: List[str], model: str = DEFAULT_MODEL,
+                   backend_options: Optional[Dict] = None, **pool_options) -> 'BackendPool':
+        """Build a pool of OllamaBackends, one per host URL
+
+        backend_options go to each OllamaBackend. Hosts do not retry on their
+        own by default (retries=0), since the pool retries a failed request
+        on another host.
+        """
+        backend_options = {'retries': 0, **(backend_options or {})}
+        backends = [OllamaBackend(host, model=model, **backend_options) for host in hosts]
+        return cls(backends, **pool_options)
+
+    def _score(self, state: _HostState) -> tuple:
+        if self.routing == LATENCY_WEIGHTED:
+            # Hosts without a measurement yet are tried first
+            return ((state.outstanding + 1) * (state.latency or 0.0), state.outstanding)
+        return (state.outstanding, state.latency or 0.0)
+
+    def _acquire(self, tried: set) -> Optional[_HostState]:
+        """Pick the best untried host and count the request against it"""
+        now = time.monotonic()
+        with self._lock:
+            candidates = [state for state in self._hosts if id(state) not in tried]
+            available = [state for state in candidates if state.available(now)]
+            # With every remaining host ejected, trying one beats failing outright
+            pool = available or sorted(candidates, key=lambda state: state.ejected_until)[:1]
+            if not pool:
+                return None
+            state = min(pool, key=self._score)
+            state.outstanding += 1
+            state.requests += 1
+            return state
+
+    def _release(self, state: _HostState, elapsed: Optional[float], failed: bool = True):
+        with self._lock:
+            state.outstanding -= 1
+            if elapsed is None and not failed:
+                return
+            if elapsed is not None:
+                state.consecutive_failures = 0
+                state.ejected_until = 0.0
+                state.latency = elapsed if state.latency is None else (
+                    self.latency_decay * elapsed + (1 - self.latency_decay) * state.latency
+                )
+                return
+            state.failures += 1
+            state.consecutive_failures += 1
+            if state.consecutive_failures >= self.failure_threshold:
+                self._eject(state, f"{state.consecutive_failures} consecutive failures")
+
+    def _eject(self, state: _HostState, reason: str):
+        state.ejected_until = time.monotonic() + self.eject_seconds
+        logger.warning(f"Ejecting {state.backend.host} for {self.eject_seconds}s: {reason}")
+
+    def chat(self, system_prompt: str, user_prompt: str) -> str:
+        tried = set()
+        errors = []
+        while True:
+            state = self._acquire(tried)
+            if state is None:
+                raise BackendError(f"Chat request failed on all {len(self._hosts)} hosts: {'; '.join(errors)}")
+            tried.add(id(state))
+            start = time.perf_counter()
+            try:
+                reply = state.backend.chat(system_prompt, user_prompt)
+            except Exception as e:
+                self._release(state, None)
+                errors.append(str(e))
+                logger.warning(f"Chat request failed on {state.backend.host}, trying another host: {str(e)}")
+                continue
+            self._release(state, time.perf_counter() - start)
+            return reply
+
+    def stream_chat(self, system_prompt: str, user_prompt: str) -> Iterator[str]:
+        """Stream from the best host, moving to another host only if none of the reply has arrived"""
+        tried = set()
+        errors = []
+        while True:
+            state = self._acquire(tried)
+            if state is None:
+                raise BackendError(f"Streaming chat request failed on all {len(self._hosts)} hosts: {'; '.join(errors)}")
+            tried.add(id(state))
+            start = time.perf_counter()
+            started = False
+            try:
+                for piece in state.backend.stream_chat(system_prompt, user_prompt):
+                    started = True
+                    yield piece
+            except Exception as e:
+                self._release(state, None)
+                if started:
+                    raise
+                errors.append(str(e))
+                logger.warning(f"Streaming chat request failed on {state.backend.host}, trying another host: {str(e)}")
+                continue
+            except BaseException:
+                # The caller stopped reading early; neither a success nor a host failure
+                self._release(state, None, failed=False)
+                raise
+            self._release(state, time.perf_counter() - start)
+            return
+
+    def check_health(self) -> Dict[str, bool]:
+        """Probe every host with list_models(), ejecting failing hosts and readmitting healthy ones"""
+        results = {}
+        for state in self._hosts:
+            try:
+                healthy = self.model in state.backend.list_models(timeout=self.health_timeout)
+                reason = f"model {self.model} not available"
+            except Exception as e:
+                healthy = False
+                reason = f"health check failed: {str(e)}"
+            with self._lock:
+                if healthy:
+                    if state.ejected_until:
+                        logger.info(f"Readmitting {state.backend.host} after a successful health check")
+                    state.ejected_until = 0.0
+                    state.consecutive_failures = 0
+                else:
+                    self._eject(state, reason)
+            results[state.backend.host] = healthy
+        return results
+
+    def _health_loop(self, interval: float):
+        while not self._stop.wait(interval):
+            try:
+                self.check_health()
+            except Exception as e:
+                logger.error(f"Backend health check error: {str(e)}")
+
+    def _gather(self, description: str, request) -> List:
+        """request(backend) for every host, raising only if all of them fail"""
+        results = []
+        errors = []
+        for state in self._hosts:
+            try:
+                results.append(request(state.backend))
+            except Exception as e:
+                errors.append(str(e))
+        if len(errors) == len(self._hosts):
+            raise BackendError(f"{description} failed on all hosts: {'; '.join(errors)}")
+        return results
+
+    def list_models(self, timeout: Optional[float] = None) -> List[str]:
+        lists = self._gather('Model list request', lambda backend: backend.list_models(timeout))
+        return sorted({model for models in lists for model in models})
+
+    def loaded_models(self, timeout: float = 5.0) -> List[str]:
+        """Models loaded on any host"""
+        lists = self._gather('Running model request', lambda backend: backend.loaded_models(timeout))
+        return sorted({model for models in lists for model in models})
+
+    def warm_up(self, timeout: float = 60.0) -> float:
+        """Warm the model on every host and return the slowest host's seconds"""
+        return max(self._gather('Warm-up request', lambda backend: backend.warm_up(timeout)))
+
+    def stats(self) -> List[Dict]:
+        """Per-host routing and health counters"""
+        now = time.monotonic()
+        with self._lock:
+            return [{
+                'host': state.backend.host,
+                'available': state.available(now),
+                'outstanding': state.outstanding,
+                'latency': state.latency,
+                'requests': state.requests,
+                'failures': state.failures,
+            } for state in self._hosts]
+
+    def close(self):
+        self._stop.set()
+        for state in self._hosts:
+            state.backend.close()
@@ -0,0 +1,332 @@
+# batch_translate.py
+"""Translate directories or manifests of PDFs offline, without the web app or job queue"""
+from typing import List, Optional, Dict, Tuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
+import argparse
+import threading
+import logging
+import json
+import time
+import os
+import sys
+from text_processor import TextProcessor
+from translation_manager import TranslationManager, TranslationCancelled
+from checkpoints import CheckpointStore
+from pipeline import load_or_prepare_chunks, translate_prepared_chunks, ProcessingError
+from worker import add_translation_arguments, build_translation_manager, load_settings
+from metrics import METRICS
+
+logger = logging.getLogger(__name__)
+
+OUTPUT_FORMATS = ('json', 'txt')
+
+def find_documents(inputs: List[str], manifest: Optional[str] = None) -> List[Tuple[str, str]]:
+    """Return (pdf_path, output_name) pairs for PDF files, directories and manifest entries
+
+    Directories are searched recursively and their PDFs keep their relative
+    path as output name. Manifests list one PDF per line (blank lines and
+    lines starting with '#' are ignored); relative paths are resolved
+    against the manifest's directory.
+    """
+    documents = []
+    for path in inputs:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                for name in sorted(files):
+                    if name.lower().endswith('.pdf'):
+                        pdf_path = os.path.join(root, name)
+                        documents.append((pdf_path, os.path.splitext(os.path.relpath(pdf_path, path))[0]))
+        elif os.path.isfile(path):
+            documents.append((path, os.path.splitext(os.path.basename(path))[0]))
+        else:
+            raise ValueError(f"No such file or directory: {path}")
+
+    if manifest:
+        base = os.path.dirname(os.path.abspath(manifest))
+        with open(manifest, encoding='utf-8') as f:
+            for line_number, line in enumerate(f, 1):
+                entry = line.strip()
+                if not entry or entry.startswith('#'):
+                    continue
+                pdf_path = entry if os.path.isabs(entry) else os.path.join(base, entry)
+                if not os.path.isfile(pdf_path):
+                    raise ValueError(f"{manifest}:{line_number}: no such file {entry}")
+                relative = os.path.relpath(pdf_path, base)
+                name = os.path.basename(pdf_path) if relative.startswith(os.pardir) else relative
+                documents.append((pdf_path, os.path.splitext(name)[0]))
+
+    unique = {}
+    for pdf_path, name in documents:
+        other = unique.setdefault(name, pdf_path)
+        if os.path.abspath(other) != os.path.abspath(pdf_path):
+            raise ValueError(f"{other} and {pdf_path} would both be written as {name}")
+    return [(pdf_path, name) for name, pdf_path in unique.items()]
+
+def _write_atomic(path: str, text: str):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    temporary = f"{path}.tmp"
+    with open(temporary, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(temporary, path)
+
+# Per-process state of the extraction workers, set up by _init_extractor
+_extractor = {}
+
+def _init_extractor(processor_options: Dict, checkpoints_db: Optional[str]):
+    _extractor['text_processor'] = TextProcessor(**processor_options)
+    _extractor['checkpoints'] = CheckpointStore(checkpoints_db) if checkpoints_db else None
+
+def _extract_document(pdf_path: str, cache_version: str) -> Dict:
+    """Chunk one PDF (or load its checkpoint) in an extraction worker process"""
+    text_processor = _extractor['text_processor']
+    start = time.perf_counter()
+    try:
+        pages = text_processor.page_count(pdf_path)
+        document_key, chunks = load_or_prepare_chunks(
+            text_processor, pdf_path, _extractor['checkpoints'], cache_version=cache_version
+        )
+    except ProcessingError as e:
+        return {'error': e.error}
+    except Exception as e:
+        return {'error': f'Unexpected error: {str(e)}'}
+    return {
+        'document_key': document_key,
+        'chunks': chunks,
+        'pages': pages,
+        'seconds': time.perf_counter() - start,
+    }
+
+class BatchTranslator:
+    """Translate many PDFs with extraction and translation overlapped
+
+    PDFs are extracted, cleaned and chunked in a pool of extract_workers
+    processes while up to `concurrency` already chunked documents are being
+    translated in this process, each with the translation manager's chunk
+    workers. Only this process reads and writes the translation cache;
+    extraction processes only write chunk checkpoints. Documents whose
+    outputs already exist are skipped unless force is set, and documents
+    with failed chunks get no outputs, so a rerun retries just those chunks
+    from their checkpoint.
+    """
+
+    def __init__(self, text_processor_options: Dict, translation_manager: TranslationManager,
+                 output_dir: str, formats: Tuple[str, ...] = OUTPUT_FORMATS,
+                 extract_workers: int = 2, concurrency: int = 1,
+                 checkpoints_db: Optional[str] = 'checkpoints.db', force: bool = False):
+        unknown = set(formats) - set(OUTPUT_FORMATS)
+        if not formats or unknown:
+            raise ValueError(f"Output formats must be among {OUTPUT_FORMATS}, got {formats}")
+        self.text_processor_options = text_processor_options
+        self.translation_manager = translation_manager
+        self.output_dir = output_dir
+        self.formats = tuple(formats)
+        self.extract_workers = extract_workers
+        self.concurrency = concurrency
+        self.checkpoints_db = checkpoints_db
+        self.checkpoints = CheckpointStore(checkpoints_db) if checkpoints_db else None
+        self.force = force
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self.stats = {}
+        self.failures = {}
+
+    def output_paths(self, name: str) -> Dict[str, str]:
+        return {fmt: os.path.join(self.output_dir, f"{name}.{fmt}") for fmt in self.formats}
+
+    def is_done(self, name: str) -> bool:
+        return all(os.path.exists(path) for path in self.output_paths(name).values())
+
+    def write_outputs(self, name: str, pdf_path: str, pages: int, result: dict):
+        paths = self.output_paths(name)
+        # JSON last: with both formats, its presence marks a finished document
+        if 'txt' in paths:
+            _write_atomic(paths['txt'], result['translated'] + "\n")
+        if 'json' in paths:
+            document = dict(result, source=pdf_path)
+            document['metadata'] = dict(result['metadata'], pages=pages)
+            _write_atomic(paths['json'], json.dumps(document, ensure_ascii=False, indent=2))
+
+    def _translate(self, pdf_path: str, name: str, prepared: Dict) -> Dict:
+        chunks = prepared['chunks']
+        resumed = sum(chunk.is_translated for chunk in chunks)
+        start = time.perf_counter()
+        result = translate_prepared_chunks(
+            self.translation_manager, chunks, cancel_check=self._stop.is_set,
+            checkpoints=self.checkpoints, document_key=prepared['document_key']
+        )
+        failed = result['metadata']['total_chunks'] - result['metadata']['successful_translations']
+        if failed:
+            raise ProcessingError(f"{failed} of {len(chunks)} chunks failed to translate")
+        self.write_outputs(name, pdf_path, prepared['pages'], result)
+        return {'chunks': len(chunks), 'resumed_chunks': resumed, 'seconds': time.perf_counter() - start}
+
+    def _record(self, **increments):
+        with self._lock:
+            for key, value in increments.items():
+                self.stats[key] += value
+
+    def summary(self) -> Dict:
+        """Counts and throughput for the current or last run"""
+        with self._lock:
+            stats = dict(self.stats)
+        minutes = max(time.perf_counter() - stats.pop('started'), 1e-9) / 60
+        cache = self.translation_manager.cache.stats()
+        hits = cache['hits'] - stats.pop('cache_hits')
+        lookups = hits + cache['misses'] - stats.pop('cache_misses')
+        stats.update({
+            'elapsed_seconds': minutes * 60,
+            'pages_per_minute': stats['pages'] / minutes,
+            'chunks_per_minute': stats['chunks'] / minutes,
+            'cache_hit_rate': hits / lookups if lookups else 0.0,
+        })
+        return stats
+
+    def _log_progress(self, done: int, total: int, name: str, message: str):
+        summary = self.summary()
+        logger.info(
+            f"[{done}/{total}] {name}: {message} | {summary['pages_per_minute']:.1f} pages/min, "
+            f"{summary['chunks_per_minute']:.1f} chunks/min, cache hit rate {summary['cache_hit_rate']:.0%}"
+        )
+
+    def run(self, documents: List[Tuple[str, str]]) -> Dict:
+        """Translate (pdf_path, output_name) pairs and return summary()"""
+        cache = self.translation_manager.cache.stats()
+        self.stats = {
+            'started': time.perf_counter(), 'documents': 0, 'skipped': 0, 'failed': 0,
+            'pages': 0, 'chunks': 0, 'resumed_chunks': 0, 'extract_seconds': 0.0, 'translate_seconds': 0.0,
+            'cache_hits': cache['hits'], 'cache_misses': cache['misses'],
+        }
+        self.failures = {}
+        total = len(documents)
+        todo = []
+        for pdf_path, name in documents:
+            if not self.force and self.is_done(name):
+                self._record(skipped=1)
+            else:
+                todo.append((pdf_path, name))
+        if self.stats['skipped']:
+            logger.info(f"Skipping {self.stats['skipped']} of {total} documents with existing outputs")
+
+        finished = self.stats['skipped']
+        # Chunked documents waiting for a translation slot are bounded too, to cap memory
+        max_in_flight = self.extract_workers + 2 * self.concurrency
+        pending = iter(todo)
+        extracting, translating = {}, {}
+        cache_version = self.translation_manager.cache_version
+        with ProcessPoolExecutor(max_workers=self.extract_workers, initializer=_init_extractor,
+                                 initargs=(self.text_processor_options, self.checkpoints_db)) as extractors, \
+                ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="batch") as translators:
+            try:
+                while True:
+                    while not self._stop.is_set() and len(extracting) + len(translating) < max_in_flight:
+                        document = next(pending, None)
+                        if document is None:
+                            break
+                        extracting[extractors.submit(_extract_document, document[0], cache_version)] = document
+                    if not extracting and not translating:
+                        break
+
+                    done, _ = wait(list(extracting) + list(translating), return_when=FIRST_COMPLETED)
+                    for future in done:
+                        if future in extracting:
+                            pdf_path, name = extracting.pop(future)
+                            prepared = future.result()
+                            if 'error' in prepared:
+                                finished += 1
+                                self._fail(pdf_path, prepared['error'])
+                                self._log_progress(finished, total, name, f"failed: {prepared['error']}")
+                                continue
+                            self._record(extract_seconds=prepared['seconds'])
+                            future = translators.submit(self._translate, pdf_path, name, prepared)
+                            translating[future] = (pdf_path, name, prepared['pages'])
+                            continue
+
+                        pdf_path, name, pages = translating.pop(future)
+                        finished += 1
+                        try:
+                            outcome = future.result()
+                        except TranslationCancelled:
+                            continue
+                        except Exception as e:
+                            error = e.error if isinstance(e, ProcessingError) else f'Unexpected error: {str(e)}'
+                            self._fail(pdf_path, error)
+                            self._log_progress(finished, total, name, f"failed: {error}")
+                            continue
+                        self._record(documents=1, pages=pages, chunks=outcome['chunks'],
+                                     resumed_chunks=outcome['resumed_chunks'],
+                                     translate_seconds=outcome['seconds'])
+                        self._log_progress(finished, total, name,
+                                           f"{pages} pages, {outcome['chunks']} chunks in {outcome['seconds']:.1f}s")
+            except KeyboardInterrupt:
+                logger.info("Interrupted, finishing the chunks in flight; rerun to resume")
+                self.stop()
+                for future in extracting:
+                    future.cancel()
+                wait(list(translating))
+        return self.summary()
+
+    def _fail(self, pdf_path: str, error: str):
+        self._record(failed=1)
+        self.failures[pdf_path] = error
+        logger.error(f"Failed to translate {pdf_path}: {error}")
+
+    def stop(self):
+        self._stop.set()
+
+def main():
+    parser = argparse.ArgumentParser(description="Translate directories or lists of Chinese PDFs to English")
+    parser.add_argument('inputs', nargs='*', metavar='PATH', help='PDF files or directories to search for PDFs')
+    parser.add_argument('--manifest', help='file listing one PDF path per line')
+    parser.add_argument('--output-dir', '-o', required=True, help='where <name>.json and <name>.txt are written')
+    parser.add_argument('--format', action='append', choices=OUTPUT_FORMATS, dest='formats',
+                        help='output format (may be repeated; default: json and txt)')
+    parser.add_argument('--extract-workers', type=int, default=max(1, min(4, (os.cpu_count() or 2) - 1)),
+                        help='processes extracting and chunking PDFs ahead of translation')
+    parser.add_argument('--concurrency', type=int, default=2,
+                        help='documents translated at the same time')
+    parser.add_argument('--force', action='store_true', help='translate documents that already have outputs')
+    parser.add_argument('--summary-json', metavar='PATH', help='also write the run summary to this file')
+    add_translation_arguments(parser)
+    args = parser.parse_args()
+    settings = load_settings(parser, args)
+
+    logging.basicConfig(level=settings.log_level.upper(), format='%(levelname)s:%(name)s:%(message)s')
+    if not args.inputs and not args.manifest:
+        parser.error("give at least one PDF or directory, or --manifest")
+    try:
+        documents = find_documents(args.inputs, args.manifest)
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+    logger.info(f"Found {len(documents)} PDFs")
+
+    translation_manager = build_translation_manager(settings, args.concurrency)
+    translator = BatchTranslator(
+        {'model': translation_manager.model, 'chunk_tokens': settings.chunk_tokens,
+         'skip_non_chinese_pages': settings.skip_non_chinese_pages},
+        translation_manager,
+        args.output_dir,
+        formats=tuple(args.formats or OUTPUT_FORMATS),
+        extract_workers=args.extract_workers,
+        concurrency=args.concurrency,
+        checkpoints_db=args.checkpoints_db or None,
+        force=args.force
+    )
+    summary = translator.run(documents)
+
+    print(
+        f"Translated {summary['documents']} documents ({summary['skipped']} skipped, {summary['failed']} failed) "
+        f"in {summary['elapsed_seconds']:.1f}s: {summary['pages']} pages, {summary['chunks']} chunks "
+        f"({summary['resumed_chunks']} from checkpoints)\n"
+        f"{summary['pages_per_minute']:.1f} pages/min, {summary['chunks_per_minute']:.1f} chunks/min, "
+        f"cache hit rate {summary['cache_hit_rate']:.1%}"
+    )
+    if args.summary_json:
+        _write_atomic(args.summary_json, json.dumps(
+            dict(summary, failures=translator.failures, stages=METRICS.stage_summary()), indent=2
+        ))
+    translation_manager.backend.close()
+    sys.exit(1 if summary['failed'] else 0)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+# benchmarks/bench_clean_text.py
+"""Micro-benchmark of TextProcessor.clean_text against the original multi-pass cleaner"""
+import argparse
+import logging
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from text_processor import TextProcessor
+
+logger = logging.getLogger("legacy_clean_text")
+
+DEFAULT_PDF = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                           "1pg -UN Human Right - Chinese .pdf")
+
+def legacy_clean_text(text: str) -> str:
+    """The clean_text implementation this benchmark compares against"""
+    logger.debug(f"Original text before cleaning: {text}")
+    text = re.sub(r'(?<=[一-鿿])\s+(?=[一-鿿])', '', text)
+    text = text.replace('\n', ' NEW_LINE ')
+    text = re.sub(r'\s+', ' ', text)
+    text = text.replace(' NEW_LINE ', '\n')
+    text = re.sub(r'[^一-鿿.,!?;:\s\n。！？；：、，]', '', text)
+    text = re.sub(r'\n\s*\n', '\n', text)
+    text = re.sub(r' +', ' ', text)
+    cleaned = text.strip()
+    logger.debug(f"Cleaned text: {cleaned}")
+    return cleaned
+
+def build_corpus(pdf_path: str, size_mb: float) -> str:
+    """Repeat the PDF's raw extracted text until it reaches size_mb of UTF-8"""
+    page_text = TextProcessor().extract_from_pdf(pdf_path)
+    parts = [page_text]
+    size = len(page_text.encode('utf-8'))
+    while size < size_mb * 1_000_000:
+        parts.append(page_text)
+        size += len(page_text.encode('utf-8')) + 1
+    return "\n".join(parts)
+
+def measure(clean, text: str, repeat: int) -> float:
+    """Return the best throughput in MB/s over `repeat` runs"""
+    megabytes = len(text.encode('utf-8')) / 1_000_000
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.process_time()
+        clean(text)
+        best = min(best, time.process_time() - start)
+    return megabytes / best
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure clean_text throughput before and after")
+    parser.add_argument('--pdf', default=DEFAULT_PDF, help='PDF whose text is repeated to build the corpus')
+    parser.add_argument('--size-mb', type=float, default=4.0, help='corpus size in MB of UTF-8')
+    parser.add_argument('--repeat', type=int, default=5, help='runs per implementation; the best is reported')
+    parser.add_argument('--debug-logging', action='store_true',
+                        help='log at DEBUG to /dev/null, as app.py configures logging')
+    args = parser.parse_args()
+
+    text = build_corpus(args.pdf, args.size_mb)
+    with open(os.devnull, 'w') as devnull:
+        logging.basicConfig(level=logging.DEBUG if args.debug_logging else logging.WARNING, stream=devnull)
+        current = TextProcessor().clean_text
+        if current(text) != legacy_clean_text(text):
+            raise SystemExit("clean_text output differs from the legacy implementation")
+
+        before = measure(legacy_clean_text, text, args.repeat)
+        after = measure(current, text, args.repeat)
+
+    print(f"corpus: {len(text.encode('utf-8')) / 1_000_000:.1f} MB, debug logging {'on' if args.debug_logging else 'off'}")
+    print(f"before: {before:8.1f} MB/s")
+    print(f"after:  {after:8.1f} MB/s  ({after / before:.2f}x)")
+
+if __name__ == '__main__':
+    main()
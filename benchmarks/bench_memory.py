@@ -0,0 +1,130 @@
+# benchmarks/bench_memory.py
+"""Peak memory of one document through the default and the low-memory pipeline
+
+Each mode runs in its own subprocess against the mock model, so the
+resident-set high-water mark belongs to that run alone. Reported per mode:
+the tracemalloc peak of Python allocations made during the run, the peak
+RSS, and how much of that the run added over the process after imports.
+"""
+from typing import Dict, List
+import argparse
+import json
+import logging
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO)
+
+from text_processor import TextProcessor
+from translation_manager import TranslationManager, RESULT_FIELDS
+from backends import OllamaBackend
+from mock_ollama import start_mock_server
+from pipeline import translate_document, translate_document_to_file
+from synthetic_corpus import write_synthetic_pdf
+
+MODES = ('default', 'low_memory')
+
+def max_rss_mb() -> float:
+    """Peak resident set size of this process so far"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak / (1 << 20) if sys.platform == 'darwin' else peak / 1024
+
+def measure(mode: str, pdf_path: str, server_url: str, workdir: str, fields: List[str],
+            chunk_workers: int) -> Dict:
+    """Translate pdf_path once in mode and report its memory use (run in a fresh process)"""
+    text_processor = TextProcessor(model='qwen2.5:7b')
+    manager = TranslationManager(os.path.join(workdir, f"{mode}.db"), max_workers=chunk_workers,
+                                 backend=OllamaBackend(server_url, max_connections=chunk_workers))
+    baseline = max_rss_mb()
+    tracemalloc.start()
+    start = time.perf_counter()
+    if mode == 'default':
+        result = translate_document(text_processor, manager, pdf_path, fields=fields)
+        # As JobQueue.complete stores it
+        payload = json.dumps(result, ensure_ascii=False)
+        metadata = result['metadata']
+        result_bytes = len(payload.encode('utf-8'))
+        del result, payload
+    else:
+        output_path = os.path.join(workdir, f"{mode}.json")
+        metadata = translate_document_to_file(text_processor, manager, pdf_path, output_path, fields=fields)
+        result_bytes = os.path.getsize(output_path)
+    seconds = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    manager.backend.close()
+    rss = max_rss_mb()
+    return {
+        'mode': mode,
+        'seconds': seconds,
+        'chunks': metadata['total_chunks'],
+        'tracemalloc_peak_mb': peak / (1 << 20),
+        'max_rss_mb': rss,
+        'rss_growth_mb': rss - baseline,
+        'result_mb': result_bytes / (1 << 20),
+    }
+
+def run_mode(mode: str, args: argparse.Namespace, pdf_path: str, server_url: str, workdir: str) -> Dict:
+    command = [sys.executable, os.path.abspath(__file__), '--child', mode, '--pdf', pdf_path,
+               '--server', server_url, '--workdir', workdir, '--chunk-workers', str(args.chunk_workers),
+               '--result-fields', ','.join(args.result_fields)]
+    completed = subprocess.run(command, capture_output=True, text=True, check=True)
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare peak memory of the default and low-memory pipelines")
+    parser.add_argument('--pdf', help='PDF to translate (default: a synthetic one of --pages pages)')
+    parser.add_argument('--pages', type=int, default=200)
+    parser.add_argument('--chars-per-page', type=int, default=1200)
+    parser.add_argument('--mode', action='append', choices=MODES, dest='modes',
+                        help='mode to run (may be repeated; default: both)')
+    parser.add_argument('--result-fields', type=lambda value: [f for f in value.split(',') if f],
+                        default=list(RESULT_FIELDS), help='comma-separated result fields to build')
+    parser.add_argument('--chunk-workers', type=int, default=4)
+    parser.add_argument('--output', '-o', help='write the results as JSON to this file')
+    parser.add_argument('--child', choices=MODES, help=argparse.SUPPRESS)
+    parser.add_argument('--server', help=argparse.SUPPRESS)
+    parser.add_argument('--workdir', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    if args.child:
+        outcome = measure(args.child, args.pdf, args.server, args.workdir, args.result_fields, args.chunk_workers)
+        print(json.dumps(outcome))
+        return
+
+    results = []
+    server = start_mock_server(latency=0)
+    try:
+        with tempfile.TemporaryDirectory(prefix='bench-memory-') as workdir:
+            pdf_path = args.pdf
+            if not pdf_path:
+                pdf_path = os.path.join(workdir, 'synthetic.pdf')
+                write_synthetic_pdf(pdf_path, args.pages, args.chars_per_page)
+            print(f"{'mode':<12} {'chunks':>7} {'seconds':>8} {'traced MB':>10} {'RSS MB':>8} "
+                  f"{'RSS +MB':>8} {'result MB':>10}")
+            for mode in args.modes or MODES:
+                outcome = run_mode(mode, args, pdf_path, server.url, workdir)
+                results.append(outcome)
+                print(f"{mode:<12} {outcome['chunks']:>7} {outcome['seconds']:>8.1f} "
+                      f"{outcome['tracemalloc_peak_mb']:>10.1f} {outcome['max_rss_mb']:>8.1f} "
+                      f"{outcome['rss_growth_mb']:>8.1f} {outcome['result_mb']:>10.1f}")
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'config': {'pdf': args.pdf, 'pages': args.pages, 'result_fields': args.result_fields},
+                       'results': results}, f, indent=2)
+        print(f"\nWrote {args.output}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,255 @@
+# benchmarks/bench_pipeline.py
+"""Benchmark each pipeline stage and full documents against a mock model, with JSON results
+
+Every result has a `throughput` (higher is better) and its `unit`, so two
+result files can be compared with --compare to spot regressions between
+versions.
+"""
+from typing import Callable, Dict, List, Optional
+import argparse
+import datetime
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO)
+
+from text_processor import TextProcessor, TextChunk
+from translation_manager import TranslationManager
+from backends import OllamaBackend
+from mock_ollama import start_mock_server, fake_translation
+from pipeline import translate_document
+from synthetic_corpus import write_synthetic_pdf
+
+UN_PDF = os.path.join(REPO, "1pg -UN Human Right - Chinese .pdf")
+
+STAGES = ('extract_from_pdf', 'clean_text', 'is_chinese', 'create_chunks', 'cache_lookup',
+          'apply_terminology', 'post_process_translation', 'validate_translation', 'document')
+
+def best_time(run: Callable[[], object], repeat: int, min_seconds: float = 0.05) -> float:
+    """Best CPU seconds per call over `repeat` samples
+
+    Like timeit's autorange, each sample calls run() often enough to take at
+    least min_seconds, so fast stages on small corpora are not timer noise.
+    CPU time rather than wall time keeps results steady on shared machines.
+    """
+    number = 1
+    while True:
+        start = time.process_time()
+        for _ in range(number):
+            run()
+        elapsed = time.process_time() - start
+        if elapsed >= min_seconds:
+            break
+        number = max(number * 2, int(number * min_seconds / max(elapsed, 1e-9)) + 1)
+    best = elapsed / number
+    for _ in range(repeat - 1):
+        start = time.process_time()
+        for _ in range(number):
+            run()
+        best = min(best, (time.process_time() - start) / number)
+    return best
+
+def rate(amount: float, seconds: float, unit: str, **extra) -> Dict:
+    return dict(extra, seconds=seconds, throughput=amount / seconds if seconds else 0.0, unit=unit)
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'describe', '--always', '--dirty'], cwd=REPO, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+class PipelineBenchmark:
+    """Runs the stage benchmarks over one corpus (a synthetic PDF or the UN declaration)"""
+
+    def __init__(self, name: str, pdf_path: str, repeat: int, workdir: str):
+        self.name = name
+        self.pdf_path = pdf_path
+        self.repeat = repeat
+        self.workdir = workdir
+        self.text_processor = TextProcessor(model='qwen2.5:7b')
+        self.pages = self.text_processor.page_count(pdf_path)
+        self.raw_text = self.text_processor.extract_from_pdf(pdf_path)
+        self.cleaned_text = self.text_processor.clean_text(self.raw_text)
+        self.chunks = self.text_processor.create_chunks(self.cleaned_text)
+        self.translations = [fake_translation(chunk.content) for chunk in self.chunks]
+
+    def _manager(self, label: str, **options) -> TranslationManager:
+        db_path = os.path.join(self.workdir, f"{self.name}-{label}.db")
+        return TranslationManager(db_path, **options)
+
+    def extract_from_pdf(self) -> Dict:
+        seconds = best_time(lambda: self.text_processor.extract_from_pdf(self.pdf_path), self.repeat)
+        return rate(self.pages, seconds, 'pages/s', pages=self.pages)
+
+    def clean_text(self) -> Dict:
+        megabytes = len(self.raw_text.encode('utf-8')) / 1_000_000
+        seconds = best_time(lambda: self.text_processor.clean_text(self.raw_text), self.repeat)
+        return rate(megabytes, seconds, 'MB/s', megabytes=megabytes)
+
+    def is_chinese(self) -> Dict:
+        seconds = best_time(lambda: self.text_processor.is_chinese(self.cleaned_text), self.repeat)
+        return rate(1, seconds, 'calls/s', characters=len(self.cleaned_text))
+
+    def create_chunks(self) -> Dict:
+        megabytes = len(self.cleaned_text.encode('utf-8')) / 1_000_000
+        seconds = best_time(lambda: self.text_processor.create_chunks(self.cleaned_text), self.repeat)
+        return rate(megabytes, seconds, 'MB/s', megabytes=megabytes, chunks=len(self.chunks))
+
+    def cache_lookup(self) -> Dict:
+        manager = self._manager('cache')
+        manager.cache_translations(list(zip(self.chunks, self.translations)))
+
+        def lookup_from_disk():
+            manager.cache.clear_memory()
+            manager.get_cached_translations(self.chunks)
+
+        disk = best_time(lookup_from_disk, self.repeat)
+        memory = best_time(lambda: manager.get_cached_translations(self.chunks), self.repeat)
+        misses = [TextChunk(id=chunk.id, content=chunk.content + "。", sequence_number=chunk.sequence_number)
+                  for chunk in self.chunks]
+        miss = best_time(lambda: manager.get_cached_translations(misses), self.repeat)
+        hits = len(manager.get_cached_translations(self.chunks))
+        return rate(len(self.chunks), disk, 'lookups/s', hits=hits, lookups=len(self.chunks),
+                    memory_lookups_per_second=len(self.chunks) / memory if memory else 0.0,
+                    miss_lookups_per_second=len(self.chunks) / miss if miss else 0.0)
+
+    def apply_terminology(self) -> Dict:
+        manager = self._manager('terms')
+        terms = [term for term, _ in manager.terminology.items()]
+        # Translations with a few untranslated glossary terms left in, as the model sometimes returns
+        texts = [f"{translation} {terms[i % len(terms)]} {terms[(i * 7) % len(terms)]}."
+                 for i, translation in enumerate(self.translations)]
+        seconds = best_time(lambda: [manager.apply_terminology(text) for text in texts], self.repeat)
+        return rate(len(texts), seconds, 'chunks/s', glossary_terms=len(terms))
+
+    def post_process_translation(self) -> Dict:
+        manager = self._manager('post')
+        seconds = best_time(lambda: [manager.post_process_translation(text) for text in self.translations],
+                            self.repeat)
+        return rate(len(self.translations), seconds, 'chunks/s')
+
+    def validate_translation(self) -> Dict:
+        manager = self._manager('validate')
+        pairs = [(chunk.content, translation) for chunk, translation in zip(self.chunks, self.translations)]
+        seconds = best_time(lambda: [manager.validate_translation(source, text) for source, text in pairs],
+                            self.repeat)
+        return rate(len(pairs), seconds, 'chunks/s')
+
+    def document(self, server_url: str, chunk_workers: int, server) -> Dict:
+        """Full translate_document runs against the mock model: a cold cache, then a warm one"""
+        manager = self._manager('document', max_workers=chunk_workers,
+                                backend=OllamaBackend(server_url, max_connections=chunk_workers))
+        runs = {}
+        for label in ('cold', 'warm'):
+            requests = server.stats['requests']
+            start = time.perf_counter()
+            result = translate_document(self.text_processor, manager, self.pdf_path)
+            seconds = time.perf_counter() - start
+            runs[label] = {
+                'seconds': seconds,
+                'pages_per_minute': self.pages / seconds * 60,
+                'chunks_per_minute': result['metadata']['total_chunks'] / seconds * 60,
+                'model_requests': server.stats['requests'] - requests,
+                'successful_translations': result['metadata']['successful_translations'],
+            }
+        manager.backend.close()
+        return dict(runs['cold'], throughput=runs['cold']['pages_per_minute'], unit='pages/min',
+                    chunks=len(self.chunks), warm=runs['warm'])
+
+def run_suite(args: argparse.Namespace) -> Dict:
+    stages = args.stages or list(STAGES)
+    results = {}
+    with tempfile.TemporaryDirectory(prefix='bench-pipeline-') as workdir:
+        corpora = {}
+        if args.pages:
+            path = os.path.join(workdir, 'synthetic.pdf')
+            write_synthetic_pdf(path, args.pages, args.chars_per_page, seed=args.seed)
+            corpora[f"synthetic_{args.pages}p"] = path
+        if not args.no_un_pdf and os.path.exists(UN_PDF):
+            corpora['un_declaration'] = UN_PDF
+
+        server = start_mock_server(latency=args.latency, jitter=args.jitter, seed=args.seed) \
+            if 'document' in stages else None
+        try:
+            for name, path in corpora.items():
+                benchmark = PipelineBenchmark(name, path, args.repeat, workdir)
+                results[name] = {}
+                for stage in stages:
+                    if stage == 'document':
+                        outcome = benchmark.document(server.url, args.chunk_workers, server)
+                    else:
+                        outcome = getattr(benchmark, stage)()
+                    results[name][stage] = outcome
+                    print(f"{name:<20} {stage:<26} {outcome['throughput']:>14,.1f} {outcome['unit']}")
+        finally:
+            if server:
+                server.shutdown()
+                server.server_close()
+
+    return {
+        'revision': git_revision(),
+        'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'config': {key: value for key, value in vars(args).items() if key not in ('output', 'compare')},
+        'results': results,
+    }
+
+def compare(baseline: Dict, current: Dict, threshold: float) -> List[str]:
+    """Print throughput changes against a baseline result file and return the regressed stages"""
+    regressions = []
+    print(f"\nCompared with {baseline.get('revision')} ({baseline.get('timestamp')}):")
+    for corpus, stages in current['results'].items():
+        for stage, outcome in stages.items():
+            before = baseline.get('results', {}).get(corpus, {}).get(stage)
+            if not before or not before.get('throughput'):
+                continue
+            change = outcome['throughput'] / before['throughput'] - 1
+            flag = ''
+            if change < -threshold:
+                flag = '  REGRESSION'
+                regressions.append(f"{corpus}/{stage}")
+            print(f"{corpus:<20} {stage:<26} {change:>+8.1%}{flag}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the translation pipeline stage by stage")
+    parser.add_argument('--pages', type=int, default=20, help='pages in the synthetic PDF (0 to skip it)')
+    parser.add_argument('--chars-per-page', type=int, default=1200)
+    parser.add_argument('--no-un-pdf', action='store_true', help='skip the bundled UN declaration PDF')
+    parser.add_argument('--stage', action='append', choices=STAGES, dest='stages',
+                        help='stage to run (may be repeated; default: all)')
+    parser.add_argument('--repeat', type=int, default=5, help='runs per micro-benchmark; the best is kept')
+    parser.add_argument('--latency', type=float, default=0.05, help='mock model seconds per request')
+    parser.add_argument('--jitter', type=float, default=0.0, help='up to this many extra seconds per request')
+    parser.add_argument('--chunk-workers', type=int, default=4, help='chunks in flight in document runs')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', '-o', help='write the results as JSON to this file')
+    parser.add_argument('--compare', metavar='BASELINE', help='JSON results of an earlier run to compare with')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='throughput drop (fraction) reported as a regression by --compare')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    results = run_suite(args)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nWrote {args.output}")
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        if compare(baseline, results, args.threshold):
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
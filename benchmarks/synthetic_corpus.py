@@ -0,0 +1,129 @@
+# benchmarks/synthetic_corpus.py
+"""Deterministic synthetic Chinese documents, as text or as PDFs, for benchmarks"""
+from typing import List
+import argparse
+import random
+
+# Vocabulary in the register of the bundled UN declaration
+WORDS = (
+    "人人", "权利", "自由", "尊严", "平等", "国家", "社会", "法律", "保护", "教育",
+    "家庭", "工作", "宗教", "信仰", "国籍", "财产", "安全", "和平", "发展", "合作",
+    "联合国", "会员国", "宣言", "公约", "义务", "原则", "基本", "充分", "享有", "尊重",
+    "不得", "任何人", "应当", "有权", "包括", "实现", "促进", "维护", "公正", "独立",
+    "民族", "种族", "性别", "语言", "政治", "经济", "文化", "健康", "生活", "标准",
+)
+CONNECTIVES = ("和", "及", "的", "在", "与", "对", "为", "受")
+CLAUSE_ENDS = ("，", "，", "；", "、")
+SENTENCE_ENDS = ("。", "。", "。", "！", "？")
+
+def synthetic_text(chars: int, seed: int = 0, noise: bool = True) -> str:
+    """About `chars` characters of article-structured Chinese prose
+
+    With noise, some text looks like raw PDF extraction: spaces inside
+    Chinese runs, page numbers and stray Latin characters, so cleaning has
+    work to do.
+    """
+    rng = random.Random(seed)
+    paragraphs = []
+    size = 0
+    article = 1
+    while size < chars:
+        sentences = []
+        for _ in range(rng.randint(2, 6)):
+            clauses = []
+            for _ in range(rng.randint(1, 3)):
+                words = [rng.choice(WORDS)]
+                for _ in range(rng.randint(2, 6)):
+                    words.append(rng.choice(CONNECTIVES) if rng.random() < 0.3 else rng.choice(WORDS))
+                clauses.append(''.join(words))
+            sentence = ''.join(clause + rng.choice(CLAUSE_ENDS) for clause in clauses[:-1])
+            sentences.append(sentence + clauses[-1] + rng.choice(SENTENCE_ENDS))
+        paragraph = ''.join(sentences)
+        if noise and rng.random() < 0.2:
+            cut = rng.randrange(1, len(paragraph))
+            paragraph = paragraph[:cut] + ' ' * rng.randint(1, 3) + paragraph[cut:]
+        if noise and rng.random() < 0.1:
+            paragraph += f" {rng.randint(1, 999)} A/RES/{rng.randint(100, 999)}"
+        paragraphs.append(f"第{article}条")
+        paragraphs.append(paragraph)
+        size += len(paragraph) + len(paragraphs[-2]) + 2
+        article += 1
+    return "\n".join(paragraphs)
+
+def wrap_lines(text: str, width: int) -> List[str]:
+    """Break each paragraph into lines of at most width characters"""
+    lines = []
+    for paragraph in text.split("\n"):
+        lines.extend(paragraph[start:start + width] for start in range(0, len(paragraph), width))
+    return lines
+
+def pdf_bytes(pages: List[List[str]]) -> bytes:
+    """A minimal PDF with one text line per entry, using a standard CJK font
+
+    The text is written with the STSong-Light CID font and the UniGB-UCS2-H
+    encoding, which PDF readers (and pdfminer) resolve without an embedded
+    font, so no PDF library is needed.
+    """
+    objects = []
+
+    def add(body: bytes) -> int:
+        objects.append(body)
+        return len(objects)
+
+    font = add(
+        b"<< /Type /Font /Subtype /Type0 /BaseFont /STSong-Light /Encoding /UniGB-UCS2-H "
+        b"/DescendantFonts [<< /Type /Font /Subtype /CIDFontType0 /BaseFont /STSong-Light "
+        b"/CIDSystemInfo << /Registry (Adobe) /Ordering (GB1) /Supplement 4 >> >>] >>"
+    )
+    pages_id = add(b"")
+    kids = []
+    for lines in pages:
+        operations = [b"BT /F1 12 Tf 14 TL 40 800 Td"]
+        for line in lines:
+            operations.append(b"<" + line.encode('utf-16-be').hex().encode('ascii') + b"> Tj T*")
+        operations.append(b"ET")
+        stream = b"\n".join(operations)
+        contents = add(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        kids.append(add(
+            b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 595 842] "
+            b"/Resources << /Font << /F1 %d 0 R >> >> /Contents %d 0 R >>" % (pages_id, font, contents)
+        ))
+    objects[pages_id - 1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (
+        b" ".join(b"%d 0 R" % kid for kid in kids), len(kids)
+    )
+    catalog = add(b"<< /Type /Catalog /Pages %d 0 R >>" % pages_id)
+
+    output = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(output))
+        output += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(output)
+    output += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    output += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    output += b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, catalog, xref)
+    return bytes(output)
+
+def write_synthetic_pdf(path: str, pages: int, chars_per_page: int = 1200, seed: int = 0,
+                        line_width: int = 38) -> str:
+    """Write a PDF of `pages` pages of synthetic text and return the text that was laid out"""
+    text = synthetic_text(pages * chars_per_page, seed=seed)
+    lines = wrap_lines(text, line_width)
+    per_page = max(1, -(-len(lines) // pages))
+    layout = [lines[start:start + per_page] for start in range(0, len(lines), per_page)][:pages]
+    with open(path, 'wb') as f:
+        f.write(pdf_bytes(layout))
+    return "\n".join("\n".join(page) for page in layout)
+
+def main():
+    parser = argparse.ArgumentParser(description="Write a synthetic Chinese PDF")
+    parser.add_argument('path')
+    parser.add_argument('--pages', type=int, default=20)
+    parser.add_argument('--chars-per-page', type=int, default=1200)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    text = write_synthetic_pdf(args.path, args.pages, args.chars_per_page, args.seed)
+    print(f"Wrote {args.pages} pages ({len(text)} characters) to {args.path}")
+
+if __name__ == '__main__':
+    main()
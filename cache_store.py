@@ -0,0 +1,479 @@
+# cache_store.py
+from typing import Optional, Dict, Iterable, List, Tuple
+from collections import OrderedDict
+import argparse
+import sqlite3
+import logging
+import threading
+import time
+import json
+
+logger = logging.getLogger(__name__)
+
+# Stay well under SQLite's host-parameter limit for IN (...) lookups
+MAX_VARIABLES_PER_QUERY = 500
+
+# Rows served from SQLite have last_accessed refreshed in batches at most this often
+TOUCH_INTERVAL_SECONDS = 60.0
+
+# Version recorded for rows cached before keys included the model/prompt/glossary fingerprint
+LEGACY_VERSION = 'legacy'
+
+class LRUCache:
+    """Thread-safe in-memory LRU bounded by entry count and total value bytes"""
+
+    def __init__(self, max_entries: int = 10000, max_bytes: int = 64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._data = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    @staticmethod
+    def _size(key: str, value: str) -> int:
+        return len(key) + len(value.encode('utf-8'))
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            value = self._data.get(key)
+            if value is not None:
+                self._data.move_to_end(key)
+            return value
+
+    def put(self, key: str, value: str):
+        size = self._size(key, value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self._bytes -= self._size(key, old)
+            self._data[key] = value
+            self._bytes += size
+            while len(self._data) > self.max_entries or self._bytes > self.max_bytes:
+                old_key, old_value = self._data.popitem(last=False)
+                self._bytes -= self._size(old_key, old_value)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    @property
+    def size_bytes(self) -> int:
+        return self._bytes
+
+class TranslationCache:
+    """Two-tier translation cache: an in-process LRU in front of SQLite
+
+    SQLite connections are opened lazily, one per thread, in WAL mode so
+    concurrent readers never block the writer. Lookups and writes can be
+    batched, and hit/miss/latency counters are kept for monitoring.
+
+    The SQLite tier is bounded by an optional eviction policy (max_age_days,
+    max_idle_days, max_rows, max_bytes) that is enforced every
+    evict_every_writes writes, or on demand through evict(). Reads note
+    which rows they served, and last_accessed is written for them in one
+    UPDATE with the next write batch or eviction, or every touch_interval
+    seconds, so lookups do not turn into writes.
+    """
+
+    def __init__(self, db_path: str = "translations.db", busy_timeout: float = 30.0,
+                 memory_entries: int = 10000, memory_bytes: int = 64 * 1024 * 1024,
+                 max_age_days: Optional[float] = None, max_idle_days: Optional[float] = None,
+                 max_rows: Optional[int] = None, max_bytes: Optional[int] = None,
+                 evict_every_writes: int = 1000, touch_interval: float = TOUCH_INTERVAL_SECONDS):
+        self.db_path = db_path
+        self.busy_timeout = busy_timeout
+        self.memory = LRUCache(memory_entries, memory_bytes) if memory_entries > 0 else None
+        self.eviction_policy = {
+            'max_age_days': max_age_days,
+            'max_idle_days': max_idle_days,
+            'max_rows': max_rows,
+            'max_bytes': max_bytes,
+        }
+        self.evict_every_writes = evict_every_writes
+        self._writes_since_evict = 0
+        self.touch_interval = touch_interval
+        self._touched = set()
+        self._touched_at = time.monotonic()
+        self._local = threading.local()
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            'hits': 0,
+            'memory_hits': 0,
+            'stale_hits': 0,
+            'misses': 0,
+            'lookups': 0,
+            'lookup_seconds': 0.0,
+            'writes': 0,
+            'write_batches': 0,
+            'write_seconds': 0.0,
+        }
+        self.setup_database()
+
+    def _connection(self) -> sqlite3.Connection:
+        """Return this thread's connection, opening and configuring it on first use"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=self.busy_timeout)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(f"PRAGMA busy_timeout={int(self.busy_timeout * 1000)}")
+            conn.execute("PRAGMA temp_store=MEMORY")
+            self._local.conn = conn
+            logger.debug(f"Opened cache connection for thread {threading.current_thread().name}")
+        return conn
+
+    def close(self):
+        """Close the calling thread's connection, if it has one"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            self.flush_access_times()
+            conn.close()
+            self._local.conn = None
+
+    def setup_database(self):
+        """Initialize SQLite database with enhanced caching"""
+        try:
+            with self._connection() as conn:
+                conn.execute("""
+                    CREATE TABLE IF NOT EXISTS translations (
+                        chunk_hash TEXT PRIMARY KEY,
+                        original_text TEXT,
+                        translated_text TEXT,
+                        document_type TEXT,
+                        quality_score FLOAT,
+                        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+                        last_accessed DATETIME,
+                        content_hash TEXT,
+                        version TEXT
+                    )
+                """)
+                columns = {row[1] for row in conn.execute("PRAGMA table_info(translations)")}
+                for column in ('last_accessed DATETIME', 'content_hash TEXT', 'version TEXT'):
+                    if column.split()[0] not in columns:
+                        conn.execute(f"ALTER TABLE translations ADD COLUMN {column}")
+                # Rows written before versioned keys were keyed by the bare content hash
+                conn.execute(
+                    "UPDATE translations SET content_hash = chunk_hash, version = ? WHERE version IS NULL",
+                    (LEGACY_VERSION,)
+                )
+                conn.execute("CREATE INDEX IF NOT EXISTS idx_translations_content ON translations (content_hash)")
+                conn.execute("CREATE INDEX IF NOT EXISTS idx_translations_version ON translations (version)")
+                conn.execute(
+                    "CREATE INDEX IF NOT EXISTS idx_translations_access "
+                    "ON translations (COALESCE(last_accessed, timestamp))"
+                )
+                logger.debug(f"Database initialized at {self.db_path}")
+        except Exception as e:
+            logger.error(f"Database initialization failed: {str(e)}")
+            raise Exception(f"Failed to setup database: {str(e)}")
+
+    def _record(self, **increments):
+        with self._stats_lock:
+            for key, value in increments.items():
+                self._stats[key] += value
+
+    def get(self, chunk_hash: str) -> Optional[str]:
+        """Look up a single translation by chunk hash"""
+        return self.get_many([chunk_hash]).get(chunk_hash)
+
+    def get_many(self, chunk_hashes: Iterable[str]) -> Dict[str, str]:
+        """Look up many translations at once, returning only the hits
+
+        The in-memory tier is checked first; the remaining hashes are fetched
+        from SQLite in one query and promoted into memory. SQLite hits are
+        noted for a later last_accessed refresh, so eviction can favour
+        recently used rows.
+        """
+        hashes = list(dict.fromkeys(chunk_hashes))
+        if not hashes:
+            return {}
+
+        start = time.perf_counter()
+        found = {}
+        if self.memory is not None:
+            for chunk_hash in hashes:
+                value = self.memory.get(chunk_hash)
+                if value is not None:
+                    found[chunk_hash] = value
+        memory_hits = len(found)
+
+        remaining = [h for h in hashes if h not in found]
+        if remaining:
+            conn = self._connection()
+            disk_hits = []
+            for i in range(0, len(remaining), MAX_VARIABLES_PER_QUERY):
+                batch = remaining[i:i + MAX_VARIABLES_PER_QUERY]
+                placeholders = ",".join("?" * len(batch))
+                rows = conn.execute(
+                    f"SELECT chunk_hash, translated_text FROM translations WHERE chunk_hash IN ({placeholders})",
+                    batch
+                ).fetchall()
+                for chunk_hash, translated_text in rows:
+                    if translated_text and translated_text.strip():
+                        found[chunk_hash] = translated_text
+                        disk_hits.append(chunk_hash)
+                        if self.memory is not None:
+                            self.memory.put(chunk_hash, translated_text)
+            if disk_hits:
+                self._note_access(disk_hits)
+
+        self._record(
+            hits=len(found),
+            memory_hits=memory_hits,
+            misses=len(hashes) - len(found),
+            lookups=1,
+            lookup_seconds=time.perf_counter() - start
+        )
+        return found
+
+    def _note_access(self, chunk_hashes: List[str]):
+        """Queue a last_accessed refresh for rows served from SQLite, flushing if one is due"""
+        with self._stats_lock:
+            self._touched.update(chunk_hashes)
+            due = time.monotonic() - self._touched_at >= self.touch_interval
+        if due:
+            self.flush_access_times()
+
+    def _take_touched(self) -> List[str]:
+        with self._stats_lock:
+            touched = list(self._touched)
+            self._touched.clear()
+            self._touched_at = time.monotonic()
+        return touched
+
+    def _write_access_times(self, conn: sqlite3.Connection, chunk_hashes: List[str]):
+        for i in range(0, len(chunk_hashes), MAX_VARIABLES_PER_QUERY):
+            batch = chunk_hashes[i:i + MAX_VARIABLES_PER_QUERY]
+            placeholders = ",".join("?" * len(batch))
+            conn.execute(
+                f"UPDATE translations SET last_accessed = CURRENT_TIMESTAMP WHERE chunk_hash IN ({placeholders})",
+                batch
+            )
+
+    def flush_access_times(self):
+        """Write queued last_accessed refreshes now, without waiting if another connection is writing"""
+        touched = self._take_touched()
+        if not touched:
+            return
+        conn = self._connection()
+        conn.execute("PRAGMA busy_timeout=0")
+        try:
+            with conn:
+                self._write_access_times(conn, touched)
+        except sqlite3.OperationalError as e:
+            # Access times are advisory; keep them for the next write instead of waiting on the writer
+            logger.debug(f"Deferred cache access time update: {str(e)}")
+            with self._stats_lock:
+                self._touched.update(touched)
+        finally:
+            conn.execute(f"PRAGMA busy_timeout={int(self.busy_timeout * 1000)}")
+
+    def get_stale_many(self, content_hashes: Iterable[str], exclude_version: str) -> Dict[str, str]:
+        """Find translations of the same content cached under other versions
+
+        Returns the most recently written translation per content hash. Used
+        as a fallback while a new model, prompt or glossary version warms up.
+        """
+        hashes = list(dict.fromkeys(content_hashes))
+        found = {}
+        conn = self._connection()
+        for i in range(0, len(hashes), MAX_VARIABLES_PER_QUERY):
+            batch = hashes[i:i + MAX_VARIABLES_PER_QUERY]
+            placeholders = ",".join("?" * len(batch))
+            rows = conn.execute(
+                f"""SELECT content_hash, translated_text FROM translations
+                    WHERE content_hash IN ({placeholders}) AND version != ?
+                    ORDER BY timestamp""",
+                batch + [exclude_version]
+            ).fetchall()
+            for content_hash, translated_text in rows:
+                if translated_text and translated_text.strip():
+                    found[content_hash] = translated_text
+        self._record(stale_hits=len(found))
+        return found
+
+    def put(self, chunk_hash: str, content_hash: str, version: str, original_text: str,
+            translated_text: str, document_type: str = "general"):
+        """Store a single translation"""
+        self.put_many([(chunk_hash, content_hash, version, original_text, translated_text, document_type)])
+
+    def put_many(self, rows: List[Tuple[str, str, str, str, str, str]]):
+        """Store many (chunk_hash, content_hash, version, original, translation, document_type) rows in one transaction"""
+        if not rows:
+            return
+
+        start = time.perf_counter()
+        with self._connection() as conn:
+            conn.executemany(
+                """INSERT OR REPLACE INTO translations
+                (chunk_hash, content_hash, version, original_text, translated_text, document_type, last_accessed)
+                VALUES (?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)""",
+                rows
+            )
+            # Already holding the write lock, so queued access times go along
+            self._write_access_times(conn, self._take_touched())
+        if self.memory is not None:
+            for chunk_hash, _, _, _, translated_text, _ in rows:
+                self.memory.put(chunk_hash, translated_text)
+        self._record(writes=len(rows), write_batches=1, write_seconds=time.perf_counter() - start)
+
+        if any(limit is not None for limit in self.eviction_policy.values()):
+            with self._stats_lock:
+                self._writes_since_evict += len(rows)
+                due = self._writes_since_evict >= self.evict_every_writes
+                if due:
+                    self._writes_since_evict = 0
+            if due:
+                self.evict(**self.eviction_policy)
+
+    def evict(self, max_age_days: Optional[float] = None, max_idle_days: Optional[float] = None,
+              max_rows: Optional[int] = None, max_bytes: Optional[int] = None) -> int:
+        """Delete SQLite rows outside the given limits and return how many were removed
+
+        max_age_days drops rows created longer ago than that, max_idle_days
+        drops rows not read for that long, and max_rows / max_bytes keep only
+        the most recently used rows that fit within the cap.
+        """
+        last_used = "COALESCE(last_accessed, timestamp)"
+        deleted = 0
+        with self._connection() as conn:
+            # Recency must be up to date before rows are chosen by it
+            self._write_access_times(conn, self._take_touched())
+            if max_age_days is not None:
+                deleted += conn.execute(
+                    "DELETE FROM translations WHERE timestamp < datetime('now', ?)",
+                    (f'-{max_age_days} days',)
+                ).rowcount
+            if max_idle_days is not None:
+                deleted += conn.execute(
+                    f"DELETE FROM translations WHERE {last_used} < datetime('now', ?)",
+                    (f'-{max_idle_days} days',)
+                ).rowcount
+            if max_rows is not None:
+                deleted += conn.execute(
+                    f"""DELETE FROM translations WHERE chunk_hash NOT IN (
+                        SELECT chunk_hash FROM translations ORDER BY {last_used} DESC LIMIT ?
+                    )""",
+                    (max_rows,)
+                ).rowcount
+            if max_bytes is not None:
+                deleted += conn.execute(
+                    f"""DELETE FROM translations WHERE chunk_hash IN (
+                        SELECT chunk_hash FROM (
+                            SELECT chunk_hash, SUM(
+                                LENGTH(CAST(COALESCE(original_text, '') AS BLOB)) +
+                                LENGTH(CAST(COALESCE(translated_text, '') AS BLOB))
+                            ) OVER (ORDER BY {last_used} DESC, chunk_hash) AS running_bytes
+                            FROM translations
+                        ) WHERE running_bytes > ?
+                    )""",
+                    (max_bytes,)
+                ).rowcount
+        if deleted:
+            # The memory tier cannot tell which of its entries went, so it is refilled from SQLite
+            self.clear_memory()
+            logger.info(f"Evicted {deleted} cached translations from {self.db_path}")
+        return deleted
+
+    def versions(self) -> List[Dict]:
+        """List cached versions with their row counts and newest write time"""
+        rows = self._connection().execute(
+            """SELECT version, COUNT(*), MAX(timestamp) FROM translations
+               GROUP BY version ORDER BY MAX(timestamp) DESC"""
+        ).fetchall()
+        return [{'version': version, 'rows': count, 'latest': latest} for version, count, latest in rows]
+
+    def invalidate_version(self, version: str) -> int:
+        """Delete every translation cached under a version and return how many were removed"""
+        with self._connection() as conn:
+            deleted = conn.execute("DELETE FROM translations WHERE version = ?", (version,)).rowcount
+        # Memory entries are keyed by versioned hash; dropping them all is simplest and cheap to refill
+        self.clear_memory()
+        logger.info(f"Invalidated {deleted} cached translations for version {version}")
+        return deleted
+
+    def vacuum(self):
+        """Checkpoint the WAL and rebuild the database file to reclaim space"""
+        conn = self._connection()
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        conn.execute("VACUUM")
+        logger.info(f"Vacuumed cache database {self.db_path}")
+
+    def clear_memory(self):
+        """Drop every entry from the in-memory tier"""
+        if self.memory is not None:
+            self.memory.clear()
+
+    def database_stats(self) -> Dict[str, int]:
+        """Row count and stored text size of the SQLite tier"""
+        row = self._connection().execute(
+            """SELECT COUNT(*),
+                      COALESCE(SUM(LENGTH(CAST(COALESCE(original_text, '') AS BLOB)) +
+                                   LENGTH(CAST(COALESCE(translated_text, '') AS BLOB))), 0)
+               FROM translations"""
+        ).fetchone()
+        return {'rows': row[0], 'text_bytes': row[1]}
+
+    def stats(self) -> Dict[str, float]:
+        """Return a snapshot of hit, miss and latency counters"""
+        with self._stats_lock:
+            stats = dict(self._stats)
+        requested = stats['hits'] + stats['misses']
+        stats['hit_ratio'] = stats['hits'] / requested if requested else 0.0
+        stats['avg_lookup_ms'] = stats['lookup_seconds'] / stats['lookups'] * 1000 if stats['lookups'] else 0.0
+        stats['avg_write_batch_ms'] = (
+            stats['write_seconds'] / stats['write_batches'] * 1000 if stats['write_batches'] else 0.0
+        )
+        if self.memory is not None:
+            stats['memory_entries'] = len(self.memory)
+            stats['memory_bytes'] = self.memory.size_bytes
+            stats['memory_evictions'] = self.memory.evictions
+        return stats
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain the SQLite translation cache")
+    parser.add_argument('--db', default='translations.db', help='path to the cache database')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    subparsers.add_parser('stats', help='show row count and stored size')
+
+    def add_limits(command):
+        command.add_argument('--max-age-days', type=float, help='drop rows created longer ago than this')
+        command.add_argument('--max-idle-days', type=float, help='drop rows not read for this long')
+        command.add_argument('--max-rows', type=int, help='keep only the most recently used N rows')
+        command.add_argument('--max-bytes', type=int, help='keep only the most recently used rows within this size')
+
+    add_limits(subparsers.add_parser('evict', help='delete rows outside the given limits'))
+    subparsers.add_parser('vacuum', help='checkpoint the WAL and reclaim free space')
+    add_limits(subparsers.add_parser('compact', help='evict, then vacuum'))
+    subparsers.add_parser('versions', help='list cached model/prompt/glossary versions')
+    invalidate = subparsers.add_parser('invalidate', help='delete all translations cached under a version')
+    invalidate.add_argument('version')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(levelname)s:%(name)s:%(message)s')
+    cache = TranslationCache(args.db, memory_entries=0)
+
+    if args.command in ('evict', 'compact'):
+        deleted = cache.evict(args.max_age_days, args.max_idle_days, args.max_rows, args.max_bytes)
+        print(f"Evicted {deleted} rows")
+    if args.command in ('vacuum', 'compact'):
+        cache.vacuum()
+    if args.command == 'versions':
+        for version in cache.versions():
+            print(json.dumps(version))
+        return
+    if args.command == 'invalidate':
+        print(f"Invalidated {cache.invalidate_version(args.version)} rows")
+    print(json.dumps(cache.database_stats()))
+
+if __name__ == '__main__':
+    main()
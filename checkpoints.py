@@ -0,0 +1,307 @@
+# checkpoints.py
+from typing import Optional, Dict, List, Iterable, Iterator
+import sqlite3
+import logging
+import hashlib
+import json
+from text_processor import TextProcessor, TextChunk
+
+logger = logging.getLogger(__name__)
+
+PENDING = 'pending'
+TRANSLATED = 'translated'
+FAILED = 'failed'
+
+# A document still being chunked whose checkpoint has not changed for this long was abandoned
+CHUNKING_STALE_SECONDS = 600
+
+def file_sha256(path: str, block_size: int = 1 << 20) -> str:
+    """Hex SHA-256 of a file's contents, read in blocks"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def chunking_settings(text_processor: TextProcessor) -> Dict:
+    """Settings that determine how a PDF is split into chunks"""
+    return {
+        'budget': text_processor.chunk_budget,
+        'tokens': text_processor.measure is not len,
+        'skip_non_chinese_pages': text_processor.skip_non_chinese_pages,
+    }
+
+class CheckpointStore:
+    """SQLite record of each document's chunks and which of them are translated
+
+    Documents are keyed by the SHA-256 of the PDF plus the chunking settings,
+    so a re-upload of the same file, or a retry after a crash, picks up the
+    stored chunks instead of extracting the PDF again and only translates
+    chunks that are missing, failed or were translated under another cache
+    version.
+    """
+
+    def __init__(self, db_path: str = "checkpoints.db"):
+        self.db_path = db_path
+        self.setup_database()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def setup_database(self):
+        """Create the checkpoint tables if they do not exist"""
+        try:
+            with self._connect() as conn:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute("""
+                    CREATE TABLE IF NOT EXISTS documents (
+                        document_key TEXT PRIMARY KEY,
+                        file_hash TEXT NOT NULL,
+                        settings TEXT,
+                        total_chunks INTEGER,
+                        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                        updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                        completed_at DATETIME
+                    )
+                """)
+                conn.execute("""
+                    CREATE TABLE IF NOT EXISTS document_chunks (
+                        document_key TEXT NOT NULL,
+                        chunk_id INTEGER NOT NULL,
+                        sequence_number INTEGER NOT NULL,
+                        content TEXT NOT NULL,
+                        status TEXT NOT NULL,
+                        translation TEXT,
+                        version TEXT,
+                        error TEXT,
+                        updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                        PRIMARY KEY (document_key, chunk_id)
+                    )
+                """)
+                logger.debug(f"Checkpoint store initialized at {self.db_path}")
+        except Exception as e:
+            logger.error(f"Checkpoint store initialization failed: {str(e)}")
+            raise Exception(f"Failed to setup checkpoint store: {str(e)}")
+
+    def document_key(self, file_hash: str, text_processor: TextProcessor) -> str:
+        """Key for a PDF (by content hash) chunked with text_processor's settings"""
+        settings = json.dumps(chunking_settings(text_processor), sort_keys=True)
+        return f"{file_hash}:{hashlib.sha256(settings.encode('utf-8')).hexdigest()[:12]}"
+
+    def load_chunks(self, document_key: str, version: Optional[str] = None) -> Optional[List[TextChunk]]:
+        """Stored chunks of a document in order, or None if it has not been chunked yet
+
+        Chunks translated under the given cache version come back translated;
+        all others come back untranslated.
+        """
+        with self._connect() as conn:
+            document = conn.execute(
+                "SELECT total_chunks FROM documents WHERE document_key = ?", (document_key,)
+            ).fetchone()
+            if not document:
+                return None
+            rows = conn.execute(
+                """SELECT chunk_id, sequence_number, content, status, translation, version
+                   FROM document_chunks WHERE document_key = ? ORDER BY sequence_number""",
+                (document_key,)
+            ).fetchall()
+        if len(rows) != document['total_chunks']:
+            logger.warning(f"Checkpoint for {document_key} is incomplete, re-chunking")
+            return None
+
+        chunks = []
+        for row in rows:
+            chunk = TextChunk(id=row['chunk_id'], content=row['content'], sequence_number=row['sequence_number'])
+            if row['status'] == TRANSLATED and (version is None or row['version'] == version):
+                chunk.translation = row['translation']
+                chunk.is_translated = True
+            chunks.append(chunk)
+        return chunks
+
+    def save_chunks(self, document_key: str, file_hash: str, settings: Dict, chunks: List[TextChunk]) -> bool:
+        """Record a freshly chunked document, replacing any earlier checkpoint for it
+
+        Returns False, storing nothing, if another job is chunking the same document.
+        """
+        if not self.begin_document(document_key, file_hash, settings):
+            return False
+        self.add_chunks(document_key, chunks)
+        self.finish_chunking(document_key, len(chunks))
+        logger.debug(f"Checkpointed {len(chunks)} chunks for {document_key}")
+        return True
+
+    def begin_document(self, document_key: str, file_hash: str, settings: Dict) -> bool:
+        """Start a checkpoint whose chunks are added as they are produced, replacing any earlier one
+
+        The document counts as chunked (see is_chunked) only once
+        finish_chunking has been called. Returns False, changing nothing,
+        while another job is still adding chunks to the same document
+        (unless it has been idle for CHUNKING_STALE_SECONDS); the check and
+        the reset happen in one transaction, so two jobs never share a spool.
+        """
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                """SELECT total_chunks, updated_at > datetime('now', ?) AS active
+                   FROM documents WHERE document_key = ?""",
+                (f'-{CHUNKING_STALE_SECONDS} seconds', document_key)
+            ).fetchone()
+            if row and row['total_chunks'] is None and row['active']:
+                conn.rollback()
+                logger.debug(f"Checkpoint {document_key} is being chunked by another job")
+                return False
+            conn.execute("DELETE FROM document_chunks WHERE document_key = ?", (document_key,))
+            conn.execute(
+                """INSERT OR REPLACE INTO documents (document_key, file_hash, settings, total_chunks)
+                   VALUES (?, ?, ?, NULL)""",
+                (document_key, file_hash, json.dumps(settings, sort_keys=True))
+            )
+            conn.commit()
+            return True
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    def add_chunks(self, document_key: str, chunks: Iterable[TextChunk]):
+        """Add untranslated chunks to a document started with begin_document"""
+        rows = [(document_key, chunk.id, chunk.sequence_number, chunk.content, PENDING) for chunk in chunks]
+        if not rows:
+            return
+        with self._connect() as conn:
+            conn.executemany(
+                """INSERT INTO document_chunks (document_key, chunk_id, sequence_number, content, status)
+                   VALUES (?, ?, ?, ?, ?)""",
+                rows
+            )
+            # Keeps the document claimed while it is being chunked (see begin_document)
+            conn.execute(
+                "UPDATE documents SET updated_at = CURRENT_TIMESTAMP WHERE document_key = ?", (document_key,)
+            )
+
+    def finish_chunking(self, document_key: str, total_chunks: int):
+        """Record that all total_chunks chunks of a document have been added"""
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE documents SET total_chunks = ?, updated_at = CURRENT_TIMESTAMP WHERE document_key = ?",
+                (total_chunks, document_key)
+            )
+
+    def is_chunked(self, document_key: str) -> bool:
+        """Whether every chunk of a document has been stored"""
+        with self._connect() as conn:
+            row = conn.execute(
+                """SELECT d.total_chunks AS total,
+                          (SELECT COUNT(*) FROM document_chunks c WHERE c.document_key = d.document_key) AS stored
+                   FROM documents d WHERE d.document_key = ?""",
+                (document_key,)
+            ).fetchone()
+        return bool(row) and row['total'] is not None and row['total'] == row['stored']
+
+    def iter_chunks(self, document_key: str, version: Optional[str] = None, untranslated_only: bool = False,
+                    page_size: int = 256) -> Iterator[TextChunk]:
+        """Stream a document's stored chunks in order, page_size rows at a time
+
+        Translated status follows load_chunks. Failed chunks carry their
+        error as the translation, as TranslationManager leaves them. Each
+        page is read on a fresh connection, so chunks can be recorded while
+        iterating without holding a long read transaction open.
+        """
+        last = -1
+        while True:
+            with self._connect() as conn:
+                rows = conn.execute(
+                    """SELECT chunk_id, sequence_number, content, status, translation, version, error
+                       FROM document_chunks WHERE document_key = ? AND sequence_number > ?
+                       ORDER BY sequence_number LIMIT ?""",
+                    (document_key, last, page_size)
+                ).fetchall()
+            if not rows:
+                return
+            for row in rows:
+                translated = row['status'] == TRANSLATED and (version is None or row['version'] == version)
+                if untranslated_only and translated:
+                    continue
+                yield TextChunk(
+                    id=row['chunk_id'],
+                    content=row['content'],
+                    is_translated=translated,
+                    translation=(row['translation'] if translated else row['error']) or "",
+                    sequence_number=row['sequence_number'],
+                )
+            last = rows[-1]['sequence_number']
+
+    def record_chunks(self, document_key: str, chunks: Iterable[TextChunk], version: str):
+        """Store the outcome of translated or failed chunks"""
+        rows = [
+            (TRANSLATED if chunk.is_translated else FAILED,
+             chunk.translation if chunk.is_translated else None,
+             version if chunk.is_translated else None,
+             None if chunk.is_translated else chunk.translation,
+             document_key, chunk.id)
+            for chunk in chunks
+        ]
+        if not rows:
+            return
+        with self._connect() as conn:
+            conn.executemany(
+                """UPDATE document_chunks SET status = ?, translation = ?, version = ?, error = ?,
+                          updated_at = CURRENT_TIMESTAMP
+                   WHERE document_key = ? AND chunk_id = ?""",
+                rows
+            )
+            conn.execute(
+                "UPDATE documents SET updated_at = CURRENT_TIMESTAMP WHERE document_key = ?", (document_key,)
+            )
+
+    def mark_complete(self, document_key: str):
+        """Note that a document was reassembled with every chunk accounted for"""
+        with self._connect() as conn:
+            conn.execute(
+                """UPDATE documents SET completed_at = CURRENT_TIMESTAMP, updated_at = CURRENT_TIMESTAMP
+                   WHERE document_key = ?""",
+                (document_key,)
+            )
+
+    def progress(self, document_key: str, version: Optional[str] = None) -> Optional[Dict[str, int]]:
+        """Chunk counts by status for a document, or None if unknown
+
+        With a version, chunks translated under any other version count as pending.
+        """
+        with self._connect() as conn:
+            rows = conn.execute(
+                """SELECT status, version IS ? AS current, COUNT(*) AS count FROM document_chunks
+                   WHERE document_key = ? GROUP BY status, current""",
+                (version, document_key)
+            ).fetchall()
+        if not rows:
+            return None
+        counts = {PENDING: 0, TRANSLATED: 0, FAILED: 0}
+        for row in rows:
+            stale = version is not None and row['status'] == TRANSLATED and not row['current']
+            counts[PENDING if stale else row['status']] += row['count']
+        return counts
+
+    def delete_document(self, document_key: str):
+        """Remove a document's checkpoint"""
+        with self._connect() as conn:
+            conn.execute("DELETE FROM document_chunks WHERE document_key = ?", (document_key,))
+            conn.execute("DELETE FROM documents WHERE document_key = ?", (document_key,))
+
+    def purge(self, max_age_days: float) -> int:
+        """Delete checkpoints not touched for max_age_days and return how many documents went"""
+        with self._connect() as conn:
+            keys = [row['document_key'] for row in conn.execute(
+                "SELECT document_key FROM documents WHERE updated_at < datetime('now', ?)",
+                (f'-{max_age_days} days',)
+            ).fetchall()]
+            for key in keys:
+                conn.execute("DELETE FROM document_chunks WHERE document_key = ?", (key,))
+                conn.execute("DELETE FROM documents WHERE document_key = ?", (key,))
+        if keys:
+            logger.info(f"Purged {len(keys)} document checkpoints older than {max_age_days} days")
+        return len(keys)
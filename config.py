@@ -0,0 +1,129 @@
+# config.py
+"""Settings for the web app, from defaults, an optional JSON file and the environment"""
+from typing import Dict, List, Mapping, Optional, Union, get_type_hints
+from dataclasses import dataclass, field, fields
+import json
+import logging
+import os
+from backends import DEFAULT_MODEL, ROUTING_POLICIES, LEAST_OUTSTANDING
+from translation_manager import STRATEGIES, TWO_PASS
+
+logger = logging.getLogger(__name__)
+
+ENV_PREFIX = 'TRANSLATOR_'
+# Path of a JSON settings file, read before the environment
+CONFIG_FILE_VAR = 'TRANSLATOR_CONFIG'
+# Older variable names from the README's .env example, used when the TRANSLATOR_ ones are unset
+LEGACY_ENV = {'OLLAMA_MODEL': 'model', 'OLLAMA_TIMEOUT': 'request_timeout'}
+
+@dataclass
+class AppConfig:
+    """Web app settings
+
+    The worker and the batch CLI start from the same settings, with their
+    command-line options (named after the fields) on top, so every process
+    chunks and translates the same way.
+    """
+    model: str = DEFAULT_MODEL
+    # Ollama server URLs; empty means $OLLAMA_HOST or the local default
+    ollama_host: List[str] = field(default_factory=list)
+    routing: str = LEAST_OUTSTANDING
+    request_timeout: float = 300.0
+    retries: int = 2
+    # Chunks of one document translated in parallel
+    chunk_workers: int = 4
+    # Token budget per chunk; None uses the model profile's target
+    chunk_tokens: Optional[int] = None
+    batch_tokens: Optional[int] = None
+    strategy: str = TWO_PASS
+    sentence_memory: bool = False
+    skip_non_chinese_pages: bool = False
+    glossary: List[str] = field(default_factory=list)
+    translations_db: str = 'translations.db'
+    jobs_db: str = 'jobs.db'
+    upload_folder: str = 'uploads'
+    max_upload_mb: float = 16
+    # /upload/stream translations one process runs at once; more get a 503
+    stream_concurrency: int = 4
+    log_level: str = 'INFO'
+    # Background probes behind /status; a deep check also warms the model, 0 disables it
+    health_interval: float = 10.0
+    health_timeout: float = 3.0
+    deep_health_interval: float = 300.0
+    deep_health_timeout: float = 60.0
+
+    def validate(self) -> 'AppConfig':
+        if self.routing not in ROUTING_POLICIES:
+            raise ValueError(f"Unknown routing policy {self.routing!r}, expected one of {ROUTING_POLICIES}")
+        if self.strategy not in STRATEGIES:
+            raise ValueError(f"Unknown translation strategy {self.strategy!r}, expected one of {STRATEGIES}")
+        for name in ('chunk_workers', 'stream_concurrency', 'max_upload_mb', 'request_timeout',
+                     'health_interval', 'health_timeout', 'deep_health_timeout'):
+            if getattr(self, name) <= 0:
+                raise ValueError(f"{name} must be positive")
+        if not isinstance(logging.getLevelName(self.log_level.upper()), int):
+            raise ValueError(f"Unknown log level {self.log_level!r}")
+        if self.deep_health_interval < 0:
+            raise ValueError("deep_health_interval must not be negative")
+        return self
+
+def _parse(value: str, kind):
+    """Convert an environment string to a field's type"""
+    if getattr(kind, '__origin__', None) is Union:
+        kind = next(arg for arg in kind.__args__ if arg is not type(None))
+        if value.strip().lower() in ('', 'none'):
+            return None
+    if kind is bool:
+        if value.strip().lower() in ('1', 'true', 'yes', 'on'):
+            return True
+        if value.strip().lower() in ('0', 'false', 'no', 'off', ''):
+            return False
+        raise ValueError(f"Expected a boolean, got {value!r}")
+    if getattr(kind, '__origin__', None) is list:
+        return [item.strip() for item in value.split(',') if item.strip()]
+    return kind(value)
+
+def config_from_file(path: str) -> Dict:
+    """Settings from a JSON object keyed by AppConfig field names"""
+    try:
+        with open(path, encoding='utf-8') as f:
+            settings = json.load(f)
+    except (OSError, ValueError) as e:
+        raise ValueError(f"Failed to read config file {path}: {str(e)}")
+    if not isinstance(settings, dict):
+        raise ValueError(f"Config file {path} must hold a JSON object")
+    unknown = set(settings).difference(f.name for f in fields(AppConfig))
+    if unknown:
+        raise ValueError(f"Unknown settings in {path}: {', '.join(sorted(unknown))}")
+    return settings
+
+def config_from_env(environ: Mapping[str, str]) -> Dict:
+    """Settings from TRANSLATOR_<FIELD> variables (lists comma-separated), plus the legacy names"""
+    hints = get_type_hints(AppConfig)
+    settings = {}
+    for variable, name in LEGACY_ENV.items():
+        if variable in environ:
+            settings[name] = environ[variable]
+    for f in fields(AppConfig):
+        variable = ENV_PREFIX + f.name.upper()
+        if variable in environ:
+            settings[f.name] = environ[variable]
+    try:
+        return {name: _parse(value, hints[name]) for name, value in settings.items()}
+    except ValueError as e:
+        raise ValueError(f"Invalid environment setting: {str(e)}")
+
+def load_config(path: Optional[str] = None, environ: Optional[Mapping[str, str]] = None,
+                **overrides) -> AppConfig:
+    """Build an AppConfig from defaults, then a JSON file, then the environment, then overrides
+
+    The file is path, or $TRANSLATOR_CONFIG if path is not given.
+    """
+    environ = os.environ if environ is None else environ
+    settings = {}
+    path = path or environ.get(CONFIG_FILE_VAR)
+    if path:
+        settings.update(config_from_file(path))
+    settings.update(config_from_env(environ))
+    settings.update(overrides)
+    return AppConfig(**settings).validate()
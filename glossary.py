@@ -0,0 +1,197 @@
+# glossary.py
+from typing import Dict, List, Optional, Tuple, Iterator, Iterable
+from collections import deque
+import threading
+import logging
+import json
+import csv
+import os
+import re
+
+logger = logging.getLogger(__name__)
+
+CJK_CHAR = re.compile(r'[一-鿿]')
+
+class _Automaton:
+    """Aho-Corasick automaton over a fixed set of terms"""
+
+    def __init__(self, terms: Iterable[str]):
+        self.goto = [{}]
+        self.fail = [0]
+        # Length of the term ending at each node (0 if none) and the nearest
+        # node on the failure chain that ends a term
+        self.length = [0]
+        self.output_link = [0]
+
+        for term in terms:
+            node = 0
+            for char in term:
+                nxt = self.goto[node].get(char)
+                if nxt is None:
+                    nxt = len(self.goto)
+                    self.goto[node][char] = nxt
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.length.append(0)
+                    self.output_link.append(0)
+                node = nxt
+            self.length[node] = len(term)
+
+        queue = deque(self.goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self.goto[node].items():
+                state = self.fail[node]
+                while state and char not in self.goto[state]:
+                    state = self.fail[state]
+                target = self.goto[state].get(char, 0)
+                self.fail[child] = target if target != child else 0
+                self.output_link[child] = target if self.length[target] else self.output_link[target]
+                queue.append(child)
+
+    def iter_matches(self, text: str) -> Iterator[Tuple[int, int]]:
+        """Yield (start, end) of every term occurrence, overlapping ones included"""
+        goto, fail, length, output_link = self.goto, self.fail, self.length, self.output_link
+        state = 0
+        for end, char in enumerate(text, 1):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            node = state if length[state] else output_link[state]
+            while node:
+                yield end - length[node], end
+                node = output_link[node]
+
+class Glossary:
+    """Chinese→English terminology with a compiled multi-term matcher
+
+    Lookups cost one pass over the text regardless of glossary size. When
+    terms overlap, the leftmost match wins, then the longest one.
+    """
+
+    def __init__(self, entries: Optional[Dict[str, str]] = None):
+        self._entries = {}
+        self._automaton = None
+        self._lock = threading.Lock()
+        if entries:
+            self.update(entries)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, term: str) -> bool:
+        return term in self._entries
+
+    def __getitem__(self, term: str) -> str:
+        return self._entries[term]
+
+    def items(self):
+        return self._entries.items()
+
+    def add(self, term: str, translation: str):
+        """Add or replace one entry"""
+        self.update({term: translation})
+
+    def update(self, entries: Dict[str, str]):
+        """Add or replace entries; the matcher is rebuilt on next use"""
+        with self._lock:
+            for term, translation in entries.items():
+                term, translation = term.strip(), translation.strip()
+                if term and translation:
+                    self._entries[term] = translation
+            self._automaton = None
+
+    def load(self, path: str) -> int:
+        """Load entries from a .csv, .tsv or .json file and return how many were read
+
+        CSV and TSV files hold one term and its translation per row; a first
+        row without Chinese in the term column is treated as a header. JSON
+        files hold either an object mapping terms to translations or a list
+        of [term, translation] pairs.
+        """
+        extension = os.path.splitext(path)[1].lower()
+        try:
+            if extension in ('.csv', '.tsv'):
+                entries = self._read_delimited(path, '\t' if extension == '.tsv' else ',')
+            elif extension == '.json':
+                entries = self._read_json(path)
+            else:
+                raise ValueError(f"unsupported glossary format {extension!r}, expected .csv, .tsv or .json")
+        except (OSError, ValueError) as e:
+            raise ValueError(f"Failed to load glossary {path}: {str(e)}")
+
+        self.update(entries)
+        logger.info(f"Loaded {len(entries)} glossary entries from {path}")
+        return len(entries)
+
+    @staticmethod
+    def _read_delimited(path: str, delimiter: str) -> Dict[str, str]:
+        entries = {}
+        with open(path, newline='', encoding='utf-8-sig') as f:
+            for line_number, row in enumerate(csv.reader(f, delimiter=delimiter), 1):
+                if not row or not any(cell.strip() for cell in row):
+                    continue
+                if len(row) < 2:
+                    raise ValueError(f"line {line_number} has no translation column")
+                if line_number == 1 and not CJK_CHAR.search(row[0]):
+                    continue
+                entries[row[0]] = row[1]
+        return entries
+
+    @staticmethod
+    def _read_json(path: str) -> Dict[str, str]:
+        with open(path, encoding='utf-8-sig') as f:
+            data = json.load(f)
+        if isinstance(data, dict):
+            return {str(term): str(translation) for term, translation in data.items()}
+        if isinstance(data, list) and all(isinstance(pair, list) and len(pair) == 2 for pair in data):
+            return {str(term): str(translation) for term, translation in data}
+        raise ValueError("expected an object or a list of [term, translation] pairs")
+
+    def _matcher(self) -> Tuple[_Automaton, Dict[str, str]]:
+        with self._lock:
+            if self._automaton is None:
+                self._automaton = _Automaton(self._entries)
+                logger.debug(f"Built glossary matcher for {len(self._entries)} terms")
+            return self._automaton, self._entries
+
+    def find(self, text: str) -> List[Tuple[int, int, str]]:
+        """Return non-overlapping (start, end, term) matches, leftmost then longest first"""
+        if not self._entries or not text:
+            return []
+        automaton, _ = self._matcher()
+        longest = {}
+        for start, end in automaton.iter_matches(text):
+            if end > longest.get(start, 0):
+                longest[start] = end
+
+        matches = []
+        position = 0
+        for start in sorted(longest):
+            if start >= position:
+                position = longest[start]
+                matches.append((start, position, text[start:position]))
+        return matches
+
+    def relevant(self, text: str) -> Dict[str, str]:
+        """Entries whose terms occur in text, in order of first occurrence"""
+        entries = self._matcher()[1]
+        relevant = {}
+        for _, _, term in self.find(text):
+            relevant.setdefault(term, entries[term])
+        return relevant
+
+    def replace(self, text: str) -> str:
+        """Replace every matched term in text with its translation"""
+        matches = self.find(text)
+        if not matches:
+            return text
+        entries = self._matcher()[1]
+        parts = []
+        position = 0
+        for start, end, term in matches:
+            parts.append(text[position:start])
+            parts.append(entries[term])
+            position = end
+        parts.append(text[position:])
+        return ''.join(parts)
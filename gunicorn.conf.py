@@ -0,0 +1,23 @@
+# gunicorn.conf.py
+"""gunicorn settings for wsgi:app, overridable with GUNICORN_* environment variables
+
+Threaded workers keep /status and job polling responsive while other
+threads stream long translations; each worker takes at most
+stream_concurrency streams, so some threads are always free.
+"""
+import os
+from config import load_config
+
+_config = load_config()
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:5000')
+workers = int(os.getenv('GUNICORN_WORKERS', '2'))
+worker_class = 'gthread'
+threads = int(os.getenv('GUNICORN_THREADS', str(_config.stream_concurrency + 4)))
+# With gthread the timeout only bounds a worker's heartbeat, not a streaming request
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '120'))
+graceful_timeout = 30
+# Each worker builds its own model clients and connections (see app.AppState)
+preload_app = False
+accesslog = '-'
+loglevel = _config.log_level.lower()
@@ -0,0 +1,164 @@
+# health.py
+"""Background health checks of the model backend, so /status is answered from memory"""
+from typing import Callable, Dict, Optional
+from datetime import datetime, timezone
+import threading
+import logging
+import time
+from backends import TranslationBackend
+from metrics import METRICS
+
+logger = logging.getLogger(__name__)
+
+READY = 'ready'
+ERROR = 'error'
+STARTING = 'starting'
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat(timespec='seconds')
+
+class HealthMonitor:
+    """Probes a backend from daemon threads and caches the outcome
+
+    Every `interval` seconds the shallow check lists the server's models
+    and the ones loaded in memory, each request bounded by `timeout`, and
+    samples the queue depth with `queue_depth()` if given. Every
+    `deep_interval` seconds the deep check confirms the configured model
+    is present and answers a one-token request within `deep_timeout`,
+    which also loads it again if it had gone cold. snapshot() only reads
+    the cached results, so status requests never wait on the model server.
+    """
+
+    def __init__(self, backend: TranslationBackend, interval: float = 10.0, timeout: float = 3.0,
+                 deep_interval: Optional[float] = 300.0, deep_timeout: float = 60.0,
+                 queue_depth: Optional[Callable[[], Dict]] = None):
+        if interval <= 0 or timeout <= 0:
+            raise ValueError("Health check interval and timeout must be positive")
+        self.backend = backend
+        self.interval = interval
+        self.timeout = timeout
+        self.deep_interval = deep_interval
+        self.deep_timeout = deep_timeout
+        self.queue_depth = queue_depth
+        # A snapshot older than this means the checks themselves are stuck
+        self.stale_after = 3 * interval + 2 * timeout
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._shallow = None
+        self._deep = None
+        self._threads = []
+
+    def start(self) -> 'HealthMonitor':
+        """Run a first shallow check now, then keep checking in the background"""
+        self.check()
+        loops = [('health-check', self.check, self.interval, self.interval)]
+        if self.deep_interval:
+            # The deep check can take as long as a model load, so it gets its own thread
+            loops.append(('health-deep-check', self.check_deep, 0, self.deep_interval))
+        for name, check, delay, interval in loops:
+            thread = threading.Thread(target=self._loop, args=(check, delay, interval), name=name, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _loop(self, check: Callable[[], Dict], delay: float, interval: float):
+        if self._stop.wait(delay):
+            return
+        while True:
+            try:
+                check()
+            except Exception as e:
+                logger.error(f"Health check error: {str(e)}")
+            if self._stop.wait(interval):
+                return
+
+    def check(self) -> Dict:
+        """Probe the backend once with a short timeout and cache the result"""
+        model = self.backend.model
+        result = {'model': model, 'checked_at': _now(), 'model_loaded': None, 'models': []}
+        start = time.perf_counter()
+        try:
+            result['models'] = self.backend.list_models(timeout=self.timeout)
+            result['latency_ms'] = (time.perf_counter() - start) * 1000
+            result['online'] = True
+            result['model_available'] = model in result['models']
+            try:
+                result['model_loaded'] = model in self.backend.loaded_models(timeout=self.timeout)
+            except Exception as e:
+                # Older servers have no /api/ps; whether the model is warm is then unknown
+                logger.debug(f"Loaded model check failed: {str(e)}")
+            if result['model_available']:
+                result['status'] = READY
+            else:
+                result.update(status=ERROR, error=f"Model {model} is not available on {self.backend.host}")
+        except Exception as e:
+            result.update(status=ERROR, online=False, model_available=False, error=str(e),
+                          latency_ms=(time.perf_counter() - start) * 1000)
+        if self.queue_depth is not None:
+            try:
+                result['queue'] = self.queue_depth()
+            except Exception as e:
+                logger.error(f"Queue depth check failed: {str(e)}")
+
+        if result['status'] != READY:
+            logger.warning(f"Health check failed: {result['error']}")
+        METRICS.set_gauge('backend_up', 1 if result['online'] else 0,
+                          help='Whether the last health check reached the model server')
+        METRICS.set_gauge('model_loaded', 1 if result['model_loaded'] else 0,
+                          help='Whether the configured model was loaded in memory at the last health check')
+        with self._lock:
+            self._shallow = (time.monotonic(), result)
+        return result
+
+    def check_deep(self) -> Dict:
+        """Confirm the configured model is present and answers, warming it if needed"""
+        model = self.backend.model
+        result = {'model': model, 'checked_at': _now()}
+        try:
+            if model not in self.backend.list_models(timeout=self.timeout):
+                raise Exception(f"Model {model} is not available on {self.backend.host}")
+            try:
+                result['was_loaded'] = model in self.backend.loaded_models(timeout=self.timeout)
+            except Exception:
+                result['was_loaded'] = None
+            result['reply_ms'] = self.backend.warm_up(timeout=self.deep_timeout) * 1000
+            result['status'] = READY
+        except Exception as e:
+            result.update(status=ERROR, error=str(e))
+            logger.warning(f"Deep health check failed: {str(e)}")
+        with self._lock:
+            self._deep = (time.monotonic(), result)
+        return result
+
+    def snapshot(self, deep: bool = False) -> Dict:
+        """The cached health, plus the last deep check if deep; never contacts the backend
+
+        status is 'ready' only when the last shallow check (and with deep,
+        the last deep check) passed and is recent.
+        """
+        with self._lock:
+            shallow, deep_result = self._shallow, self._deep
+        now = time.monotonic()
+        if shallow is None:
+            snapshot = {'status': STARTING, 'model': self.backend.model, 'online': False,
+                        'model_available': False, 'model_loaded': None}
+        else:
+            checked, result = shallow
+            snapshot = dict(result, age_seconds=now - checked)
+            if snapshot['age_seconds'] > self.stale_after and snapshot['status'] == READY:
+                snapshot.update(status=ERROR, error=f"No health check for {snapshot['age_seconds']:.0f}s")
+        if deep:
+            if deep_result is None:
+                snapshot['deep'] = {'status': STARTING if self.deep_interval else ERROR}
+                if not self.deep_interval:
+                    snapshot['deep']['error'] = 'Deep health checks are disabled'
+            else:
+                checked, result = deep_result
+                snapshot['deep'] = dict(result, age_seconds=now - checked)
+            if snapshot['status'] == READY and snapshot['deep']['status'] != READY:
+                snapshot['status'] = snapshot['deep']['status']
+                snapshot.setdefault('error', snapshot['deep'].get('error', 'Deep health check has not run yet'))
+        return snapshot
@@ -0,0 +1,319 @@
+# job_queue.py
+from typing import Optional, Dict, List, Tuple
+import sqlite3
+import os
+import logging
+import uuid
+import json
+
+logger = logging.getLogger(__name__)
+
+QUEUED = 'queued'
+RUNNING = 'running'
+COMPLETED = 'completed'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+
+FINISHED_STATES = (COMPLETED, FAILED, CANCELLED)
+
+class JobQueue:
+    """SQLite-backed queue of translation jobs shared by the web app and workers"""
+
+    def __init__(self, db_path: str = "jobs.db"):
+        self.db_path = db_path
+        self.setup_database()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def setup_database(self):
+        """Create the jobs table if it does not exist"""
+        try:
+            with self._connect() as conn:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute("""
+                    CREATE TABLE IF NOT EXISTS jobs (
+                        job_id TEXT PRIMARY KEY,
+                        filename TEXT,
+                        file_path TEXT,
+                        status TEXT NOT NULL,
+                        progress FLOAT DEFAULT 0,
+                        error TEXT,
+                        result TEXT,
+                        worker_id TEXT,
+                        cancel_requested INTEGER DEFAULT 0,
+                        trace INTEGER DEFAULT 0,
+                        result_path TEXT,
+                        file_hash TEXT,
+                        requesters INTEGER DEFAULT 1,
+                        result_version TEXT,
+                        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                        started_at DATETIME,
+                        updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                        finished_at DATETIME
+                    )
+                """)
+                columns = {row[1] for row in conn.execute("PRAGMA table_info(jobs)")}
+                if 'trace' not in columns:
+                    conn.execute("ALTER TABLE jobs ADD COLUMN trace INTEGER DEFAULT 0")
+                if 'result_path' not in columns:
+                    conn.execute("ALTER TABLE jobs ADD COLUMN result_path TEXT")
+                if 'file_hash' not in columns:
+                    conn.execute("ALTER TABLE jobs ADD COLUMN file_hash TEXT")
+                if 'requesters' not in columns:
+                    conn.execute("ALTER TABLE jobs ADD COLUMN requesters INTEGER DEFAULT 1")
+                if 'result_version' not in columns:
+                    conn.execute("ALTER TABLE jobs ADD COLUMN result_version TEXT")
+                conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, created_at)")
+                conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_file_hash ON jobs (file_hash, created_at)")
+                logger.debug(f"Job queue initialized at {self.db_path}")
+        except Exception as e:
+            logger.error(f"Job queue initialization failed: {str(e)}")
+            raise Exception(f"Failed to setup job queue: {str(e)}")
+
+    def enqueue(self, file_path: str, filename: str, job_id: Optional[str] = None,
+                trace: bool = False, file_hash: Optional[str] = None) -> str:
+        """Add a job for an uploaded file and return its job ID
+
+        With trace, the worker stores per-stage timings with the result.
+        file_hash (the SHA-256 of the PDF) lets enqueue_deduplicated find the job later.
+        """
+        job_id = job_id or uuid.uuid4().hex
+        with self._connect() as conn:
+            self._insert(conn, job_id, file_path, filename, trace, file_hash)
+        logger.debug(f"Enqueued job {job_id} for {filename}")
+        return job_id
+
+    def enqueue_deduplicated(self, file_path: str, filename: str, file_hash: str,
+                             job_id: Optional[str] = None,
+                             result_version: Optional[str] = None) -> Tuple[str, bool]:
+        """Reuse a job for the same PDF if there is one, else enqueue a new one
+
+        Returns (job_id, created). A queued or running job for the same
+        file_hash is shared with this request. So is a completed job whose
+        result is still stored and was produced under result_version (see
+        pipeline.result_version), so results from an older model, prompts,
+        glossary or chunking are not served. Jobs that failed, were
+        cancelled or are being cancelled are never reused. Checking and
+        inserting happen in one transaction, so simultaneous uploads of a
+        PDF share a job.
+        """
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            rows = conn.execute(
+                """SELECT job_id, status, result IS NOT NULL AS has_result, result_path, result_version FROM jobs
+                   WHERE file_hash = ? AND (status IN (?, ?) AND cancel_requested = 0 OR status = ?)
+                   ORDER BY created_at DESC, rowid DESC""",
+                (file_hash, QUEUED, RUNNING, COMPLETED)
+            ).fetchall()
+            for row in rows:
+                if row['status'] == COMPLETED:
+                    if result_version is None or row['result_version'] != result_version:
+                        logger.info(f"Upload of {filename} matches completed job {row['job_id']}, but its result "
+                                    f"was produced under different settings ({row['result_version']} instead of "
+                                    f"{result_version}); not reusing it")
+                        continue
+                    if row['has_result'] or (row['result_path'] and os.path.exists(row['result_path'])):
+                        conn.commit()
+                        logger.debug(f"Upload of {filename} matches completed job {row['job_id']}")
+                        return row['job_id'], False
+                    continue
+                conn.execute(
+                    """UPDATE jobs SET requesters = requesters + 1, updated_at = CURRENT_TIMESTAMP
+                       WHERE job_id = ?""",
+                    (row['job_id'],)
+                )
+                conn.commit()
+                logger.debug(f"Upload of {filename} attached to {row['status']} job {row['job_id']}")
+                return row['job_id'], False
+
+            job_id = job_id or uuid.uuid4().hex
+            self._insert(conn, job_id, file_path, filename, False, file_hash)
+            conn.commit()
+            logger.debug(f"Enqueued job {job_id} for {filename}")
+            return job_id, True
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    def _insert(self, conn: sqlite3.Connection, job_id: str, file_path: str, filename: str,
+                trace: bool, file_hash: Optional[str]):
+        conn.execute(
+            """INSERT INTO jobs (job_id, filename, file_path, status, trace, file_hash)
+               VALUES (?, ?, ?, ?, ?, ?)""",
+            (job_id, filename, file_path, QUEUED, int(trace), file_hash)
+        )
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        """Return the job's status fields (without the result), or None if unknown"""
+        with self._connect() as conn:
+            row = conn.execute(
+                """SELECT job_id, filename, status, progress, error, cancel_requested, requesters,
+                          created_at, started_at, updated_at, finished_at
+                   FROM jobs WHERE job_id = ?""",
+                (job_id,)
+            ).fetchone()
+        if not row:
+            return None
+        job = dict(row)
+        job['cancel_requested'] = bool(job['cancel_requested'])
+        return job
+
+    def get_result(self, job_id: str) -> Optional[Dict]:
+        """Return the stored translation result of a completed job"""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT result FROM jobs WHERE job_id = ? AND status = ?",
+                (job_id, COMPLETED)
+            ).fetchone()
+        return json.loads(row['result']) if row and row['result'] else None
+
+    def get_result_path(self, job_id: str) -> Optional[str]:
+        """Return the file holding a completed job's result, if it was stored on disk"""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT result_path FROM jobs WHERE job_id = ? AND status = ?",
+                (job_id, COMPLETED)
+            ).fetchone()
+        return row['result_path'] if row else None
+
+    def pending_counts(self) -> Dict[str, int]:
+        """Number of queued and running jobs"""
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT status, COUNT(*) AS count FROM jobs WHERE status IN (?, ?) GROUP BY status",
+                (QUEUED, RUNNING)
+            ).fetchall()
+        counts = {QUEUED: 0, RUNNING: 0}
+        counts.update({row['status']: row['count'] for row in rows})
+        return counts
+
+    def claim_next(self, worker_id: str) -> Optional[Dict]:
+        """Atomically move the oldest queued job to running and return it"""
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                """SELECT job_id, filename, file_path, trace, file_hash FROM jobs
+                   WHERE status = ? ORDER BY created_at, rowid LIMIT 1""",
+                (QUEUED,)
+            ).fetchone()
+            if not row:
+                conn.rollback()
+                return None
+            conn.execute(
+                """UPDATE jobs SET status = ?, worker_id = ?, progress = 0,
+                          started_at = CURRENT_TIMESTAMP, updated_at = CURRENT_TIMESTAMP
+                   WHERE job_id = ?""",
+                (RUNNING, worker_id, row['job_id'])
+            )
+            conn.commit()
+            logger.debug(f"Worker {worker_id} claimed job {row['job_id']}")
+            job = dict(row)
+            job['trace'] = bool(job['trace'])
+            return job
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    def update_progress(self, job_id: str, progress: float):
+        """Record progress for a running job, which also acts as its heartbeat"""
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET progress = ?, updated_at = CURRENT_TIMESTAMP WHERE job_id = ? AND status = ?",
+                (progress, job_id, RUNNING)
+            )
+
+    def complete(self, job_id: str, result: Optional[Dict] = None, result_path: Optional[str] = None,
+                 result_version: Optional[str] = None):
+        """Store the result of a finished job, or the path of the file it was written to
+
+        result_version records the settings it was produced under, for enqueue_deduplicated.
+        """
+        self._finish(job_id, COMPLETED, result=json.dumps(result, ensure_ascii=False) if result is not None else None,
+                     progress=100, result_path=result_path, result_version=result_version)
+
+    def fail(self, job_id: str, error: str):
+        """Mark a job as failed with an error message"""
+        self._finish(job_id, FAILED, error=error)
+
+    def mark_cancelled(self, job_id: str):
+        """Mark a running job as cancelled once its worker has stopped it"""
+        self._finish(job_id, CANCELLED)
+
+    def _finish(self, job_id: str, status: str, result: Optional[str] = None,
+                error: Optional[str] = None, progress: Optional[float] = None,
+                result_path: Optional[str] = None, result_version: Optional[str] = None):
+        with self._connect() as conn:
+            conn.execute(
+                """UPDATE jobs SET status = ?, result = ?, result_path = ?, result_version = ?, error = ?,
+                          progress = COALESCE(?, progress),
+                          updated_at = CURRENT_TIMESTAMP, finished_at = CURRENT_TIMESTAMP
+                   WHERE job_id = ?""",
+                (status, result, result_path, result_version, error, progress, job_id)
+            )
+        logger.debug(f"Job {job_id} finished with status {status}")
+
+    def cancel(self, job_id: str) -> Optional[str]:
+        """Request cancellation of a job and return its resulting status
+
+        Queued jobs are cancelled immediately; running jobs are flagged and
+        stopped by their worker at the next chunk boundary. A job shared by
+        several uploads of the same PDF only drops one requester and keeps
+        going until the last one cancels. Returns None if the job does not
+        exist.
+        """
+        with self._connect() as conn:
+            shared = conn.execute(
+                """UPDATE jobs SET requesters = requesters - 1, updated_at = CURRENT_TIMESTAMP
+                   WHERE job_id = ? AND status IN (?, ?) AND requesters > 1""",
+                (job_id, QUEUED, RUNNING)
+            ).rowcount
+            if not shared:
+                conn.execute(
+                    """UPDATE jobs SET status = ?, updated_at = CURRENT_TIMESTAMP, finished_at = CURRENT_TIMESTAMP
+                       WHERE job_id = ? AND status = ?""",
+                    (CANCELLED, job_id, QUEUED)
+                )
+                conn.execute(
+                    "UPDATE jobs SET cancel_requested = 1, updated_at = CURRENT_TIMESTAMP WHERE job_id = ? AND status = ?",
+                    (job_id, RUNNING)
+                )
+            row = conn.execute("SELECT status FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return row['status'] if row else None
+
+    def is_cancel_requested(self, job_id: str) -> bool:
+        """Check whether cancellation has been requested for a job"""
+        with self._connect() as conn:
+            row = conn.execute("SELECT cancel_requested FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return bool(row and row['cancel_requested'])
+
+    def requeue_stale(self, stale_after: float) -> List[str]:
+        """Return running jobs with no heartbeat for stale_after seconds to the queue
+
+        This recovers jobs whose worker died, e.g. after a crash or restart.
+        """
+        with self._connect() as conn:
+            rows = conn.execute(
+                """SELECT job_id FROM jobs WHERE status = ?
+                   AND updated_at < datetime('now', ?)""",
+                (RUNNING, f'-{int(stale_after)} seconds')
+            ).fetchall()
+            job_ids = [row['job_id'] for row in rows]
+            for job_id in job_ids:
+                conn.execute(
+                    """UPDATE jobs SET status = CASE WHEN cancel_requested THEN ? ELSE ? END,
+                              worker_id = NULL, updated_at = CURRENT_TIMESTAMP
+                       WHERE job_id = ?""",
+                    (CANCELLED, QUEUED, job_id)
+                )
+        if job_ids:
+            logger.warning(f"Requeued {len(job_ids)} stale jobs: {job_ids}")
+        return job_ids
@@ -0,0 +1,258 @@
+# metrics.py
+"""Per-stage timings, counters and gauges in the Prometheus text format, plus per-request traces"""
+from typing import Callable, Dict, Iterable, Iterator, Optional, Tuple
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from contextlib import contextmanager
+from contextvars import ContextVar
+import functools
+import threading
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+NAMESPACE = 'translator'
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Upper bounds in seconds, from regex passes over a page up to slow model replies
+STAGE_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+# (name, type, help, labels, value) as returned by collectors
+Sample = Tuple[str, str, str, Dict[str, str], float]
+
+class Trace:
+    """Spans recorded while handling one request, across the threads it uses"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def add(self, stage: str, start: float, seconds: float, attributes: Dict):
+        with self._lock:
+            self.spans.append((stage, start, seconds, attributes))
+
+    def to_dict(self) -> Dict:
+        """Spans in start order with offsets in milliseconds, and totals per stage"""
+        with self._lock:
+            spans = sorted(self.spans, key=lambda span: span[1])
+        stages = {}
+        for stage, _, seconds, _ in spans:
+            totals = stages.setdefault(stage, {'count': 0, 'total_ms': 0.0})
+            totals['count'] += 1
+            totals['total_ms'] += seconds * 1000
+        return {
+            'total_ms': (time.perf_counter() - self.started) * 1000,
+            'stages': stages,
+            'spans': [
+                dict(attributes, stage=stage, start_ms=(start - self.started) * 1000, duration_ms=seconds * 1000)
+                for stage, start, seconds, attributes in spans
+            ],
+        }
+
+_current_trace: ContextVar[Optional[Trace]] = ContextVar('current_trace', default=None)
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in sorted(labels.items())) + '}'
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class MetricsRegistry:
+    """Thread-safe store of stage histograms, counters and gauges
+
+    Collectors registered with register_collector are called at scrape
+    time for values that live elsewhere, such as cache statistics.
+    """
+
+    def __init__(self, namespace: str = NAMESPACE, buckets: Tuple[float, ...] = STAGE_BUCKETS):
+        self.namespace = namespace
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._stages = {}
+        self._values = {}
+        self._metadata = {}
+        self._collectors = {}
+
+    def observe_stage(self, stage: str, seconds: float, failed: bool = False):
+        with self._lock:
+            histogram = self._stages.get(stage)
+            if histogram is None:
+                histogram = self._stages[stage] = {'buckets': [0] * len(self.buckets), 'count': 0, 'sum': 0.0}
+            for index, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    histogram['buckets'][index] += 1
+            histogram['count'] += 1
+            histogram['sum'] += seconds
+        if failed:
+            self.inc('stage_errors_total', help='Pipeline stages that raised', stage=stage)
+
+    def _update(self, kind: str, name: str, help: str, labels: Dict, value: float, add: bool):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._metadata.setdefault(name, (kind, help))
+            self._values[key] = self._values.get(key, 0) + value if add else value
+
+    def inc(self, name: str, value: float = 1, help: str = '', **labels):
+        """Add to a counter; name should end in _total"""
+        self._update('counter', name, help, labels, value, add=True)
+
+    def add_gauge(self, name: str, delta: float, help: str = '', **labels):
+        self._update('gauge', name, help, labels, delta, add=True)
+
+    def set_gauge(self, name: str, value: float, help: str = '', **labels):
+        self._update('gauge', name, help, labels, value, add=False)
+
+    def values(self, name: str) -> Dict[Tuple, float]:
+        """Current values of a counter or gauge, keyed by sorted (label, value) pairs"""
+        with self._lock:
+            return {labels: value for (metric, labels), value in self._values.items() if metric == name}
+
+    def register_collector(self, collector: Callable[[], Iterable[Sample]], name: Optional[str] = None):
+        """Add a collector; one registered under the same name is replaced"""
+        with self._lock:
+            self._collectors[name or object()] = collector
+
+    def stage_summary(self) -> Dict[str, Dict[str, float]]:
+        """Count, total and mean seconds per stage"""
+        with self._lock:
+            return {
+                stage: {'count': h['count'], 'seconds': h['sum'], 'mean_seconds': h['sum'] / h['count']}
+                for stage, h in self._stages.items() if h['count']
+            }
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format"""
+        prefix = f"{self.namespace}_"
+        lines = []
+        with self._lock:
+            stages = {stage: (list(h['buckets']), h['count'], h['sum']) for stage, h in self._stages.items()}
+            values = dict(self._values)
+            metadata = dict(self._metadata)
+            collectors = list(self._collectors.values())
+
+        name = f"{prefix}stage_seconds"
+        lines.append(f"# HELP {name} Time spent in each pipeline stage")
+        lines.append(f"# TYPE {name} histogram")
+        for stage, (buckets, count, total) in sorted(stages.items()):
+            for bound, bucket in zip(self.buckets, buckets):
+                lines.append(f"{name}_bucket{_format_labels({'stage': stage, 'le': _format_value(bound)})} {bucket}")
+            lines.append(f"{name}_bucket{_format_labels({'stage': stage, 'le': '+Inf'})} {count}")
+            lines.append(f"{name}_sum{_format_labels({'stage': stage})} {_format_value(total)}")
+            lines.append(f"{name}_count{_format_labels({'stage': stage})} {count}")
+
+        samples = [(name, metadata[name][0], metadata[name][1], dict(labels), value)
+                   for (name, labels), value in values.items()]
+        for collector in collectors:
+            try:
+                samples.extend(collector())
+            except Exception as e:
+                logger.error(f"Metrics collector failed: {str(e)}")
+
+        grouped = {}
+        for name, kind, help, labels, value in samples:
+            grouped.setdefault(name, (kind, help, []))[2].append((labels, value))
+        for name, (kind, help, series) in sorted(grouped.items()):
+            full_name = prefix + name
+            if help:
+                lines.append(f"# HELP {full_name} {help}")
+            lines.append(f"# TYPE {full_name} {kind}")
+            for labels, value in sorted(series, key=lambda item: sorted(item[0].items())):
+                lines.append(f"{full_name}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+# Process-wide registry used by span() and the /metrics endpoints
+METRICS = MetricsRegistry()
+
+@contextmanager
+def span(stage: str, **attributes) -> Iterator[None]:
+    """Time a block as `stage`, and record it on the current request's trace if there is one"""
+    start = time.perf_counter()
+    failed = False
+    try:
+        yield
+    except BaseException:
+        failed = True
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        METRICS.observe_stage(stage, elapsed, failed)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.add(stage, start, elapsed, dict(attributes, failed=True) if failed else attributes)
+
+def timed(stage: str):
+    """Decorator form of span() for functions and methods"""
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with span(stage):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+@contextmanager
+def tracing(enabled: bool = True, trace: Optional[Trace] = None) -> Iterator[Optional[Trace]]:
+    """Collect spans from this context into a Trace (a new one unless given) and yield it
+
+    With enabled False nothing is collected and None is yielded. Work handed
+    to other threads joins the trace when wrapped with in_context.
+    """
+    if not enabled:
+        yield None
+        return
+    trace = trace or Trace()
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+def in_context(function: Callable) -> Callable:
+    """Bind function to the caller's trace, so spans it records on another thread reach that trace"""
+    trace = _current_trace.get()
+    if trace is None:
+        return function
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        token = _current_trace.set(trace)
+        try:
+            return function(*args, **kwargs)
+        finally:
+            _current_trace.reset(token)
+    return wrapper
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        logger.debug(f"{self.address_string()} {format % args}")
+
+    def do_GET(self):
+        if self.path.split('?', 1)[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = self.server.registry.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+def serve_metrics(port: int, host: str = '0.0.0.0', registry: MetricsRegistry = METRICS) -> ThreadingHTTPServer:
+    """Serve registry on http://host:port/metrics from a daemon thread, for processes without Flask"""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.daemon_threads = True
+    server.registry = registry
+    threading.Thread(target=server.serve_forever, name='metrics-http', daemon=True).start()
+    logger.info(f"Serving metrics on http://{host}:{server.server_address[1]}/metrics")
+    return server
@@ -0,0 +1,221 @@
+# mock_ollama.py
+"""Deterministic stand-in for an Ollama server, for load tests and benchmarks without a GPU"""
+from typing import List, Optional, Tuple
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from datetime import datetime, timezone
+import argparse
+import hashlib
+import threading
+import logging
+import random
+import json
+import time
+import re
+
+logger = logging.getLogger(__name__)
+
+WORDS = (
+    "rights", "freedom", "dignity", "person", "nations", "equal", "justice", "peace",
+    "assembly", "member", "states", "education", "law", "protection", "society", "family",
+    "everyone", "shall", "be", "entitled", "to", "the", "of", "and", "in", "without",
+    "distinction", "respect", "promote", "universal", "declaration", "human",
+)
+
+CJK_CHAR = re.compile(r'[一-鿿]')
+NUMBERED_LINE = re.compile(r'^\s*\[(\d+)\]\s?(.*)$')
+# Headings that end the source text in the prompts sent by translation_manager
+SECTION_END = re.compile(r'\n\s*\n(?:TERMINOLOGY|CRITICAL REQUIREMENTS|REQUIREMENTS)')
+
+def fake_translation(source: str) -> str:
+    """English-looking text derived only from the source, about 3.5 characters per Chinese character"""
+    digest = hashlib.sha256(source.encode('utf-8')).digest()
+    count = max(2, len(CJK_CHAR.findall(source)) // 2 or len(source.split()))
+    words = [WORDS[digest[i % len(digest)] % len(WORDS)] for i in range(count)]
+    words[0] = words[0].capitalize()
+    return ' '.join(words) + '.'
+
+def _section(prompt: str, marker: str) -> Optional[str]:
+    if marker not in prompt:
+        return None
+    text = prompt.split(marker, 1)[1]
+    end = SECTION_END.search(text)
+    return (text[:end.start()] if end else text).strip()
+
+def reply_for(prompt: str) -> str:
+    """Answer a translate, refine or numbered-segments prompt the way the real model is asked to"""
+    segments = _section(prompt, 'SEGMENTS:')
+    if segments is not None:
+        lines = []
+        for line in segments.splitlines():
+            match = NUMBERED_LINE.match(line)
+            if match:
+                lines.append(f"[{match.group(1)}] {fake_translation(match.group(2))}")
+        return "\n".join(lines)
+
+    source = _section(prompt, 'SOURCE TEXT:')
+    if source is None and 'Original Chinese:' in prompt:
+        source = prompt.split('Original Chinese:', 1)[1].split('\nCurrent translation:', 1)[0].strip()
+    return fake_translation(source if source is not None else prompt)
+
+class MockOllamaServer(ThreadingHTTPServer):
+    """HTTP server speaking the subset of the Ollama API the translator uses
+
+    latency seconds (plus up to `jitter` more) are spent on every chat
+    request; with failure_rate, that share of chat requests fail with a 500.
+    parallel caps how many chat requests are processed at once, like
+    OLLAMA_NUM_PARALLEL on a real server; the rest wait their turn.
+    Replies depend only on the prompt; the seed fixes latency jitter and
+    which requests fail, for a given request order. A model shows up in
+    /api/ps once it has served a chat request, as if loaded on first use.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address: Tuple[str, int], models: Optional[List[str]] = None,
+                 latency: float = 0.0, jitter: float = 0.0, failure_rate: float = 0.0,
+                 seed: int = 0, parallel: Optional[int] = None):
+        super().__init__(address, MockOllamaHandler)
+        self.models = models or ['qwen2.5:7b']
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.slots = threading.BoundedSemaphore(parallel) if parallel else None
+        self.stats = {'requests': 0, 'failures': 0}
+        self.loaded = set()
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def next_request(self) -> Tuple[float, bool]:
+        """Delay and whether to fail, for the next chat request"""
+        with self._lock:
+            self.stats['requests'] += 1
+            delay = self.latency + self._random.uniform(0, self.jitter)
+            fail = self._random.random() < self.failure_rate
+            self.stats['failures'] += fail
+        return delay, fail
+
+class MockOllamaHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        logger.debug(f"{self.address_string()} {format % args}")
+
+    def _send_json(self, payload: dict, status: int = 200):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self) -> dict:
+        length = int(self.headers.get('Content-Length') or 0)
+        return json.loads(self.rfile.read(length) or b'{}')
+
+    def do_GET(self):
+        if self.path == '/api/tags':
+            self._send_json({'models': [
+                {'name': name, 'model': name, 'size': 0, 'modified_at': '1970-01-01T00:00:00Z'}
+                for name in self.server.models
+            ]})
+        elif self.path == '/api/ps':
+            self._send_json({'models': [
+                {'name': name, 'model': name, 'size': 0, 'size_vram': 0, 'expires_at': '2099-01-01T00:00:00Z'}
+                for name in sorted(self.server.loaded)
+            ]})
+        elif self.path in ('/', '/api/version'):
+            self._send_json({'version': 'mock'})
+        else:
+            self._send_json({'error': 'not found'}, 404)
+
+    def do_POST(self):
+        if self.path != '/api/chat':
+            self._send_json({'error': 'not found'}, 404)
+            return
+        request = self._read_json()
+        model = request.get('model')
+        if model not in self.server.models:
+            self._send_json({'error': f"model '{model}' not found, try pulling it first"}, 404)
+            return
+
+        self.server.loaded.add(model)
+        delay, fail = self.server.next_request()
+        if self.server.slots:
+            with self.server.slots:
+                time.sleep(delay)
+        else:
+            time.sleep(delay)
+        if fail:
+            self._send_json({'error': 'injected failure'}, 500)
+            return
+
+        content = reply_for(request['messages'][-1]['content'])
+        created_at = datetime.now(timezone.utc).isoformat()
+        if not request.get('stream'):
+            self._send_json({
+                'model': model,
+                'created_at': created_at,
+                'message': {'role': 'assistant', 'content': content},
+                'done': True,
+                'total_duration': int(delay * 1e9),
+                'eval_count': len(content.split()),
+            })
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-ndjson')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        pieces = [piece + ' ' for piece in content.split(' ')]
+        pieces[-1] = pieces[-1].rstrip()
+        for piece in pieces:
+            self._write_chunk({'model': model, 'created_at': created_at,
+                               'message': {'role': 'assistant', 'content': piece}, 'done': False})
+        self._write_chunk({'model': model, 'created_at': created_at,
+                           'message': {'role': 'assistant', 'content': ''}, 'done': True})
+        self.wfile.write(b'0\r\n\r\n')
+
+    def _write_chunk(self, payload: dict):
+        data = json.dumps(payload, ensure_ascii=False).encode('utf-8') + b'\n'
+        self.wfile.write(f"{len(data):x}\r\n".encode('ascii') + data + b'\r\n')
+
+def start_mock_server(host: str = '127.0.0.1', port: int = 0, **options) -> MockOllamaServer:
+    """Start a MockOllamaServer on a background thread; port 0 picks a free port"""
+    server = MockOllamaServer((host, port), **options)
+    threading.Thread(target=server.serve_forever, name='mock-ollama', daemon=True).start()
+    logger.info(f"Mock Ollama server listening on {server.url}")
+    return server
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a deterministic mock Ollama server")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=11435)
+    parser.add_argument('--model', action='append', dest='models',
+                        help='model name to serve (may be repeated; default qwen2.5:7b)')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds spent on every chat request')
+    parser.add_argument('--jitter', type=float, default=0.0, help='up to this many extra seconds per request')
+    parser.add_argument('--failure-rate', type=float, default=0.0, help='share of chat requests that fail with 500')
+    parser.add_argument('--parallel', type=int, default=None,
+                        help='chat requests processed at once (default: unlimited)')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(levelname)s:%(name)s:%(message)s')
+    server = MockOllamaServer((args.host, args.port), models=args.models, latency=args.latency,
+                              jitter=args.jitter, failure_rate=args.failure_rate, seed=args.seed,
+                              parallel=args.parallel)
+    logger.info(f"Mock Ollama server listening on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == '__main__':
+    main()
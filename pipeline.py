@@ -0,0 +1,440 @@
+# pipeline.py
+from typing import List, Optional, Callable, Iterator, Iterable, TextIO
+import os
+import json
+import logging
+import tempfile
+import uuid
+from dataclasses import asdict
+from text_processor import TextProcessor, TextChunk
+from translation_manager import TranslationManager, TranslationCancelled, RESULT_FIELDS, fingerprint
+from checkpoints import CheckpointStore, file_sha256, chunking_settings, TRANSLATED
+from metrics import span, current_trace
+
+logger = logging.getLogger(__name__)
+
+# Cleaned characters gathered before the language check when streaming pages
+LANGUAGE_SAMPLE_CHARS = 2000
+
+# Chunks written to the checkpoint store together when spooling a streamed document
+SPOOL_BATCH_CHUNKS = 16
+
+class ProcessingError(Exception):
+    """Pipeline failure carrying the JSON error payload and HTTP status to report"""
+
+    def __init__(self, error, details=None, status=400):
+        super().__init__(error)
+        self.error = error
+        self.details = details
+        self.status = status
+
+    def to_dict(self):
+        payload = {'error': self.error}
+        if self.details:
+            payload['details'] = self.details
+        return payload
+
+def result_version(text_processor: TextProcessor, translation_manager: TranslationManager) -> str:
+    """Fingerprint of everything that shapes a document's result: the cache version and the chunking"""
+    return fingerprint(translation_manager.cache_version, chunking_settings(text_processor))
+
+def extract_text(text_processor: TextProcessor, pdf_path: str) -> str:
+    """Extract raw text from a PDF, raising ProcessingError on failure"""
+    try:
+        logger.debug("Extracting text from PDF")
+        extracted_text = text_processor.extract_from_pdf(pdf_path)
+        logger.debug(f"Extracted text length: {len(extracted_text)}")
+
+        if not extracted_text.strip():
+            raise ValueError("No text could be extracted from the PDF")
+
+        return extracted_text
+    except Exception as e:
+        logger.error(f"Text extraction failed: {str(e)}")
+        raise ProcessingError(f'Failed to extract text from PDF: {str(e)}')
+
+def verify_chinese(text_processor: TextProcessor, cleaned_text: str):
+    """Raise ProcessingError unless the text is primarily Chinese"""
+    if not text_processor.is_chinese(cleaned_text):
+        logger.error("Text is not Chinese")
+        raise ProcessingError(
+            'The uploaded file does not appear to contain Chinese text',
+            details='Please ensure the PDF contains Chinese text'
+        )
+
+def clean_and_verify(text_processor: TextProcessor, extracted_text: str) -> str:
+    """Clean extracted text and verify it is Chinese, raising ProcessingError on failure"""
+    try:
+        cleaned_text = text_processor.clean_text(extracted_text)
+        logger.debug(f"Cleaned text length: {len(cleaned_text)}")
+
+        if not cleaned_text.strip():
+            raise ValueError("Text was empty after cleaning")
+
+        verify_chinese(text_processor, cleaned_text)
+        return cleaned_text
+    except ProcessingError:
+        raise
+    except Exception as e:
+        logger.error(f"Text cleaning/validation failed: {str(e)}")
+        raise ProcessingError(f'Failed to process text: {str(e)}')
+
+def chunk_text(text_processor: TextProcessor, cleaned_text: str) -> List[TextChunk]:
+    """Split cleaned text into TextChunks, raising ProcessingError on failure"""
+    try:
+        logger.debug("Creating text chunks")
+        chunks = text_processor.create_chunks(cleaned_text)
+
+        if not chunks:
+            logger.error("No chunks created from text")
+            raise ProcessingError(
+                'Could not process the text into chunks',
+                details='The text might be too short or empty'
+            )
+
+        logger.debug(f"Created {len(chunks)} chunks")
+        return chunks
+    except ProcessingError:
+        raise
+    except Exception as e:
+        logger.error(f"Chunking failed: {str(e)}")
+        raise ProcessingError(f'Failed to process text into chunks: {str(e)}', status=500)
+
+def prepare_chunks(text_processor: TextProcessor, pdf_path: str) -> List[TextChunk]:
+    """Run extraction, cleaning, language check and chunking for a PDF"""
+    extracted_text = extract_text(text_processor, pdf_path)
+    cleaned_text = clean_and_verify(text_processor, extracted_text)
+    return chunk_text(text_processor, cleaned_text)
+
+def iter_cleaned_pages(text_processor: TextProcessor, pdf_path: str,
+                       on_page: Optional[Callable[[int, int], None]] = None) -> Iterator[str]:
+    """Yield cleaned page texts as pages are parsed, after checking the language
+
+    Pages are held back only until LANGUAGE_SAMPLE_CHARS of cleaned text
+    (or the whole document, if shorter) is available for the Chinese check.
+    on_page(page_number, total_pages) is called as each page is parsed.
+    Pages rejected by text_processor.keep_page are dropped.
+    """
+    buffered = []
+    buffered_chars = 0
+    verified = False
+
+    try:
+        for page in text_processor.iter_pages(pdf_path):
+            if on_page:
+                on_page(page.number, page.total)
+            if not text_processor.keep_page(page):
+                continue
+            cleaned = text_processor.clean_text(page.text) if page.text.strip() else ""
+            if not cleaned.strip():
+                continue
+            if verified:
+                yield cleaned
+                continue
+            buffered.append(cleaned)
+            buffered_chars += len(cleaned)
+            if buffered_chars >= LANGUAGE_SAMPLE_CHARS:
+                verify_chinese(text_processor, "\n".join(buffered))
+                verified = True
+                yield from buffered
+                buffered = []
+    except ProcessingError:
+        raise
+    except Exception as e:
+        logger.error(f"Text extraction failed: {str(e)}")
+        raise ProcessingError(f'Failed to extract text from PDF: {str(e)}')
+
+    if not verified:
+        if not buffered:
+            raise ProcessingError('Failed to extract text from PDF: No text could be extracted from the PDF')
+        verify_chinese(text_processor, "\n".join(buffered))
+        yield from buffered
+
+def stream_chunks(text_processor: TextProcessor, pdf_path: str,
+                  on_page: Optional[Callable[[int, int], None]] = None) -> Iterator[TextChunk]:
+    """Yield TextChunks while the PDF is still being parsed
+
+    The first chunk can reach the translator as soon as enough pages have
+    been extracted and cleaned, instead of after the whole document.
+    """
+    produced = 0
+    for chunk in text_processor.iter_chunks(iter_cleaned_pages(text_processor, pdf_path, on_page)):
+        produced += 1
+        yield chunk
+
+    if not produced:
+        logger.error("No chunks created from text")
+        raise ProcessingError(
+            'Could not process the text into chunks',
+            details='The text might be too short or empty'
+        )
+
+def load_or_prepare_chunks(text_processor: TextProcessor, pdf_path: str,
+                           checkpoints: Optional[CheckpointStore], file_hash: Optional[str] = None,
+                           cache_version: Optional[str] = None) -> tuple:
+    """Return (document_key, chunks), reusing a checkpoint of the same PDF if there is one
+
+    Chunks checkpointed as translated under cache_version come back
+    translated. Without a checkpoint store, or while another job is
+    checkpointing the same PDF, the key is None and the PDF is chunked.
+    """
+    if checkpoints is None:
+        return None, prepare_chunks(text_processor, pdf_path)
+
+    file_hash = file_hash or file_sha256(pdf_path)
+    document_key = checkpoints.document_key(file_hash, text_processor)
+    chunks = checkpoints.load_chunks(document_key, version=cache_version)
+    if chunks is not None:
+        done = sum(chunk.is_translated for chunk in chunks)
+        logger.info(f"Resuming {document_key}: {done} of {len(chunks)} chunks already translated")
+        return document_key, chunks
+
+    chunks = prepare_chunks(text_processor, pdf_path)
+    if not checkpoints.save_chunks(document_key, file_hash, chunking_settings(text_processor), chunks):
+        # Another job is checkpointing the same PDF; translate this copy without one
+        return None, chunks
+    return document_key, chunks
+
+def translate_document(text_processor: TextProcessor, translation_manager: TranslationManager,
+                       pdf_path: str, progress_callback: Optional[Callable[[float], None]] = None,
+                       cancel_check: Optional[Callable[[], bool]] = None,
+                       checkpoints: Optional[CheckpointStore] = None,
+                       file_hash: Optional[str] = None, fields: Iterable[str] = RESULT_FIELDS) -> dict:
+    """Run the full extract→clean→chunk→translate→reassemble pipeline for a PDF
+
+    With a checkpoint store, the chunks and each chunk's outcome are recorded
+    as they happen, keyed by the PDF's hash (file_hash, if already known).
+    Running the same PDF again skips extraction and translates only chunks
+    that are missing or failed. fields picks the RESULT_FIELDS to return.
+
+    Raises ProcessingError for pipeline failures and lets TranslationCancelled
+    propagate so callers can tell cancellation apart from errors.
+    """
+    document_key, chunks = load_or_prepare_chunks(
+        text_processor, pdf_path, checkpoints, file_hash, translation_manager.cache_version
+    )
+    return translate_prepared_chunks(
+        translation_manager, chunks, progress_callback, cancel_check, checkpoints, document_key, fields
+    )
+
+def translate_prepared_chunks(translation_manager: TranslationManager, chunks: List[TextChunk],
+                              progress_callback: Optional[Callable[[float], None]] = None,
+                              cancel_check: Optional[Callable[[], bool]] = None,
+                              checkpoints: Optional[CheckpointStore] = None,
+                              document_key: Optional[str] = None,
+                              fields: Iterable[str] = RESULT_FIELDS) -> dict:
+    """Translate the chunks that are not translated yet and reassemble the document
+
+    Used by translate_document, and by callers that chunk PDFs elsewhere
+    (e.g. in another process) with load_or_prepare_chunks.
+    """
+    translated_chunks = [chunk for chunk in chunks if chunk.is_translated]
+    remaining = [chunk for chunk in chunks if not chunk.is_translated]
+
+    # Translate chunks
+    try:
+        logger.debug(f"Starting translation of {len(remaining)} of {len(chunks)} chunks")
+        for chunk in translation_manager.iter_translate_chunks(remaining, cancel_check=cancel_check):
+            translated_chunks.append(chunk)
+            if checkpoints and document_key:
+                checkpoints.record_chunks(document_key, [chunk], translation_manager.cache_version)
+            if progress_callback:
+                progress_callback(len(translated_chunks) / len(chunks) * 100)
+
+        if not translated_chunks:
+            raise ValueError("No translations were produced")
+
+        translated_chunks.sort(key=lambda x: x.sequence_number)
+        logger.debug("Translation completed")
+
+    except TranslationCancelled:
+        raise
+    except Exception as e:
+        logger.error(f"Translation failed: {str(e)}")
+        raise ProcessingError(f'Translation failed: {str(e)}', status=500)
+
+    # Reassemble document
+    try:
+        logger.debug("Reassembling document")
+        result = translation_manager.reassemble_document(translated_chunks, fields)
+
+        if not result or not result['metadata']['successful_translations']:
+            raise ValueError("Failed to reassemble translated document")
+
+        if checkpoints and document_key and all(chunk.is_translated for chunk in translated_chunks):
+            checkpoints.mark_complete(document_key)
+
+        logger.debug("Processing completed successfully")
+        return result
+
+    except Exception as e:
+        logger.error(f"Document reassembly failed: {str(e)}")
+        raise ProcessingError(f'Failed to reassemble translated document: {str(e)}', status=500)
+
+def _spool_chunks(chunks: Iterator[TextChunk], checkpoints: CheckpointStore,
+                  document_key: str) -> Iterator[TextChunk]:
+    """Add chunks to a started checkpoint in small batches, yielding each once it is stored"""
+    batch = []
+    total = 0
+    for chunk in chunks:
+        batch.append(chunk)
+        if len(batch) >= SPOOL_BATCH_CHUNKS:
+            checkpoints.add_chunks(document_key, batch)
+            total += len(batch)
+            yield from batch
+            batch = []
+    checkpoints.add_chunks(document_key, batch)
+    total += len(batch)
+    yield from batch
+    checkpoints.finish_chunking(document_key, total)
+
+def _write_joined(out: TextIO, texts: Iterable[str]):
+    """Write texts joined by newlines as one JSON string, without building the joined string"""
+    out.write('"')
+    for index, text in enumerate(texts):
+        if index:
+            out.write('\\n')
+        out.write(json.dumps(text, ensure_ascii=False)[1:-1])
+    out.write('"')
+
+def write_result_file(checkpoints: CheckpointStore, document_key: str, output_path: str,
+                      fields: Iterable[str] = RESULT_FIELDS, version: Optional[str] = None) -> dict:
+    """Write a checkpointed document as reassemble_document's JSON, one chunk at a time
+
+    The file has the same shape as an in-memory result with the same fields,
+    and is written to a temporary name first so readers never see half of
+    it. A trace being collected is written after the metadata. Returns the
+    metadata.
+    """
+    fields = set(fields)
+    unknown = fields.difference(RESULT_FIELDS)
+    if unknown:
+        raise ValueError(f"Unknown result fields: {', '.join(sorted(unknown))}")
+    counts = checkpoints.progress(document_key, version) or {}
+    metadata = {
+        'total_chunks': sum(counts.values()),
+        'successful_translations': counts.get(TRANSLATED, 0),
+    }
+
+    temp_path = f"{output_path}.tmp"
+    with span('write_result'), open(temp_path, 'w', encoding='utf-8') as out:
+        out.write('{')
+        if 'original' in fields:
+            out.write('"original": ')
+            _write_joined(out, (chunk.content for chunk in checkpoints.iter_chunks(document_key, version)))
+            out.write(', ')
+        if 'translated' in fields:
+            out.write('"translated": ')
+            _write_joined(out, (chunk.translation for chunk in checkpoints.iter_chunks(document_key, version)
+                                if chunk.is_translated))
+            out.write(', ')
+        if 'chunks' in fields:
+            out.write('"chunks": [')
+            for index, chunk in enumerate(checkpoints.iter_chunks(document_key, version)):
+                if index:
+                    out.write(', ')
+                out.write(json.dumps(asdict(chunk), ensure_ascii=False))
+            out.write('], ')
+        out.write(f'"metadata": {json.dumps(metadata)}')
+        trace = current_trace()
+        if trace is not None:
+            out.write(f', "trace": {json.dumps(trace.to_dict())}')
+        out.write('}')
+    os.replace(temp_path, output_path)
+    return metadata
+
+def translate_document_to_file(text_processor: TextProcessor, translation_manager: TranslationManager,
+                               pdf_path: str, output_path: str,
+                               progress_callback: Optional[Callable[[float], None]] = None,
+                               cancel_check: Optional[Callable[[], bool]] = None,
+                               checkpoints: Optional[CheckpointStore] = None,
+                               file_hash: Optional[str] = None, fields: Iterable[str] = RESULT_FIELDS) -> dict:
+    """Low-memory translate_document that writes the result JSON to output_path
+
+    Pages are extracted, cleaned and chunked as a stream, each chunk goes
+    to the checkpoint store as soon as it exists and is dropped once its
+    translation is recorded, and the result file is written from the store.
+    Memory therefore stays bounded by the chunks in flight rather than the
+    size of the document. Without a checkpoint store a temporary one is used
+    and deleted afterwards. While another job is spooling the same PDF,
+    this one spools under a key of its own, which is also deleted afterwards.
+
+    Returns the result metadata; errors are raised as by translate_document.
+    """
+    temp_store = None
+    if checkpoints is None:
+        handle, temp_store = tempfile.mkstemp(prefix='spool-', suffix='.db')
+        os.close(handle)
+        checkpoints = CheckpointStore(temp_store)
+    version = translation_manager.cache_version
+    private_key = None
+
+    try:
+        file_hash = file_hash or file_sha256(pdf_path)
+        document_key = checkpoints.document_key(file_hash, text_processor)
+        pages = {'done': 0, 'total': 0}
+        state = {'produced': 0, 'completed': 0}
+
+        if checkpoints.is_chunked(document_key):
+            # Chunks translated under an older cache version are translated again
+            counts = checkpoints.progress(document_key, version)
+            state['produced'] = sum(counts.values())
+            state['completed'] = counts[TRANSLATED]
+            logger.info(f"Resuming {document_key}: {state['completed']} of {state['produced']} "
+                        f"chunks already translated")
+            remaining = checkpoints.iter_chunks(document_key, version, untranslated_only=True)
+        else:
+            def on_page(number, total):
+                pages['done'], pages['total'] = number, total
+
+            def counted(chunks):
+                for chunk in chunks:
+                    state['produced'] += 1
+                    yield chunk
+
+            settings = chunking_settings(text_processor)
+            if not checkpoints.begin_document(document_key, file_hash, settings):
+                # Another job is spooling the same PDF; spool this one under a key of its own
+                private_key = document_key = f"{document_key}:{uuid.uuid4().hex[:8]}"
+                checkpoints.begin_document(document_key, file_hash, settings)
+            remaining = _spool_chunks(
+                counted(stream_chunks(text_processor, pdf_path, on_page)), checkpoints, document_key
+            )
+
+        try:
+            for chunk in translation_manager.iter_translate_chunks(remaining, cancel_check=cancel_check):
+                checkpoints.record_chunks(document_key, [chunk], version)
+                state['completed'] += 1
+                if progress_callback:
+                    progress = state['completed'] / state['produced'] * 100
+                    if pages['total'] and pages['done'] < pages['total']:
+                        progress *= pages['done'] / pages['total']
+                    progress_callback(progress)
+        except (TranslationCancelled, ProcessingError):
+            raise
+        except Exception as e:
+            logger.error(f"Translation failed: {str(e)}")
+            raise ProcessingError(f'Translation failed: {str(e)}', status=500)
+
+        try:
+            metadata = write_result_file(checkpoints, document_key, output_path, fields, version)
+            if not metadata['successful_translations']:
+                os.unlink(output_path)
+                raise ValueError("No translations were produced")
+        except Exception as e:
+            logger.error(f"Document reassembly failed: {str(e)}")
+            raise ProcessingError(f'Failed to reassemble translated document: {str(e)}', status=500)
+
+        if metadata['successful_translations'] == metadata['total_chunks']:
+            checkpoints.mark_complete(document_key)
+        logger.debug(f"Wrote {metadata['total_chunks']} chunks to {output_path}")
+        return metadata
+    finally:
+        if private_key and not temp_store:
+            checkpoints.delete_document(private_key)
+        if temp_store:
+            for path in (temp_store, f"{temp_store}-wal", f"{temp_store}-shm"):
+                try:
+                    os.unlink(path)
+                except OSError:
+                    pass
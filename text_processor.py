@@ -1,15 +1,125 @@
 # text_processor.py
 import pdfplumber
 import re
-from typing import List
+from typing import List, Optional, Iterator, Iterable
+from concurrent.futures import ProcessPoolExecutor
 import langdetect
 from dataclasses import dataclass
 import logging
+import sys
+from metrics import span, timed
 from langdetect.lang_detect_exception import LangDetectException
 
 logger = logging.getLogger(__name__)
 
-@dataclass
+# langdetect is probabilistic; a fixed seed makes repeated runs agree
+langdetect.DetectorFactory.seed = 0
+
+# is_chinese looks at most this many characters, taken from the start,
+# middle and end of the text
+LANGUAGE_SAMPLE_SIZE = 3000
+# Share of meaningful characters that must be Chinese to accept the text
+# outright; between the floor and the threshold langdetect decides
+CHINESE_RATIO_THRESHOLD = 0.3
+AMBIGUOUS_RATIO_FLOOR = 0.05
+CJK_CHAR = re.compile(r'[\u4e00-\u9fff]')
+NON_MEANINGFUL_CHAR = re.compile(r'[\s.,!?;:]')
+
+def language_sample(text: str, size: int = LANGUAGE_SAMPLE_SIZE) -> str:
+    """Return text itself if short, else equal slices from its start, middle and end"""
+    if len(text) <= size:
+        return text
+    part = size // 3
+    middle = (len(text) - part) // 2
+    return "\n".join((text[:part], text[middle:middle + part], text[-part:]))
+
+# Chinese and English sentence-ending punctuation
+SENTENCE_BOUNDARY = re.compile(r'([。！？.!?])')
+
+def split_sentences(paragraph: str) -> List[str]:
+    """Split a paragraph into sentences, keeping each one's closing punctuation"""
+    parts = SENTENCE_BOUNDARY.split(paragraph)
+    sentences = []
+    for i in range(0, len(parts), 2):
+        sentence = parts[i] + (parts[i+1] if i+1 < len(parts) else '')
+        if sentence.strip():
+            sentences.append(sentence)
+    return sentences
+
+# Patterns used by TextProcessor.clean_text, compiled once per process
+CJK_SPACED_RUN = re.compile(r'(?<=[\u4e00-\u9fff])\s+[\u4e00-\u9fff](?:\s+[\u4e00-\u9fff])*')
+NEWLINE_RUN = re.compile(r'\s*\n\s*')
+DISALLOWED_CHARS = re.compile(r'[^\u4e00-\u9fff.,!?;:\s。！？；：、，]+')
+EXTRA_WHITESPACE = re.compile(r'\n\s*\n|[^\S\n]{2,}|[^\S \n]')
+
+def _join_spaced_run(match) -> str:
+    # Every whitespace gap inside the match sits between two Chinese
+    # characters, so all of it goes. One match covers a whole letter-spaced
+    # phrase instead of one match per gap.
+    return ''.join(match.group().split())
+
+def _fold_newlines(match) -> str:
+    # A run with k line breaks becomes ceil(k/2) of them, plus a space when k
+    # is even. This keeps the output identical to the original multi-pass
+    # cleaner, whose NEW_LINE placeholder round-trip behaved this way.
+    breaks = match.group().count('\n')
+    return '\n' * ((breaks + 1) // 2) + ('' if breaks % 2 else ' ')
+
+def _collapse_whitespace(match) -> str:
+    return '\n' if '\n' in match.group() else ' '
+
+# Clause-level punctuation used to break up sentences that exceed the chunk budget
+CLAUSE_BOUNDARY = re.compile(r'([，；、,;])')
+
+# Token budgets per model. context_window is the num_ctx Ollama runs the model
+# with (2048 unless overridden), target_tokens the preferred chunk size and
+# output_ratio the expected English tokens per Chinese source token.
+MODEL_PROFILES = {
+    'qwen2.5:7b': {'context_window': 2048, 'target_tokens': 400, 'output_ratio': 1.5},
+}
+DEFAULT_MODEL_PROFILE = {'context_window': 2048, 'target_tokens': 400, 'output_ratio': 1.5}
+
+# Tokens taken by the fixed instructions around a chunk in the longest (refine)
+# prompt, including a terminology block of up to 20 glossary entries
+PROMPT_OVERHEAD_TOKENS = 400
+
+class ApproximateTokenizer:
+    """Local token count estimate that needs no model files
+
+    Each CJK character counts as cjk_tokens_per_char tokens, runs of Latin
+    letters and digits as one token per chars_per_token characters, and any
+    other non-space character as one token. Any object with a compatible
+    count(text) method (e.g. a wrapper around the model's real tokenizer)
+    can be passed to TextProcessor instead.
+    """
+
+    TOKEN_PATTERN = re.compile(r'([\u4e00-\u9fff])|([A-Za-z0-9]+)|(\S)')
+
+    def __init__(self, cjk_tokens_per_char: float = 1.0, chars_per_token: float = 4.0):
+        self.cjk_tokens_per_char = cjk_tokens_per_char
+        self.chars_per_token = chars_per_token
+
+    def count(self, text: str) -> int:
+        tokens = 0.0
+        for match in self.TOKEN_PATTERN.finditer(text):
+            if match.group(1):
+                tokens += self.cjk_tokens_per_char
+            elif match.group(2):
+                tokens += max(1.0, len(match.group(2)) / self.chars_per_token)
+            else:
+                tokens += 1
+        return int(round(tokens))
+
+def max_chunk_tokens(profile: dict, prompt_overhead: int = PROMPT_OVERHEAD_TOKENS) -> int:
+    """Largest chunk whose refine prompt (source + draft) and reply fit the context window"""
+    usable = profile['context_window'] - prompt_overhead
+    return max(1, int(usable / (1 + 2 * profile['output_ratio'])))
+
+# Slotted dataclasses (Python 3.10+) drop the per-instance __dict__, which
+# matters when a large document holds tens of thousands of chunks
+_SLOTS = {'slots': True} if sys.version_info >= (3, 10) else {}
+
+@dataclass(**_SLOTS)
 class TextChunk:
     id: int
     content: str
@@ -17,147 +127,280 @@ class TextChunk:
     translation: str = ""
     sequence_number: int = 0
 
+@dataclass(**_SLOTS)
+class PageText:
+    number: int
+    total: int
+    text: str
+
+def _release_page(page):
+    """Drop what pdfplumber cached while extracting a page
+
+    pdf.pages keeps every Page alive until the PDF is closed, and besides
+    the layout objects that flush_cache drops, pdfplumber 0.10+ memoizes
+    each page's text map (every character with its position) in a
+    per-page lru_cache. Clearing both keeps memory flat over long PDFs.
+    """
+    page.flush_cache()
+    textmap_cache = getattr(page, 'get_textmap', None)
+    if hasattr(textmap_cache, 'cache_clear'):
+        textmap_cache.cache_clear()
+
+def _extract_page_range(pdf_path: str, start: int, stop: int) -> List[str]:
+    """Extract pages [start, stop) in a worker process"""
+    with pdfplumber.open(pdf_path) as pdf:
+        texts = []
+        for page in pdf.pages[start:stop]:
+            texts.append(page.extract_text() or "")
+            _release_page(page)
+        return texts
+
 class TextProcessor:
-    def __init__(self, chunk_size: int = 500):
+    def __init__(self, chunk_size: int = 500, model: Optional[str] = None,
+                 chunk_tokens: Optional[int] = None, tokenizer=None,
+                 extract_workers: int = 1, pages_per_task: int = 8,
+                 skip_non_chinese_pages: bool = False):
+        """Configure chunking by characters or, given a model or chunk_tokens, by tokens
+
+        In token mode chunks are packed up to chunk_tokens (default: the
+        model profile's target, capped so the prompts fit the context
+        window) as measured by tokenizer, which defaults to a local
+        approximation. With extract_workers > 1, PDFs longer than
+        pages_per_task are parsed in parallel page ranges in a process pool.
+        skip_non_chinese_pages drops pages that is_chinese rejects, for PDFs
+        that mix Chinese with other languages.
+        """
         self.chunk_size = chunk_size
+        self.skip_non_chinese_pages = skip_non_chinese_pages
+        self.extract_workers = extract_workers
+        self.pages_per_task = pages_per_task
+        self.model = model
+        self.tokenizer = tokenizer
+        if model is not None or chunk_tokens is not None or tokenizer is not None:
+            profile = MODEL_PROFILES.get(model, DEFAULT_MODEL_PROFILE)
+            self.tokenizer = tokenizer or ApproximateTokenizer()
+            self.chunk_budget = chunk_tokens or min(profile['target_tokens'], max_chunk_tokens(profile))
+            self.measure = self.tokenizer.count
+            logger.debug(f"Chunking by tokens with a budget of {self.chunk_budget}")
+        else:
+            self.chunk_budget = chunk_size
+            self.measure = len
+
+    def iter_pages(self, pdf_path: str, workers: Optional[int] = None) -> Iterator[PageText]:
+        """Yield each page's text in page order as soon as it has been parsed
+
+        With more than one worker, page ranges are parsed in a process pool
+        and yielded in order while later ranges are still being parsed.
+        """
+        workers = workers or self.extract_workers
+        with pdfplumber.open(pdf_path) as pdf:
+            total = len(pdf.pages)
+            if workers <= 1 or total <= self.pages_per_task:
+                for number, page in enumerate(pdf.pages, 1):
+                    with span('extract_page'):
+                        text = page.extract_text() or ""
+                        _release_page(page)
+                    yield PageText(number, total, text)
+                return
+
+        ranges = [(start, min(start + self.pages_per_task, total)) for start in range(0, total, self.pages_per_task)]
+        logger.debug(f"Extracting {total} pages in {len(ranges)} ranges with {workers} processes")
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(_extract_page_range, pdf_path, start, stop) for start, stop in ranges]
+            try:
+                for (start, _), future in zip(ranges, futures):
+                    for offset, text in enumerate(future.result()):
+                        yield PageText(start + offset + 1, total, text)
+            finally:
+                for future in futures:
+                    future.cancel()
+
+    def page_count(self, pdf_path: str) -> int:
+        """Number of pages in a PDF, without extracting any text"""
+        with pdfplumber.open(pdf_path) as pdf:
+            return len(pdf.pages)
+
+    def keep_page(self, page: PageText) -> bool:
+        """Whether a page should be translated, given skip_non_chinese_pages"""
+        if not self.skip_non_chinese_pages or not page.text.strip() or self.is_chinese(page.text):
+            return True
+        logger.info(f"Skipping page {page.number}: not Chinese")
+        return False
 
+    @timed('extract_from_pdf')
     def extract_from_pdf(self, pdf_path: str) -> str:
         """Extract text from PDF while preserving structure"""
-        full_text = ""
         try:
-            with pdfplumber.open(pdf_path) as pdf:
-                for page in pdf.pages:
-                    text = page.extract_text()
-                    if text:
-                        logger.debug(f"Extracted text from page: {text[:100]}...")
-                        full_text += text + "\n"
+            texts = []
+            for page in self.iter_pages(pdf_path):
+                if page.text and self.keep_page(page):
+                    logger.debug(f"Extracted text from page {page.number}: {page.text[:100]}...")
+                    texts.append(page.text)
             
-            if not full_text.strip():
+            full_text = "\n".join(texts).strip()
+            if not full_text:
                 raise Exception("No text could be extracted from the PDF")
                 
-            return full_text.strip()
+            return full_text
         except Exception as e:
             raise Exception(f"PDF extraction failed: {str(e)}")
 
+    @timed('clean_text')
     def clean_text(self, text: str) -> str:
-        """Clean and normalize text with improved Chinese text handling"""
-        logger.debug(f"Original text before cleaning: {text}")
-        
+        """Clean and normalize text with improved Chinese text handling
+
+        Runs four precompiled linear passes: drop whitespace between Chinese
+        characters, fold each whitespace run containing line breaks, delete
+        characters outside the whitelist, then collapse blank lines and
+        repeated spaces.
+        """
         # Remove extra spaces between Chinese characters while preserving structure
-        text = re.sub(r'(?<=[\u4e00-\u9fff])\s+(?=[\u4e00-\u9fff])', '', text)
-        
-        # Preserve newlines for structure
-        text = text.replace('\n', ' NEW_LINE ')
-        
-        # Remove excessive whitespace but keep single spaces
-        text = re.sub(r'\s+', ' ', text)
-        
-        # Restore newlines
-        text = text.replace(' NEW_LINE ', '\n')
-        
+        cleaned = CJK_SPACED_RUN.sub(_join_spaced_run, text)
+        cleaned = NEWLINE_RUN.sub(_fold_newlines, cleaned)
         # Clean up any remaining unnecessary characters while preserving Chinese text and punctuation
-        text = re.sub(r'[^\u4e00-\u9fff.,!?;:\s\n。！？；：、，]', '', text)
-        
+        cleaned = DISALLOWED_CHARS.sub('', cleaned)
         # Final cleanup of any double spaces or empty lines
-        text = re.sub(r'\n\s*\n', '\n', text)
-        text = re.sub(r' +', ' ', text)
-        
-        cleaned = text.strip()
-        logger.debug(f"Cleaned text: {cleaned}")
+        cleaned = EXTRA_WHITESPACE.sub(_collapse_whitespace, cleaned).strip()
+
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"Cleaned text: {len(text)} -> {len(cleaned)} characters")
         return cleaned
 
+    @timed('is_chinese')
     def is_chinese(self, text: str) -> bool:
-        """Verify if text is primarily Chinese using improved detection"""
+        """Verify if text is primarily Chinese using improved detection
+
+        Only a bounded sample is examined, so the cost does not grow with the
+        document. langdetect is consulted only when the Chinese ratio is
+        ambiguous.
+        """
         if not text.strip():
             logger.error("Empty text provided for Chinese detection")
             return False
-            
+
         try:
-            # Count Chinese characters (improved to handle punctuation)
-            chinese_chars = re.findall(r'[\u4e00-\u9fff]', text)
-            # Count meaningful characters (excluding whitespace and basic punctuation)
-            meaningful_chars = re.sub(r'[\s.,!?;:\n]', '', text)
-            total_chars = len(meaningful_chars) if meaningful_chars else 0
-            
-            chinese_ratio = len(chinese_chars) / total_chars if total_chars > 0 else 0
-            
-            logger.debug(f"Chinese characters: {len(chinese_chars)}")
-            logger.debug(f"Total meaningful characters: {total_chars}")
-            logger.debug(f"Chinese ratio: {chinese_ratio}")
-            
-            # Try langdetect with error handling
+            sample = language_sample(text)
+            # Count Chinese characters and meaningful characters (excluding whitespace and basic punctuation)
+            chinese_count = CJK_CHAR.subn('', sample)[1]
+            total_chars = len(sample) - NON_MEANINGFUL_CHAR.subn('', sample)[1]
+            chinese_ratio = chinese_count / total_chars if total_chars > 0 else 0
+
+            logger.debug(f"Chinese ratio: {chinese_ratio:.2f} ({chinese_count}/{total_chars} sampled characters)")
+
+            if chinese_ratio > CHINESE_RATIO_THRESHOLD:
+                return True
+            if chinese_ratio < AMBIGUOUS_RATIO_FLOOR:
+                return False
+
             try:
-                # Use more text for detection
-                sample_text = text[:1000].replace('\n', ' ')
-                detected = langdetect.detect(sample_text)
+                detected = langdetect.detect(sample.replace('\n', ' '))
                 logger.debug(f"Language detected: {detected}")
-                is_chinese_by_detect = detected in ['zh-cn', 'zh-tw', 'zh']
+                return detected in ['zh-cn', 'zh-tw', 'zh']
             except LangDetectException:
                 logger.warning("Language detection failed, falling back to ratio")
-                is_chinese_by_detect = False
-            
-            # Lower threshold for Chinese ratio since we're counting meaningful chars only
-            is_chinese_by_ratio = chinese_ratio > 0.3
-            
-            logger.debug(f"Detection results - langdetect: {is_chinese_by_detect}, ratio: {is_chinese_by_ratio}")
-            
-            return is_chinese_by_detect or is_chinese_by_ratio
-            
+                return False
+
         except Exception as e:
             logger.error(f"Chinese detection error: {e}")
             return False
-    
-    def create_chunks(self, text: str) -> List[TextChunk]:
-        """Split text into manageable chunks while preserving Chinese sentence structure"""
-        if not text.strip():
-            logger.warning("Empty text provided for chunking")
-            return []
-            
-        chunks = []
+
+    def _split_hard(self, text: str) -> Iterator[str]:
+        """Cut text with no usable punctuation into pieces within the budget"""
+        piece = ""
+        piece_size = 0
+        for char in text:
+            char_size = self.measure(char)
+            if piece and piece_size + char_size > self.chunk_budget:
+                yield piece
+                piece, piece_size = "", 0
+            piece += char
+            piece_size += char_size
+        if piece:
+            yield piece
+
+    def _fit_to_budget(self, sentence: str) -> Iterator[str]:
+        """Yield the sentence whole, or split at clause punctuation if it exceeds the budget"""
+        if self.measure(sentence) <= self.chunk_budget:
+            yield sentence
+            return
+
+        parts = CLAUSE_BOUNDARY.split(sentence)
+        clauses = [parts[i] + (parts[i+1] if i+1 < len(parts) else '') for i in range(0, len(parts), 2)]
+        piece = ""
+        for clause in clauses:
+            if not clause:
+                continue
+            if self.measure(clause) > self.chunk_budget:
+                if piece:
+                    yield piece
+                    piece = ""
+                yield from self._split_hard(clause)
+            elif piece and self.measure(piece + clause) > self.chunk_budget:
+                yield piece
+                piece = clause
+            else:
+                piece += clause
+        if piece:
+            yield piece
+
+    def iter_chunks(self, texts: Iterable[str]) -> Iterator[TextChunk]:
+        """Chunk a stream of texts (e.g. cleaned pages), yielding each chunk once it is full
+
+        Sentences are packed into chunks up to the chunk budget (characters or
+        tokens); a sentence larger than the budget is split at clause
+        punctuation so no chunk exceeds it. Chunks may span text boundaries.
+        """
         chunk_id = 0
         current_chunk = ""
+        current_size = 0
         
-        # Split by newlines first to preserve structure
-        paragraphs = text.split('\n')
-        
-        for paragraph in paragraphs:
-            if not paragraph.strip():
-                continue
-            
-            # Split at Chinese and English sentence boundaries
-            sentences = re.split(r'([。！？.!?])', paragraph)
-            
-            for i in range(0, len(sentences), 2):
-                sentence = sentences[i] + (sentences[i+1] if i+1 < len(sentences) else '')
-                
-                if not sentence.strip():
+        for text in texts:
+            # Split by newlines first to preserve structure
+            for paragraph in text.split('\n'):
+                if not paragraph.strip():
                     continue
                 
-                if len(current_chunk) + len(sentence) > self.chunk_size:
-                    if current_chunk:
-                        chunks.append(TextChunk(
-                            id=chunk_id,
-                            content=current_chunk.strip(),
-                            sequence_number=len(chunks)
-                        ))
-                        chunk_id += 1
-                        current_chunk = sentence
-                else:
-                    current_chunk += sentence
-            
-            if current_chunk and not current_chunk.endswith('\n'):
-                current_chunk += '\n'
+                # Split at Chinese and English sentence boundaries
+                for sentence in split_sentences(paragraph):
+                    for piece in self._fit_to_budget(sentence):
+                        piece_size = self.measure(piece)
+                        if current_chunk and current_size + piece_size > self.chunk_budget:
+                            yield TextChunk(
+                                id=chunk_id,
+                                content=current_chunk.strip(),
+                                sequence_number=chunk_id
+                            )
+                            chunk_id += 1
+                            current_chunk = piece
+                            current_size = piece_size
+                        else:
+                            current_chunk += piece
+                            current_size += piece_size
+                
+                if current_chunk and not current_chunk.endswith('\n'):
+                    current_chunk += '\n'
+                    current_size += self.measure('\n')
         
         # Add the last chunk if there's anything left
         if current_chunk.strip():
-            chunks.append(TextChunk(
+            yield TextChunk(
                 id=chunk_id,
                 content=current_chunk.strip(),
-                sequence_number=len(chunks)
-            ))
+                sequence_number=chunk_id
+            )
+
+    @timed('create_chunks')
+    def create_chunks(self, text: str) -> List[TextChunk]:
+        """Split text into manageable chunks while preserving Chinese sentence structure"""
+        if not text.strip():
+            logger.warning("Empty text provided for chunking")
+            return []
+            
+        chunks = list(self.iter_chunks([text]))
         
         logger.debug(f"Created {len(chunks)} chunks")
-        for chunk in chunks:
-            logger.debug(f"Chunk {chunk.id}: {chunk.content[:50]}...")
+        if logger.isEnabledFor(logging.DEBUG):
+            for chunk in chunks:
+                logger.debug(f"Chunk {chunk.id}: {chunk.content[:50]}...")
         
-        return chunks
\ No newline at end of file
+        return chunks
@@ -1,26 +1,251 @@
 # translation_manager.py
-from typing import List, Optional, Dict
-import sqlite3
+from typing import List, Optional, Dict, Iterable, Iterator, Callable
+from concurrent.futures import ThreadPoolExecutor, Future, wait, FIRST_COMPLETED
+import threading
 import logging
 import hashlib
 from dataclasses import asdict
-from text_processor import TextChunk
-import ollama
+from text_processor import TextChunk, ApproximateTokenizer, split_sentences
+from cache_store import TranslationCache
+from glossary import Glossary
+from backends import DEFAULT_MODEL, OllamaBackend, TranslationBackend
+from metrics import METRICS, Sample, span, timed, in_context
 import time
 import re
 import json
 
 logger = logging.getLogger(__name__)
 
+TRANSLATE_SYSTEM_PROMPT = 'You are a professional translator. Translate everything to English completely.'
+
+# Enhanced prompt with explicit character translation requirements
+TRANSLATE_PROMPT_TEMPLATE = """Translate this Chinese text to English:
+
+SOURCE TEXT:
+{source}
+{glossary}
+CRITICAL REQUIREMENTS:
+1. Translate ALL Chinese characters - no untranslated characters allowed
+2. Do not include original Chinese characters in brackets or parentheses
+3. Provide complete English translations for all terms
+4. Use natural English phrasing
+5. Maintain the original meaning accurately
+
+Translation:"""
+
+REFINE_SYSTEM_PROMPT = 'You are a translation reviewer. Ensure complete English translation with no Chinese characters.'
+
+REFINE_PROMPT_TEMPLATE = """Review and improve this translation:
+
+Original Chinese: {source}
+Current translation: {draft}
+{glossary}
+REQUIREMENTS:
+1. Ensure ALL Chinese characters are translated to English
+2. Remove any remaining Chinese characters
+3. Use clear English equivalents for all terms
+4. Maintain natural English flow
+5. Keep the original meaning
+
+Improved translation:"""
+
+# Used to translate several segments (e.g. new sentences) in one request
+SEGMENTS_PROMPT_TEMPLATE = """Translate each numbered Chinese segment below to English.
+
+SEGMENTS:
+{segments}
+{glossary}
+CRITICAL REQUIREMENTS:
+1. Translate ALL Chinese characters - no untranslated characters allowed
+2. Do not include original Chinese characters in brackets or parentheses
+3. Keep the numbering: answer with exactly one line per segment, formatted as [n] translation
+4. Do not merge, split, skip or reorder segments
+5. Maintain the original meaning accurately
+
+Translations:"""
+
+# Everything that shapes the model's output; changing any of it changes the cache version
+PROMPT_TEMPLATES = (
+    TRANSLATE_SYSTEM_PROMPT,
+    TRANSLATE_PROMPT_TEMPLATE,
+    REFINE_SYSTEM_PROMPT,
+    REFINE_PROMPT_TEMPLATE,
+    SEGMENTS_PROMPT_TEMPLATE,
+)
+
+# Most glossary entries injected into a single prompt; text_processor's
+# PROMPT_OVERHEAD_TOKENS leaves room for this many
+MAX_PROMPT_TERMS = 20
+
+# Most chunks packed into one batched request, whatever their size
+MAX_BATCH_CHUNKS = 10
+
+SINGLE_PASS = 'single'
+TWO_PASS = 'two_pass'
+ADAPTIVE = 'adaptive'
+STRATEGIES = (SINGLE_PASS, TWO_PASS, ADAPTIVE)
+
+# get_strategy_stats() counters exported as translator_strategy_<key>_total
+STRATEGY_METRICS = {
+    'chunks': 'Chunks translated with each strategy',
+    'model_calls': 'Model calls made by each strategy',
+    'refined': 'Chunks that got a review pass',
+    'refine_skipped': 'Chunks whose review pass was skipped',
+    'seconds': 'Seconds spent translating chunks with each strategy',
+}
+
+# sentence_stats counters exported as translator_sentences_<key>_total
+SENTENCE_METRICS = {
+    'reused': 'Sentences served from sentence memory',
+    'translated': 'Sentences sent to the model by sentence memory',
+    'fallbacks': 'Chunks sentence memory handed back for whole-chunk translation',
+}
+
+# Parts of a reassembled document besides its metadata. "original" and
+# "translated" repeat the text held in "chunks", so callers short of memory
+# can ask for fewer of them
+RESULT_FIELDS = ('original', 'translated', 'chunks')
+
+# Phrases that show the model talked about the translation instead of just giving it
+META_REPLY = re.compile(r'^\s*(here is|here\'s|translation\s*:|sure[,!]|certainly)', re.IGNORECASE)
+
+NUMBERED_LINE = re.compile(r'^\s*\[(\d+)\]\s?(.*)$')
+
+def format_numbered(segments: List[str]) -> str:
+    """Render segments as [1] ..., [2] ... lines for a multi-segment prompt"""
+    return "\n".join(f"[{i}] {' '.join(segment.split())}" for i, segment in enumerate(segments, 1))
+
+def parse_numbered(reply: str, count: int) -> Optional[List[str]]:
+    """Split a [n]-numbered model reply back into exactly count segments
+
+    Unnumbered lines are treated as continuations of the previous segment.
+    Returns None if any segment is missing, duplicated or out of range.
+    """
+    parts = {}
+    current = None
+    for line in reply.splitlines():
+        match = NUMBERED_LINE.match(line)
+        if match:
+            current = int(match.group(1))
+            if current in parts or not 1 <= current <= count:
+                return None
+            parts[current] = match.group(2).strip()
+        elif current is not None and line.strip():
+            parts[current] += ' ' + line.strip()
+    if len(parts) != count or not all(parts.values()):
+        return None
+    return [parts[i] for i in range(1, count + 1)]
+
+def format_glossary(terms: Dict[str, str]) -> str:
+    """Render glossary entries as the terminology block of a prompt, or '' if there are none"""
+    if not terms:
+        return ""
+    lines = "\n".join(f"{term} = {translation}" for term, translation in terms.items())
+    return f"\nTERMINOLOGY (use these English terms):\n{lines}\n"
+
+def fingerprint(*parts) -> str:
+    """Short stable digest of the given values"""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(json.dumps(part, ensure_ascii=False, sort_keys=True).encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()[:12]
+
+class TranslationCancelled(Exception):
+    """Raised when a translation run is cancelled before all chunks finish"""
+
+class RateLimiter:
+    """Token bucket limiting how many chunk requests may start per second"""
+
+    def __init__(self, rate: float, burst: int = 1):
+        if rate <= 0:
+            raise ValueError("Rate must be positive")
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self._tokens = float(self.capacity)
+        self._last_refill = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a request token is available"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._last_refill) * self.rate)
+                self._last_refill = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait_time = (1 - self._tokens) / self.rate
+            time.sleep(wait_time)
+
 class TranslationManager:
-    def __init__(self, db_path: str = "translations.db"):
-        """Initialize TranslationManager with enhanced features"""
-        self.base_url = 'http://localhost:11434'
+    def __init__(self, db_path: str = "translations.db", max_workers: int = 4,
+                 requests_per_second: Optional[float] = None, cache_write_batch: int = 16,
+                 cache_options: Optional[Dict] = None, model: str = DEFAULT_MODEL,
+                 allow_stale_cache: bool = False, sentence_memory: bool = False,
+                 strategy: str = TWO_PASS, glossary_files: Optional[List[str]] = None,
+                 batch_tokens: Optional[int] = None, tokenizer=None,
+                 backend: Optional[TranslationBackend] = None):
+        """Initialize TranslationManager with enhanced features
+
+        max_workers bounds how many chunks are in flight against the model at
+        once; requests_per_second optionally caps how fast new requests start.
+        cache_write_batch is how many new translations are buffered before
+        they are written to the cache in one transaction. cache_options are
+        passed to TranslationCache (memory tier size, eviction policy).
+
+        Cached translations are keyed by content plus a version fingerprint
+        of the model, strategy, sentence memory, batching, prompt templates
+        and glossary. With allow_stale_cache, a miss on the current version
+        may be served from an older version.
+
+        With sentence_memory, chunks that miss the cache are split into
+        sentences; sentences already translated (in the cache or elsewhere in
+        the document) are reused and only new ones are sent to the model.
+
+        strategy selects how many model calls a chunk gets: 'single' (first
+        pass only), 'two_pass' (always refine) or 'adaptive' (refine only
+        when the first draft fails validation or the quality heuristic).
+
+        glossary_files are CSV, TSV or JSON glossaries loaded on top of the
+        built-in terminology. Terms found in a chunk are listed in its prompts.
+
+        With batch_tokens, consecutive uncached chunks are packed into one
+        numbered request of at most batch_tokens source tokens (as counted by
+        tokenizer) and MAX_BATCH_CHUNKS chunks. Batched chunks get a single
+        pass; any chunk whose reply cannot be parsed or fails validation is
+        translated on its own with the configured strategy.
+
+        backend is the model server to talk to; by default an OllamaBackend
+        for `model` on OLLAMA_HOST (or the local default). When a backend is
+        given, its model is used.
+        """
+        if max_workers < 1:
+            raise ValueError("max_workers must be at least 1")
+        if strategy not in STRATEGIES:
+            raise ValueError(f"Unknown translation strategy {strategy!r}, expected one of {STRATEGIES}")
+        self.backend = backend or OllamaBackend(model=model)
         self.db_path = db_path
-        self.setup_database()
+        self.model = self.backend.model
+        self.allow_stale_cache = allow_stale_cache
+        self.sentence_memory = sentence_memory
+        self._inflight_sentences = {}
+        self._sentence_lock = threading.Lock()
+        self.sentence_stats = {'reused': 0, 'translated': 0, 'fallbacks': 0}
+        self.strategy = strategy
+        self._strategy_lock = threading.Lock()
+        self._strategy_stats = {}
+        self.batch_tokens = batch_tokens
+        self.tokenizer = tokenizer or ApproximateTokenizer()
+        self.batch_stats = {'batches': 0, 'batched_chunks': 0, 'fallbacks': 0}
+        self.max_workers = max_workers
+        self.rate_limiter = RateLimiter(requests_per_second, burst=max_workers) if requests_per_second else None
+        self.cache_write_batch = max(1, cache_write_batch)
+        self.cache = TranslationCache(db_path, **(cache_options or {}))
         
         # Comprehensive terminology database
-        self.terminology = {
+        self.terminology = Glossary({
             "世界人权宣言": "Universal Declaration of Human Rights",
             "联合国": "United Nations",
             "大会": "General Assembly",
@@ -47,71 +272,122 @@ class TranslationManager:
             "不可分割性": "indivisibility",
             "相互依存性": "interdependence",
             "民主社会": "democratic society",
-        }
+        })
+        for path in glossary_files or []:
+            self.terminology.load(path)
+        self.refresh_cache_version()
 
     def setup_database(self):
         """Initialize SQLite database with enhanced caching"""
-        try:
-            with sqlite3.connect(self.db_path) as conn:
-                conn.execute("""
-                    CREATE TABLE IF NOT EXISTS translations (
-                        chunk_hash TEXT PRIMARY KEY,
-                        original_text TEXT,
-                        translated_text TEXT,
-                        document_type TEXT,
-                        quality_score FLOAT,
-                        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
-                    )
-                """)
-                logger.debug(f"Database initialized at {self.db_path}")
-        except Exception as e:
-            logger.error(f"Database initialization failed: {str(e)}")
-            raise Exception(f"Failed to setup database: {str(e)}")
+        self.cache.setup_database()
+
+    def refresh_cache_version(self) -> str:
+        """Recompute the cache version after changing the model, prompts or terminology"""
+        self.version_components = {
+            'model': self.model,
+            'strategy': self.strategy,
+            # Chunks assembled from per-sentence replies differ from whole-chunk translations
+            'sentence_memory': self.sentence_memory,
+            # Batched chunks get a single pass, and their replies depend on the batch size
+            'batch_tokens': self.batch_tokens,
+            'prompts': fingerprint(*PROMPT_TEMPLATES),
+            'glossary': fingerprint(sorted(self.terminology.items())),
+        }
+        self.cache_version = fingerprint(self.version_components)
+        logger.debug(f"Cache version {self.cache_version}: {self.version_components}")
+        return self.cache_version
+
+    def load_glossary(self, path: str) -> int:
+        """Load glossary entries from a file and move the cache to the new version"""
+        count = self.terminology.load(path)
+        self.refresh_cache_version()
+        return count
+
+    def glossary_prompt(self, text: str) -> str:
+        """Terminology block listing the glossary entries that occur in text"""
+        terms = self.terminology.relevant(text)
+        if len(terms) > MAX_PROMPT_TERMS:
+            terms = dict(list(terms.items())[:MAX_PROMPT_TERMS])
+        return format_glossary(terms)
 
     def _generate_chunk_hash(self, text: str) -> str:
         """Generate a consistent hash for a text chunk"""
         return hashlib.md5(text.encode('utf-8')).hexdigest()
 
+    def _cache_key(self, content_hash: str) -> str:
+        """Cache key for a content hash under the current version"""
+        return f"{content_hash}:{self.cache_version}"
+
     def get_cached_translation(self, chunk: TextChunk) -> Optional[str]:
         """Check if translation exists in cache"""
+        result = self.get_cached_translations([chunk]).get(chunk.id)
+        if result:
+            logger.debug(f"Cache hit for chunk {chunk.id}")
+            return result
+        logger.debug(f"Cache miss for chunk {chunk.id}")
+        return None
+
+    def get_cached_translations(self, chunks: List[TextChunk]) -> Dict[int, str]:
+        """Look up cached translations for many chunks in one query, keyed by chunk id
+
+        The current version is tried first; if stale entries are allowed,
+        remaining misses fall back to any older version of the same content.
+        """
         try:
-            chunk_hash = self._generate_chunk_hash(chunk.content)
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                result = cursor.execute(
-                    "SELECT translated_text FROM translations WHERE chunk_hash = ?",
-                    (chunk_hash,)
-                ).fetchone()
-                
-                if result and result[0].strip():
-                    logger.debug(f"Cache hit for chunk {chunk.id}")
-                    return result[0]
-                logger.debug(f"Cache miss for chunk {chunk.id}")
-                return None
+            with span('cache_lookup', chunks=len(chunks)):
+                return self._lookup_cached(chunks)
         except Exception as e:
             logger.error(f"Cache retrieval error: {str(e)}")
-            return None
+            return {}
+
+    def _lookup_cached(self, chunks: List[TextChunk]) -> Dict[int, str]:
+        content_hashes = {chunk.id: self._generate_chunk_hash(chunk.content) for chunk in chunks}
+        found = self.cache.get_many(self._cache_key(h) for h in content_hashes.values())
+        cached = {
+            chunk_id: found[self._cache_key(content_hash)]
+            for chunk_id, content_hash in content_hashes.items()
+            if self._cache_key(content_hash) in found
+        }
+
+        if self.allow_stale_cache and len(cached) < len(content_hashes):
+            missing = {chunk_id: h for chunk_id, h in content_hashes.items() if chunk_id not in cached}
+            stale = self.cache.get_stale_many(missing.values(), exclude_version=self.cache_version)
+            for chunk_id, content_hash in missing.items():
+                if content_hash in stale:
+                    logger.debug(f"Stale cache hit for chunk {chunk_id}")
+                    cached[chunk_id] = stale[content_hash]
+
+        return cached
 
     def cache_translation(self, chunk: TextChunk, translation: str, document_type: str = "general"):
         """Store translation in cache"""
+        self.cache_translations([(chunk, translation)], document_type)
+
+    def cache_translations(self, translated: List[tuple], document_type: str = "general"):
+        """Store many (chunk, translation) pairs in cache in a single transaction"""
+        if not translated:
+            return
         try:
-            chunk_hash = self._generate_chunk_hash(chunk.content)
-            with sqlite3.connect(self.db_path) as conn:
-                conn.execute(
-                    """INSERT OR REPLACE INTO translations 
-                    (chunk_hash, original_text, translated_text, document_type) 
-                    VALUES (?, ?, ?, ?)""",
-                    (chunk_hash, chunk.content, translation, document_type)
-                )
-                logger.debug(f"Cached translation for chunk {chunk.id}")
+            rows = []
+            for chunk, translation in translated:
+                content_hash = self._generate_chunk_hash(chunk.content)
+                rows.append((
+                    self._cache_key(content_hash), content_hash, self.cache_version,
+                    chunk.content, translation, document_type
+                ))
+            with span('cache_store', chunks=len(rows)):
+                self.cache.put_many(rows)
+            logger.debug(f"Cached translations for {len(translated)} chunks")
         except Exception as e:
             logger.error(f"Failed to cache translation: {str(e)}")
 
+    def invalidate_cache_version(self, version: Optional[str] = None) -> int:
+        """Drop cached translations for a version (the current one by default)"""
+        return self.cache.invalidate_version(version or self.cache_version)
+
     def apply_terminology(self, translation: str) -> str:
-        """Apply consistent terminology with context awareness"""
-        for cn_term, en_term in self.terminology.items():
-            translation = re.sub(fr'\b{cn_term}\b', en_term, translation)
-        return translation
+        """Replace glossary terms left untranslated in the model output, longest match first"""
+        return self.terminology.replace(translation)
 
     def validate_translation(self, original: str, translation: str) -> bool:
         """Comprehensive translation validation with enhanced character checks"""
@@ -169,78 +445,249 @@ class TranslationManager:
         
         return translation.strip()
 
-    def translate_chunk(self, chunk: TextChunk, context: Optional[Dict] = None) -> str:
-        """Enhanced translation with better error handling and validation"""
-        try:
-            cached = self.get_cached_translation(chunk)
-            if cached:
-                return cached
+    def _record_reply(self, stage: str, reply: str, seconds: float):
+        METRICS.inc('model_output_tokens_total', self.tokenizer.count(reply),
+                    help='Approximate tokens in model replies', stage=stage)
+        METRICS.inc('model_reply_seconds_total', seconds,
+                    help='Time spent waiting for model replies', stage=stage)
 
-            # Enhanced prompt with explicit character translation requirements
-            prompt = f"""Translate this Chinese text to English:
+    def _chat(self, system_prompt: str, user_prompt: str, stage: str = 'model_chat') -> str:
+        """Send one system/user exchange to the model and return the reply text
 
-SOURCE TEXT:
-{chunk.content}
+        stage names the pass (e.g. model_translate) in metrics and traces.
+        """
+        start = time.perf_counter()
+        with span(stage, model=self.model):
+            reply = self.backend.chat(system_prompt, user_prompt)
+        self._record_reply(stage, reply, time.perf_counter() - start)
+        return reply
 
-CRITICAL REQUIREMENTS:
-1. Translate ALL Chinese characters - no untranslated characters allowed
-2. Do not include original Chinese characters in brackets or parentheses
-3. Provide complete English translations for all terms
-4. Use natural English phrasing
-5. Maintain the original meaning accurately
+    def _stream_chat(self, system_prompt: str, user_prompt: str,
+                     on_token: Callable[[str, bool], None], stage: str = 'model_chat') -> str:
+        """Like _chat, but pass each piece of the reply to on_token(piece, restart) as it arrives
 
-Translation:"""
-            
-            # First pass - basic translation
-            response = ollama.chat(model='qwen2.5:7b', messages=[
-                {
-                    'role': 'system',
-                    'content': 'You are a professional translator. Translate everything to English completely.'
-                },
-                {
-                    'role': 'user',
-                    'content': prompt
-                }
-            ])
-            
-            initial_translation = response['message']['content'].strip()
-            
-            # Second pass - verification and refinement
-            refine_prompt = f"""Review and improve this translation:
+        restart is True for the first piece, telling the listener to drop any
+        partial text from an earlier pass.
+        """
+        start = time.perf_counter()
+        pieces = []
+        with span(stage, model=self.model, streamed=True):
+            for piece in self.backend.stream_chat(system_prompt, user_prompt):
+                on_token(piece, not pieces)
+                pieces.append(piece)
+        reply = ''.join(pieces).strip()
+        self._record_reply(stage, reply, time.perf_counter() - start)
+        return reply
 
-Original Chinese: {chunk.content}
-Current translation: {initial_translation}
+    def _finish_translation(self, translation: str) -> str:
+        """Apply terminology and post-processing to raw model output"""
+        translated = self.apply_terminology(translation)
+        return self.post_process_translation(translated)
 
-REQUIREMENTS:
-1. Ensure ALL Chinese characters are translated to English
-2. Remove any remaining Chinese characters
-3. Use clear English equivalents for all terms
-4. Maintain natural English flow
-5. Keep the original meaning
+    def is_acceptable_draft(self, original: str, translation: str) -> bool:
+        """Cheap check that a first-pass translation does not need refinement"""
+        if not self.validate_translation(original, translation):
+            return False
+        if META_REPLY.search(translation):
+            logger.debug("Draft contains commentary, refining")
+            return False
+        # English renderings usually run 1.5-5x the length of the Chinese source
+        source_chars = len(re.sub(r'\s', '', original))
+        ratio = len(translation) / source_chars if source_chars else 0
+        if source_chars >= 10 and not 0.8 <= ratio <= 8:
+            logger.debug(f"Draft length ratio {ratio:.2f} out of range, refining")
+            return False
+        return True
 
-Improved translation:"""
-            
-            response = ollama.chat(model='qwen2.5:7b', messages=[
-                {
-                    'role': 'system',
-                    'content': 'You are a translation reviewer. Ensure complete English translation with no Chinese characters.'
-                },
-                {
-                    'role': 'user',
-                    'content': refine_prompt
-                }
-            ])
-            
-            refined_translation = response['message']['content'].strip()
+    def _record_strategy(self, elapsed: float, model_calls: int, refined: bool):
+        with self._strategy_lock:
+            stats = self._strategy_stats.setdefault(self.strategy, {
+                'chunks': 0, 'model_calls': 0, 'refined': 0, 'refine_skipped': 0, 'seconds': 0.0
+            })
+            stats['chunks'] += 1
+            stats['model_calls'] += model_calls
+            stats['refined'] += refined
+            stats['refine_skipped'] += not refined
+            stats['seconds'] += elapsed
+
+    def get_strategy_stats(self) -> Dict[str, Dict]:
+        """Per-strategy counts and timings, including average seconds per chunk"""
+        with self._strategy_lock:
+            snapshot = {name: dict(stats) for name, stats in self._strategy_stats.items()}
+        for stats in snapshot.values():
+            stats['avg_seconds'] = stats['seconds'] / stats['chunks'] if stats['chunks'] else 0.0
+            stats['avg_model_calls'] = stats['model_calls'] / stats['chunks'] if stats['chunks'] else 0.0
+        return snapshot
+
+    def _translate_text(self, text: str, on_token: Optional[Callable[[str, bool], None]] = None) -> str:
+        """Translate text using the configured strategy, then validate it
+
+        With on_token, the pass that may turn out to be final is streamed
+        through it: the refinement, or the first pass when it may be the
+        only one. The returned text is post-processed and may differ.
+        """
+        start = time.perf_counter()
+        glossary = self.glossary_prompt(text)
+
+        # First pass - basic translation
+        prompt = TRANSLATE_PROMPT_TEMPLATE.format(source=text, glossary=glossary)
+        if on_token and self.strategy != TWO_PASS:
+            initial_translation = self._stream_chat(TRANSLATE_SYSTEM_PROMPT, prompt, on_token, 'model_translate')
+        else:
+            initial_translation = self._chat(TRANSLATE_SYSTEM_PROMPT, prompt, 'model_translate')
+        final_translation = self._finish_translation(initial_translation)
+        
+        refine = self.strategy == TWO_PASS or (
+            self.strategy == ADAPTIVE and not self.is_acceptable_draft(text, final_translation)
+        )
+        if refine:
+            # Second pass - verification and refinement
+            prompt = REFINE_PROMPT_TEMPLATE.format(source=text, draft=initial_translation, glossary=glossary)
+            if on_token:
+                refined_translation = self._stream_chat(REFINE_SYSTEM_PROMPT, prompt, on_token, 'model_refine')
+            else:
+                refined_translation = self._chat(REFINE_SYSTEM_PROMPT, prompt, 'model_refine')
             
             # Apply terminology and post-processing
-            translated = self.apply_terminology(refined_translation)
-            final_translation = self.post_process_translation(translated)
-            
-            if not self.validate_translation(chunk.content, final_translation):
-                raise Exception("Translation validation failed - found untranslated content")
+            final_translation = self._finish_translation(refined_translation)
+        
+        self._record_strategy(time.perf_counter() - start, 2 if refine else 1, refine)
+        
+        if not self.validate_translation(text, final_translation):
+            raise Exception("Translation validation failed - found untranslated content")
+        
+        return final_translation
+
+    def _translate_segments(self, segments: List[str]) -> Optional[List[str]]:
+        """Translate several segments in one numbered request
+
+        Segments whose translation fails validation are retried on their own.
+        Returns None if the reply cannot be split back into segments.
+        """
+        if len(segments) == 1:
+            return [self._translate_text(segments[0])]
+
+        reply = self._chat(
+            TRANSLATE_SYSTEM_PROMPT,
+            SEGMENTS_PROMPT_TEMPLATE.format(
+                segments=format_numbered(segments),
+                glossary=self.glossary_prompt("\n".join(segments))
+            ),
+            'model_batch'
+        )
+        parsed = parse_numbered(reply, len(segments))
+        if parsed is None:
+            logger.warning(f"Could not parse numbered translation of {len(segments)} segments")
+            return None
+
+        translations = []
+        for segment, raw in zip(segments, parsed):
+            translation = self._finish_translation(raw)
+            if not self.validate_translation(segment, translation):
+                logger.debug("Segment failed validation, retrying it on its own")
+                translation = self._translate_text(segment)
+            translations.append(translation)
+        return translations
+
+    def _claim_sentences(self, keys: List[str]) -> tuple:
+        """Split sentence keys into ones this thread must translate and ones already in flight"""
+        claimed, waiting = {}, {}
+        with self._sentence_lock:
+            for key in keys:
+                future = self._inflight_sentences.get(key)
+                if future is None:
+                    future = self._inflight_sentences[key] = Future()
+                    claimed[key] = future
+                else:
+                    waiting[key] = future
+        return claimed, waiting
+
+    def _release_sentences(self, claimed: Dict[str, Future], results: Dict[str, str]):
+        """Publish translated sentences to any threads waiting on them"""
+        with self._sentence_lock:
+            for key in claimed:
+                self._inflight_sentences.pop(key, None)
+        for key, future in claimed.items():
+            future.set_result(results.get(key))
+
+    def _translate_by_sentences(self, chunk: TextChunk) -> Optional[str]:
+        """Translate a chunk sentence by sentence, reusing sentences translated before
+
+        Returns None when the chunk should be translated as a whole instead,
+        e.g. it is a single sentence or the sentence replies could not be used.
+        """
+        sentences = [
+            sentence.strip()
+            for paragraph in chunk.content.split('\n')
+            for sentence in split_sentences(paragraph)
+            if sentence.strip()
+        ]
+        if len(sentences) < 2:
+            return None
+
+        hashes = [self._generate_chunk_hash(sentence) for sentence in sentences]
+        keys = [self._cache_key(h) for h in hashes]
+        known = self.cache.get_many(keys)
+        missing = {key: (h, sentence) for key, h, sentence in zip(keys, hashes, sentences) if key not in known}
+
+        results = {}
+        claimed = {}
+        if missing:
+            claimed, waiting = self._claim_sentences(list(missing))
+            try:
+                if claimed:
+                    texts = [missing[key][1] for key in claimed]
+                    translations = self._translate_segments(texts)
+                    if translations is not None:
+                        results = dict(zip(claimed, translations))
+                        self.cache.put_many([
+                            (key, missing[key][0], self.cache_version, missing[key][1], results[key], "sentence")
+                            for key in claimed
+                        ])
+            finally:
+                self._release_sentences(claimed, results)
+
+            # Sentences another chunk was already translating
+            for key, future in waiting.items():
+                results[key] = future.result()
+
+            if not all(results.get(key) for key in missing):
+                with self._sentence_lock:
+                    self.sentence_stats['fallbacks'] += 1
+                return None
+
+        with self._sentence_lock:
+            self.sentence_stats['reused'] += len(sentences) - len(claimed)
+            self.sentence_stats['translated'] += len(claimed)
+        logger.debug(f"Chunk {chunk.id}: reused {len(sentences) - len(claimed)} of {len(sentences)} sentences")
+
+        known.update(results)
+        return ' '.join(known[key] for key in keys)
+
+    def translate_chunk(self, chunk: TextChunk, context: Optional[Dict] = None, use_cache: bool = True,
+                        on_token: Optional[Callable[[str, bool], None]] = None) -> str:
+        """Enhanced translation with better error handling and validation
+
+        With use_cache=False the chunk-level cache is neither read nor
+        written, so callers can batch lookups and writes themselves.
+        on_token(piece, restart) receives the final pass as the model
+        streams it (see _translate_text); sentence-memory translations are
+        not streamed.
+        """
+        try:
+            if use_cache:
+                cached = self.get_cached_translation(chunk)
+                if cached:
+                    return cached
+
+            final_translation = None
+            if self.sentence_memory:
+                final_translation = self._translate_by_sentences(chunk)
+            if final_translation is None:
+                final_translation = self._translate_text(chunk.content, on_token=on_token)
             
-            self.cache_translation(chunk, final_translation)
+            if use_cache:
+                self.cache_translation(chunk, final_translation)
             
             return final_translation
             
@@ -248,7 +695,175 @@ Improved translation:"""
             logger.error(f"Translation error for chunk {chunk.id}: {str(e)}")
             raise Exception(f"Translation failed: {str(e)}")
 
-    def translate_chunks(self, chunks: List[TextChunk], progress_callback=None) -> List[TextChunk]:
+    def _translate_with_fallback(self, chunk: TextChunk,
+                                 on_token: Optional[Callable[[TextChunk, str, bool], None]] = None) -> TextChunk:
+        """Translate a single uncached chunk, recording failures on the chunk instead of raising"""
+        try:
+            if self.rate_limiter:
+                self.rate_limiter.acquire()
+            chunk_on_token = (lambda piece, restart: on_token(chunk, piece, restart)) if on_token else None
+            chunk.translation = self.translate_chunk(chunk, use_cache=False, on_token=chunk_on_token)
+            chunk.is_translated = True
+        except Exception as e:
+            logger.error(f"Failed to translate chunk {chunk.id}: {str(e)}")
+            chunk.translation = f"[Translation Error: {str(e)}]"
+        return chunk
+
+    def _translate_batch(self, chunks: List[TextChunk],
+                         on_token: Optional[Callable[[TextChunk, str, bool], None]] = None) -> List[TextChunk]:
+        """Translate several uncached chunks in one numbered request
+
+        Falls back to translating each chunk on its own if the request fails
+        or its reply cannot be split back into one translation per chunk.
+        Only single-chunk requests and fallbacks stream tokens to on_token.
+        """
+        if len(chunks) == 1:
+            return [self._translate_with_fallback(chunks[0], on_token)]
+
+        translations = None
+        try:
+            if self.rate_limiter:
+                self.rate_limiter.acquire()
+            translations = self._translate_segments([chunk.content for chunk in chunks])
+        except Exception as e:
+            logger.warning(f"Batched translation of {len(chunks)} chunks failed: {str(e)}")
+
+        with self._strategy_lock:
+            self.batch_stats['batches'] += 1
+            self.batch_stats['batched_chunks'] += len(chunks)
+            self.batch_stats['fallbacks'] += translations is None
+
+        if translations is None:
+            logger.debug(f"Translating chunks {[chunk.id for chunk in chunks]} individually")
+            return [self._translate_with_fallback(chunk, on_token) for chunk in chunks]
+
+        for chunk, translation in zip(chunks, translations):
+            chunk.translation = translation
+            chunk.is_translated = True
+        return chunks
+
+    def _iter_cache_batches(self, chunks: Iterable[TextChunk], batch_size: int) -> Iterator[tuple]:
+        """Group non-empty chunks into batches and resolve each batch against the cache in one query
+
+        Yields (chunk, cached_translation_or_None) pairs in input order.
+        """
+        batch = []
+
+        def resolve(batch):
+            cached = self.get_cached_translations(batch)
+            logger.debug(f"Cache lookup for {len(batch)} chunks: {len(cached)} hits")
+            return [(chunk, cached.get(chunk.id)) for chunk in batch]
+
+        for chunk in chunks:
+            if not chunk.content.strip():
+                logger.warning(f"Skipping empty chunk {chunk.id}")
+                continue
+            batch.append(chunk)
+            if len(batch) >= batch_size:
+                yield from resolve(batch)
+                batch = []
+        if batch:
+            yield from resolve(batch)
+
+    def iter_translate_chunks(self, chunks: Iterable[TextChunk], max_workers: Optional[int] = None,
+                              cancel_check: Optional[Callable[[], bool]] = None,
+                              on_token: Optional[Callable[[TextChunk, str, bool], None]] = None) -> Iterator[TextChunk]:
+        """Translate chunks concurrently, yielding each chunk as soon as it finishes
+
+        Chunks are pulled from the iterable lazily, so at most max_workers
+        requests are in flight at any time. Results arrive in completion order.
+        Cache lookups are batched (the whole document at once when a list is
+        passed) and new translations are written back in batched transactions.
+        If cancel_check returns True, no further chunks are started and
+        TranslationCancelled is raised once the in-flight ones have finished.
+        on_token(chunk, piece, restart) is called from the worker threads
+        with the model's output for each chunk as it streams in; the yielded
+        chunk carries the final, post-processed translation.
+        """
+        max_workers = max_workers or self.max_workers
+        lookup_batch = len(chunks) if isinstance(chunks, (list, tuple)) else max_workers
+        pending = set()
+        # Chunks behind each pending future, for the queue depth gauge
+        queued = {}
+        to_cache = []
+        chunk_iter = self._iter_cache_batches(chunks, max(1, lookup_batch))
+        exhausted = cancelled = False
+        batch, batch_size = [], 0
+        translate_batch = in_context(self._translate_batch)
+
+        def submit(batch):
+            future = executor.submit(translate_batch, batch, on_token)
+            pending.add(future)
+            queued[future] = len(batch)
+            METRICS.add_gauge('chunk_queue_depth', len(batch),
+                              help='Chunks submitted to the model and not finished yet')
+
+        try:
+            with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="translate") as executor:
+                while True:
+                    if cancel_check and not exhausted and cancel_check():
+                        logger.info("Translation cancelled, waiting for in-flight chunks")
+                        exhausted = cancelled = True
+                        for future in pending:
+                            future.cancel()
+
+                    while not exhausted and len(pending) < max_workers:
+                        chunk, cached = next(chunk_iter, (None, None))
+                        if chunk is None:
+                            exhausted = True
+                            break
+                        if cached:
+                            chunk.translation = cached
+                            chunk.is_translated = True
+                            METRICS.inc('chunks_total', help='Chunks finished, by outcome', outcome='cached')
+                            yield chunk
+                            continue
+                        if not self.batch_tokens:
+                            submit([chunk])
+                            continue
+
+                        tokens = self.tokenizer.count(chunk.content)
+                        if batch and (batch_size + tokens > self.batch_tokens or len(batch) >= MAX_BATCH_CHUNKS):
+                            submit(batch)
+                            batch, batch_size = [], 0
+                        if tokens >= self.batch_tokens:
+                            submit([chunk])
+                        else:
+                            batch.append(chunk)
+                            batch_size += tokens
+
+                    if batch and exhausted and not cancelled:
+                        submit(batch)
+                        batch, batch_size = [], 0
+
+                    if not pending:
+                        break
+
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        METRICS.add_gauge('chunk_queue_depth', -queued.pop(future))
+                        if future.cancelled():
+                            continue
+                        for chunk in future.result():
+                            METRICS.inc('chunks_total', help='Chunks finished, by outcome',
+                                        outcome='translated' if chunk.is_translated else 'failed')
+                            if chunk.is_translated:
+                                to_cache.append((chunk, chunk.translation))
+                                if len(to_cache) >= self.cache_write_batch:
+                                    self.cache_translations(to_cache)
+                                    to_cache = []
+                            yield chunk
+        finally:
+            # Futures still counted if the caller stopped iterating early
+            METRICS.add_gauge('chunk_queue_depth', -sum(queued.values()))
+            self.cache_translations(to_cache)
+
+        if cancelled:
+            raise TranslationCancelled("Translation was cancelled")
+
+    def translate_chunks(self, chunks: List[TextChunk], progress_callback=None,
+                         max_workers: Optional[int] = None,
+                         cancel_check: Optional[Callable[[], bool]] = None) -> List[TextChunk]:
         """Translate all chunks with progress tracking and error handling"""
         if not chunks:
             return []
@@ -256,35 +871,63 @@ Improved translation:"""
         total_chunks = len(chunks)
         translated_chunks = []
         
-        for i, chunk in enumerate(chunks):
-            try:
-                if not chunk.content.strip():
-                    logger.warning(f"Skipping empty chunk {chunk.id}")
-                    continue
-                    
-                translation = self.translate_chunk(chunk)
-                chunk.translation = translation
-                chunk.is_translated = True
-                translated_chunks.append(chunk)
-                
-                if progress_callback:
-                    progress = (i + 1) / total_chunks * 100
-                    progress_callback(progress)
-                
-                time.sleep(0.5)  # Rate limiting
-                
-            except Exception as e:
-                logger.error(f"Failed to translate chunk {chunk.id}: {str(e)}")
-                chunk.translation = f"[Translation Error: {str(e)}]"
-                translated_chunks.append(chunk)
-                
+        for chunk in self.iter_translate_chunks(chunks, max_workers=max_workers, cancel_check=cancel_check):
+            translated_chunks.append(chunk)
+            
+            if progress_callback:
+                progress = len(translated_chunks) / total_chunks * 100
+                progress_callback(progress)
+        
+        translated_chunks.sort(key=lambda x: x.sequence_number)
         return translated_chunks
 
-    def reassemble_document(self, chunks: List[TextChunk]) -> dict:
-        """Reassemble translated chunks into complete document"""
+    def metric_samples(self) -> List[Sample]:
+        """Cache, batching, strategy, sentence memory and model throughput figures for the metrics registry"""
+        cache = self.cache.stats()
+        samples = [
+            ('cache_lookups_total', 'counter', 'Cache lookups by result', {'result': 'hit'}, cache['hits']),
+            ('cache_lookups_total', 'counter', 'Cache lookups by result', {'result': 'miss'}, cache['misses']),
+            ('cache_lookups_total', 'counter', 'Cache lookups by result', {'result': 'stale_hit'}, cache['stale_hits']),
+            ('cache_hit_ratio', 'gauge', 'Share of cache lookups that hit', {}, cache['hit_ratio']),
+            ('cache_memory_entries', 'gauge', 'Entries in the in-process cache tier', {},
+             cache.get('memory_entries', 0)),
+        ]
+        with self._strategy_lock:
+            batch_stats = dict(self.batch_stats)
+        samples.extend(
+            ('batch_' + key + '_total', 'counter', f'Batched requests: {key.replace("_", " ")}', {}, value)
+            for key, value in batch_stats.items()
+        )
+        for strategy, stats in self.get_strategy_stats().items():
+            for key, help in STRATEGY_METRICS.items():
+                samples.append(('strategy_' + key + '_total', 'counter', help, {'strategy': strategy}, stats[key]))
+        with self._sentence_lock:
+            sentence_stats = dict(self.sentence_stats)
+        samples.extend(
+            ('sentences_' + key + '_total', 'counter', help, {}, sentence_stats[key])
+            for key, help in SENTENCE_METRICS.items()
+        )
+        # Tokens per second of reply time, i.e. how fast the model generates for one request
+        seconds = METRICS.values('model_reply_seconds_total')
+        for labels, tokens in METRICS.values('model_output_tokens_total').items():
+            if seconds.get(labels):
+                samples.append(('model_tokens_per_second', 'gauge', 'Reply tokens per second of model time',
+                                dict(labels), tokens / seconds[labels]))
+        return samples
+
+    @timed('reassemble_document')
+    def reassemble_document(self, chunks: List[TextChunk], fields: Iterable[str] = RESULT_FIELDS) -> dict:
+        """Reassemble translated chunks into complete document
+
+        Only the RESULT_FIELDS named in fields are built; metadata always is.
+        """
         try:
             if not chunks:
                 raise ValueError("No chunks provided for reassembly")
+            fields = set(fields)
+            unknown = fields.difference(RESULT_FIELDS)
+            if unknown:
+                raise ValueError(f"Unknown result fields: {', '.join(sorted(unknown))}")
             
             # Sort chunks by sequence number
             chunks.sort(key=lambda x: x.sequence_number)
@@ -294,22 +937,22 @@ Improved translation:"""
                 if not chunk.is_translated or not chunk.translation.strip():
                     logger.warning(f"Chunk {chunk.id} has invalid translation")
             
-            original_text = "\n".join(chunk.content for chunk in chunks)
-            translated_text = "\n".join(chunk.translation for chunk in chunks if chunk.is_translated)
-            
             # Final validation
-            if not translated_text.strip():
+            if not any(chunk.is_translated and chunk.translation.strip() for chunk in chunks):
                 raise ValueError("No valid translations in reassembled document")
             
-            return {
-                "original": original_text,
-                "translated": translated_text,
-                "chunks": [asdict(chunk) for chunk in chunks],
-                "metadata": {
-                    "total_chunks": len(chunks),
-                    "successful_translations": sum(1 for c in chunks if c.is_translated)
-                }
+            result = {}
+            if 'original' in fields:
+                result["original"] = "\n".join(chunk.content for chunk in chunks)
+            if 'translated' in fields:
+                result["translated"] = "\n".join(chunk.translation for chunk in chunks if chunk.is_translated)
+            if 'chunks' in fields:
+                result["chunks"] = [asdict(chunk) for chunk in chunks]
+            result["metadata"] = {
+                "total_chunks": len(chunks),
+                "successful_translations": sum(1 for c in chunks if c.is_translated)
             }
+            return result
         except Exception as e:
             logger.error(f"Document reassembly failed: {str(e)}")
             raise Exception(f"Failed to reassemble document: {str(e)}")
\ No newline at end of file
@@ -0,0 +1,250 @@
+# worker.py
+import argparse
+import logging
+import os
+import socket
+import threading
+from typing import Optional, Iterable, Tuple
+from dataclasses import fields
+from text_processor import TextProcessor
+from translation_manager import TranslationManager, TranslationCancelled, RESULT_FIELDS, STRATEGIES, TWO_PASS
+from backends import DEFAULT_MODEL, OllamaBackend, BackendPool, ROUTING_POLICIES, LEAST_OUTSTANDING
+from job_queue import JobQueue
+from checkpoints import CheckpointStore
+from metrics import METRICS, tracing, serve_metrics
+from config import AppConfig, load_config
+from pipeline import translate_document, translate_document_to_file, result_version, ProcessingError
+
+logger = logging.getLogger(__name__)
+
+class JobWorker:
+    """Drains the job queue, running up to `concurrency` documents at a time
+
+    With a results_dir, documents are processed in low-memory mode: chunks
+    stream through translation into the checkpoint store and each result is
+    written to results_dir/<job_id>.json instead of the jobs database.
+    """
+
+    def __init__(self, job_queue: JobQueue, text_processor: TextProcessor,
+                 translation_manager: TranslationManager, concurrency: int = 1,
+                 poll_interval: float = 1.0, stale_after: float = 600,
+                 checkpoints: Optional[CheckpointStore] = None,
+                 result_fields: Iterable[str] = RESULT_FIELDS, results_dir: Optional[str] = None):
+        self.job_queue = job_queue
+        self.text_processor = text_processor
+        self.translation_manager = translation_manager
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.stale_after = stale_after
+        self.checkpoints = checkpoints
+        self.result_fields = tuple(result_fields)
+        self.results_dir = os.path.abspath(results_dir) if results_dir else None
+        if self.results_dir:
+            os.makedirs(self.results_dir, exist_ok=True)
+        self.worker_id = f"{socket.gethostname()}-{os.getpid()}"
+        self._stop = threading.Event()
+
+    def run_job(self, job: dict):
+        """Process one claimed job and record its outcome"""
+        job_id = job['job_id']
+        logger.info(f"Processing job {job_id} ({job['filename']})")
+        version = result_version(self.text_processor, self.translation_manager)
+        try:
+            options = dict(
+                progress_callback=lambda progress: self.job_queue.update_progress(job_id, progress),
+                cancel_check=lambda: self.job_queue.is_cancel_requested(job_id),
+                checkpoints=self.checkpoints,
+                file_hash=job.get('file_hash'),
+                fields=self.result_fields
+            )
+            with tracing(job.get('trace', False)) as trace:
+                if self.results_dir:
+                    result_path = os.path.join(self.results_dir, f"{job_id}.json")
+                    translate_document_to_file(self.text_processor, self.translation_manager,
+                                               job['file_path'], result_path, **options)
+                else:
+                    result = translate_document(self.text_processor, self.translation_manager,
+                                                job['file_path'], **options)
+            if self.results_dir:
+                self.job_queue.complete(job_id, result_path=result_path, result_version=version)
+            else:
+                if trace:
+                    result['trace'] = trace.to_dict()
+                self.job_queue.complete(job_id, result, result_version=version)
+            logger.info(f"Job {job_id} completed")
+        except TranslationCancelled:
+            self.job_queue.mark_cancelled(job_id)
+            logger.info(f"Job {job_id} cancelled")
+        except ProcessingError as e:
+            self.job_queue.fail(job_id, e.error)
+            logger.error(f"Job {job_id} failed: {e.error}")
+        except Exception as e:
+            self.job_queue.fail(job_id, f'Unexpected error: {str(e)}')
+            logger.error(f"Job {job_id} failed unexpectedly: {str(e)}", exc_info=True)
+        finally:
+            try:
+                os.unlink(job['file_path'])
+            except OSError as e:
+                logger.warning(f"Failed to remove upload for job {job_id}: {str(e)}")
+
+    def _loop(self, slot: int):
+        worker_id = f"{self.worker_id}-{slot}"
+        while not self._stop.is_set():
+            try:
+                job = self.job_queue.claim_next(worker_id)
+            except Exception as e:
+                logger.error(f"Failed to claim job: {str(e)}")
+                job = None
+            if job:
+                self.run_job(job)
+            else:
+                self._stop.wait(self.poll_interval)
+
+    def run(self):
+        """Run worker threads until stop() is called or the process is interrupted"""
+        self.job_queue.requeue_stale(self.stale_after)
+        threads = [
+            threading.Thread(target=self._loop, args=(slot,), name=f"job-worker-{slot}", daemon=True)
+            for slot in range(self.concurrency)
+        ]
+        for thread in threads:
+            thread.start()
+        logger.info(f"Worker {self.worker_id} started with concurrency {self.concurrency}")
+
+        try:
+            while not self._stop.is_set():
+                self._stop.wait(self.stale_after / 2)
+                self.job_queue.requeue_stale(self.stale_after)
+        except KeyboardInterrupt:
+            logger.info("Stopping worker, waiting for running jobs to finish")
+            self.stop()
+        for thread in threads:
+            thread.join()
+
+    def stop(self):
+        self._stop.set()
+
+def result_fields(value: str) -> Tuple[str, ...]:
+    """argparse type for a comma-separated subset of RESULT_FIELDS"""
+    fields = tuple(field.strip() for field in value.split(',') if field.strip())
+    unknown = set(fields).difference(RESULT_FIELDS)
+    if unknown:
+        raise argparse.ArgumentTypeError(
+            f"unknown result fields {', '.join(sorted(unknown))} (choose from {', '.join(RESULT_FIELDS)})"
+        )
+    return fields
+
+def add_translation_arguments(parser: argparse.ArgumentParser):
+    """Chunking, model and storage options shared by the worker and the batch CLI
+
+    Options left unset fall back to the web app's settings (see load_settings),
+    so the app and the processes behind it translate the same way.
+    """
+    parser.add_argument('--config', metavar='PATH',
+                        help='JSON settings file, as for the web app (default: $TRANSLATOR_CONFIG)')
+    parser.add_argument('--chunk-workers', type=int,
+                        help='chunks translated in parallel within each document (default: 4)')
+    parser.add_argument('--chunk-tokens', type=int,
+                        help="token budget per chunk (default: the model profile's target)")
+    parser.add_argument('--skip-non-chinese-pages', action='store_true', default=None,
+                        help='drop pages that are not primarily Chinese instead of translating them')
+    parser.add_argument('--batch-tokens', type=int,
+                        help='pack small chunks into one request of up to this many source tokens')
+    parser.add_argument('--strategy', choices=STRATEGIES,
+                        help=f'model calls per chunk: single pass, always refine, or refine weak drafts '
+                             f'(default: {TWO_PASS})')
+    parser.add_argument('--sentence-memory', action='store_true', default=None,
+                        help='reuse sentences translated before and send only new ones to the model')
+    parser.add_argument('--glossary', action='append', metavar='PATH',
+                        help='CSV, TSV or JSON glossary to load (may be repeated)')
+    parser.add_argument('--ollama-host', action='append', metavar='URL',
+                        help='Ollama server URL (default: $OLLAMA_HOST or http://127.0.0.1:11434); '
+                             'repeat to spread requests over several servers')
+    parser.add_argument('--routing', choices=ROUTING_POLICIES,
+                        help=f'how requests are spread over several servers (default: {LEAST_OUTSTANDING})')
+    parser.add_argument('--model', help=f'default: {DEFAULT_MODEL}')
+    parser.add_argument('--request-timeout', type=float,
+                        help='seconds to wait for one model reply (default: 300)')
+    parser.add_argument('--retries', type=int,
+                        help='retries for failed model requests, with jittered backoff (default: 2)')
+    parser.add_argument('--checkpoints-db', default='checkpoints.db',
+                        help="per-document chunk checkpoints; '' disables resuming")
+    parser.add_argument('--translations-db', help='default: translations.db')
+
+def load_settings(parser: argparse.ArgumentParser, args: argparse.Namespace) -> AppConfig:
+    """The web app's settings (defaults, config file, TRANSLATOR_* variables) with the given options on top"""
+    names = {f.name for f in fields(AppConfig)}
+    overrides = {name: value for name, value in vars(args).items() if name in names and value is not None}
+    try:
+        return load_config(args.config, **overrides)
+    except ValueError as e:
+        parser.error(str(e))
+
+def build_translation_manager(settings: AppConfig, concurrency: int = 1) -> TranslationManager:
+    """TranslationManager for the given settings, sized for concurrency documents"""
+    backend_options = {
+        'timeout': settings.request_timeout,
+        'retries': settings.retries,
+        'max_connections': settings.chunk_workers * concurrency,
+    }
+    if len(settings.ollama_host) > 1:
+        backend = BackendPool.from_hosts(settings.ollama_host, model=settings.model,
+                                         routing=settings.routing, backend_options=backend_options)
+    else:
+        host = settings.ollama_host[0] if settings.ollama_host else None
+        backend = OllamaBackend(host, model=settings.model, **backend_options)
+    return TranslationManager(settings.translations_db, max_workers=settings.chunk_workers,
+                              glossary_files=settings.glossary, batch_tokens=settings.batch_tokens,
+                              strategy=settings.strategy, sentence_memory=settings.sentence_memory,
+                              backend=backend)
+
+def main():
+    parser = argparse.ArgumentParser(description="Process queued PDF translation jobs")
+    parser.add_argument('--concurrency', type=int, default=1,
+                        help='number of documents processed at the same time')
+    parser.add_argument('--poll-interval', type=float, default=1.0,
+                        help='seconds to wait between polls when the queue is empty')
+    parser.add_argument('--stale-after', type=float, default=600,
+                        help='seconds without progress before a running job is requeued')
+    parser.add_argument('--jobs-db', help='default: jobs.db')
+    parser.add_argument('--checkpoint-days', type=float, default=30,
+                        help='drop checkpoints not touched for this many days at startup')
+    parser.add_argument('--metrics-port', type=int, default=None,
+                        help='serve Prometheus metrics on this port at /metrics')
+    parser.add_argument('--low-memory', action='store_true',
+                        help='stream chunks through translation and write results to --results-dir')
+    parser.add_argument('--results-dir', default='results',
+                        help='where --low-memory writes job results')
+    parser.add_argument('--result-fields', type=result_fields, default=RESULT_FIELDS,
+                        help=f"comma-separated parts of each result to keep besides metadata "
+                             f"(default: {','.join(RESULT_FIELDS)})")
+    add_translation_arguments(parser)
+    args = parser.parse_args()
+    settings = load_settings(parser, args)
+
+    logging.basicConfig(level=settings.log_level.upper(), format='%(levelname)s:%(name)s:%(message)s')
+
+    translation_manager = build_translation_manager(settings, args.concurrency)
+    if args.metrics_port is not None:
+        METRICS.register_collector(translation_manager.metric_samples)
+        serve_metrics(args.metrics_port)
+    checkpoints = None
+    if args.checkpoints_db:
+        checkpoints = CheckpointStore(args.checkpoints_db)
+        checkpoints.purge(args.checkpoint_days)
+    worker = JobWorker(
+        JobQueue(settings.jobs_db),
+        TextProcessor(model=translation_manager.model, chunk_tokens=settings.chunk_tokens,
+                      skip_non_chinese_pages=settings.skip_non_chinese_pages),
+        translation_manager,
+        concurrency=args.concurrency,
+        poll_interval=args.poll_interval,
+        stale_after=args.stale_after,
+        checkpoints=checkpoints,
+        result_fields=args.result_fields,
+        results_dir=args.results_dir if args.low_memory else None
+    )
+    worker.run()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,12 @@
+# wsgi.py
+"""Production entry point for WSGI servers
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+    uvicorn --interface wsgi --workers 2 wsgi:app
+
+Settings come from TRANSLATOR_* environment variables or the JSON file
+named by TRANSLATOR_CONFIG (see config.py).
+"""
+from app import create_app
+
+app = create_app()